@@ -0,0 +1,312 @@
+# batch.py
+# Пакетная печать: много заказов из CSV / JSONL -> КП + Смета для каждого.
+# Например, таблица лидов от офиса. Заказы - те же dict, что принимают generate_pdf
+# и generate_strict_estimate (client_name, address, product_id, soil, pipe_length, ...).
+#
+#   python batch.py leads.csv -o out/            -> out/0001_Иванов_kp.pdf, ...
+#   python batch.py leads.jsonl -o out.zip       -> всё в один zip
+#   python batch.py leads.csv -o out/ --docs kp --workers 4 --report report.json
+#
+# Заказы раздаются пулу процессов пачками (chunksize), готовые PDF пишутся по мере прихода,
+# в конце - сводка: скорость, объем, ошибки по каждому заказу.
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import metrics
+import renderer
+
+DOC_KINDS = ("kp", "smeta")
+
+# Сколько пачек на воркер: меньше - меньше накладных расходов на pickle/IPC,
+# больше - ровнее нагрузка в конце (заказы с 200 позициями рисуются дольше)
+CHUNKS_PER_WORKER = 4
+
+# Колонки CSV, которые надо привести к числам / bool (остальное - строки как есть)
+NUMBER_FIELDS = ("pipe_length", "pipe_depth")
+BOOL_FIELDS = ("diamond_drilling",)
+TRUE_WORDS = ("1", "true", "yes", "y", "да", "д", "+")
+
+
+class OrderTask(NamedTuple):
+    num: int  # Номер заказа во входном файле (с 1)
+    source: str  # Где он во входном файле ("строка 5") - для отчета
+    data: dict  # Заказ или None, если строку не удалось разобрать
+    error: str  # Ошибка разбора
+
+
+class OrderResult(NamedTuple):
+    num: int
+    source: str
+    name: str  # Префикс файлов: 0001_Иванов
+    docs: dict  # kind -> bytes PDF
+    error: str
+    seconds: float  # Время рендера в воркере
+
+
+# ================= ЧТЕНИЕ ЗАКАЗОВ =================
+
+def _cell_value(field, value):
+    value = value.strip()
+    if field in NUMBER_FIELDS:
+        try:
+            return float(value.replace(',', '.'))
+        except ValueError:
+            raise ValueError(f"{field}: не число '{value}'")
+    if field in BOOL_FIELDS:
+        return value.lower() in TRUE_WORDS
+    if field == "custom_items":
+        items = json.loads(value)
+        if not isinstance(items, list):
+            raise ValueError("custom_items: ожидается JSON-список")
+        return items
+    return value
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        # Excel в русской локали сохраняет CSV через ";"
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = [name.strip() for name in next(reader, [])]
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            line = f"строка {reader.line_num}"
+            try:
+                # Пустые ячейки пропускаем - генераторы подставят значения по умолчанию
+                data = {k: _cell_value(k, v) for k, v in zip(header, row) if k and v.strip()}
+            except ValueError as e:
+                yield line, None, str(e)
+                continue
+            yield line, data, ""
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8-sig") as f:
+        for n, raw in enumerate(f, 1):
+            if not raw.strip():
+                continue
+            line = f"строка {n}"
+            try:
+                data = json.loads(raw)
+            except ValueError as e:
+                yield line, None, f"не JSON: {e}"
+                continue
+            if not isinstance(data, dict):
+                yield line, None, "ожидается JSON-объект заказа"
+                continue
+            yield line, data, ""
+
+
+def read_orders(path):
+    """Файл -> [OrderTask]. Формат по расширению: .csv / .jsonl (.json - тоже построчно)"""
+    ext = os.path.splitext(path)[1].lower()
+    reader = _read_csv if ext in (".csv", ".tsv", ".txt") else _read_jsonl
+    return [OrderTask(num, source, data, error)
+            for num, (source, data, error) in enumerate(reader(path), 1)]
+
+
+# ================= ВНУТРИ ВОРКЕРА =================
+
+def _file_prefix(num, data):
+    client = re.sub(r"[^\w-]+", "_", str(data.get('client_name') or "")).strip("_")[:40]
+    return f"{num:04d}_{client}" if client else f"{num:04d}"
+
+
+def render_task(task, kinds=DOC_KINDS):
+    """Один заказ -> OrderResult. Ошибку возвращаем, а не поднимаем: один битый заказ не роняет пачку"""
+    if task.data is None:
+        return OrderResult(task.num, task.source, f"{task.num:04d}", {}, task.error, 0.0)
+
+    from pricing import quote_order
+    from pdf_generator import generate_pdf
+    from estimate_generator import generate_strict_estimate
+
+    name = _file_prefix(task.num, task.data)
+    started = time.perf_counter()
+    try:
+        # Цены считаем один раз на заказ - оба документа рисуют один расчет
+        quote = quote_order(task.data)
+        docs = {}
+        if "kp" in kinds:
+            docs["kp"] = generate_pdf(task.data, None, quote)
+        if "smeta" in kinds:
+            docs["smeta"] = generate_strict_estimate(task.data, None, quote)
+        missing = [kind for kind, pdf in docs.items() if not pdf]
+        error = f"не сгенерирован: {', '.join(missing)}" if missing else ""
+    except Exception as e:
+        docs, error = {}, f"{type(e).__name__}: {e}"
+    # Воркеры renderer копят замеры для бота (metrics) - здесь они не нужны, не даем им расти
+    metrics.drain()
+    return OrderResult(task.num, task.source, name, docs, error, time.perf_counter() - started)
+
+
+def _render_chunk_item(args):
+    # Executor.map передает один аргумент - распаковываем (заказ, какие документы)
+    return render_task(*args)
+
+
+# ================= ЗАПИСЬ РЕЗУЛЬТАТОВ =================
+
+class DirWriter:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, filename, pdf):
+        tmp = os.path.join(self.path, filename + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp, os.path.join(self.path, filename))
+
+    def close(self):
+        pass
+
+
+class ZipWriter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # PDF уже сжаты внутри - повторно не жмем, только складываем
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+
+    def write(self, filename, pdf):
+        self._zip.writestr(filename, pdf)
+
+    def close(self):
+        self._zip.close()
+
+
+def open_writer(path):
+    return ZipWriter(path) if path.lower().endswith(".zip") else DirWriter(path)
+
+
+# ================= ЗАПУСК =================
+
+def chunk_size(total, workers):
+    """Пачка на процесс: CHUNKS_PER_WORKER пачек на воркер, но не меньше 1 заказа"""
+    return max(1, math.ceil(total / (workers * CHUNKS_PER_WORKER)))
+
+
+def run(tasks, writer, workers=renderer.RENDER_WORKERS, kinds=DOC_KINDS, chunksize=None):
+    """
+    Рендерит заказы в пуле и пишет PDF по мере готовности (в порядке входного файла).
+    Возвращает (список OrderResult без bytes, сводка dict).
+    """
+    workers = max(1, min(workers, len(tasks) or 1))
+    chunksize = chunksize or chunk_size(len(tasks), workers)
+    print(f"📦 Заказов: {len(tasks)}, воркеров: {workers}, пачка: {chunksize}")
+
+    results = []
+    written = 0
+    size = 0
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=renderer._mp_context(),
+                                 initializer=renderer._init_worker) as pool:
+            for result in pool.map(_render_chunk_item, [(task, kinds) for task in tasks], chunksize=chunksize):
+                for kind, pdf in result.docs.items():
+                    if pdf:
+                        writer.write(f"{result.name}_{kind}.pdf", pdf)
+                        written += 1
+                        size += len(pdf)
+                status = "✅" if not result.error else f"❌ {result.error}"
+                print(f"[{result.num}/{len(tasks)}] {result.name} ({result.seconds:.2f} с) {status}")
+                # bytes уже на диске - в памяти держим только итоги
+                results.append(result._replace(docs={kind: len(pdf or b"") for kind, pdf in result.docs.items()}))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for r in results if not r.error)
+    render_times = sorted(r.seconds for r in results if not r.error)
+    summary = {
+        "orders": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "documents": written,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "orders_per_sec": round(len(results) / elapsed, 2) if elapsed else None,
+        "docs_per_sec": round(written / elapsed, 2) if elapsed else None,
+        "render_avg": round(sum(render_times) / len(render_times), 3) if render_times else None,
+        "render_max": round(render_times[-1], 3) if render_times else None,
+        "workers": workers,
+        "chunksize": chunksize,
+    }
+    return results, summary
+
+
+def print_report(results, summary):
+    print("\n===== ИТОГО =====")
+    print(f"Заказов: {summary['orders']} (успешно {summary['ok']}, ошибок {summary['failed']})")
+    print(f"Документов: {summary['documents']}, {summary['bytes'] / 1024 / 1024:.1f} МБ "
+          f"за {summary['seconds']:.1f} с")
+    if summary['orders_per_sec'] is not None:
+        print(f"Скорость: {summary['orders_per_sec']} заказов/с, {summary['docs_per_sec']} документов/с")
+    if summary['render_avg'] is not None:
+        print(f"Рендер заказа в воркере: в среднем {summary['render_avg']} с, максимум {summary['render_max']} с")
+    failed = [r for r in results if r.error]
+    if failed:
+        print("\n--- Ошибки ---")
+        for r in failed:
+            print(f"#{r.num} ({r.source}): {r.error}")
+
+
+def write_report(path, results, summary):
+    report = {
+        "summary": summary,
+        "orders": [{"num": r.num, "source": r.source, "name": r.name, "ok": not r.error,
+                    "error": r.error, "seconds": round(r.seconds, 3), "bytes": r.docs}
+                   for r in results],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная печать КП и смет из CSV / JSONL")
+    parser.add_argument("orders", help="Файл заказов: .csv (заголовок = поля заказа) или .jsonl")
+    parser.add_argument("-o", "--output", required=True, help="Папка или файл .zip для PDF")
+    parser.add_argument("--docs", default=",".join(DOC_KINDS), help="Какие документы: kp,smeta")
+    parser.add_argument("--workers", type=int, default=renderer.RENDER_WORKERS, help="Процессов в пуле")
+    parser.add_argument("--chunksize", type=int, default=None, help="Заказов в пачке (по умолчанию - авто)")
+    parser.add_argument("--report", default=None, help="Сохранить отчет по каждому заказу в JSON")
+    args = parser.parse_args(argv)
+
+    kinds = tuple(kind.strip() for kind in args.docs.split(",") if kind.strip())
+    unknown = [kind for kind in kinds if kind not in DOC_KINDS]
+    if unknown or not kinds:
+        parser.error(f"--docs: неизвестные документы {unknown}, доступны {', '.join(DOC_KINDS)}")
+
+    try:
+        tasks = read_orders(args.orders)
+    except OSError as e:
+        parser.error(f"не удалось прочитать {args.orders}: {e}")
+    if not tasks:
+        print("Во входном файле нет заказов")
+        return 0
+
+    results, summary = run(tasks, open_writer(args.output), args.workers, kinds, args.chunksize)
+    print_report(results, summary)
+    if args.report:
+        write_report(args.report, results, summary)
+        print(f"Отчет: {args.report}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# bench.py
+# Микро-бенчмарки горячих путей: печать КП и сметы, ручной разбор заказа,
+# вытаскивание JSON из ответа модели, текст заказа для чата.
+# Фикстуры фиксированные (от пустого заказа до 200 доп. позиций), результаты - в JSON,
+# сравнение с сохраненным эталоном (bench_baseline.json) ловит регрессии до деплоя.
+#
+#   python bench.py                      -> прогон + сравнение с эталоном, bench_results.json
+#   python bench.py --filter pdf         -> только кейсы, где в имени есть "pdf"
+#   python bench.py --quick              -> меньше повторов (проверить, что всё работает)
+#   python bench.py --save-baseline      -> записать результат как новый эталон
+#
+# Код возврата 1 - есть регрессия больше порога (--threshold, по умолчанию +15% к лучшему замеру).
+# Сравниваем минимумы: на общем сервере медиана и среднее гуляют от соседей, минимум - нет.
+# Эталон снят на конкретной машине: после смены сервера пересохрани его там, где сравниваешь.
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# main.py создает Bot при импорте - для бенчмарка хватит токена-заглушки правильного вида
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:bench")
+
+BASELINE_PATH = "bench_baseline.json"
+RESULTS_PATH = "bench_results.json"
+
+# Лучший замер вырос больше чем в (1 + THRESHOLD) раз -> регрессия
+COMPARE_BY = "min"
+THRESHOLD = 0.15
+# Один замер длится не меньше MIN_SAMPLE сек (быстрые функции крутим в цикле)
+MIN_SAMPLE = 0.02
+SAMPLES = 15
+QUICK_SAMPLES = 3
+
+SERVICE_KEYS = ("cable_laying", "socket_install", "heating_cable", "hole_in_ring",
+                "manual_sand_transport", "soil_loading", "diamond_drilling_60")
+
+
+# ================= ФИКСТУРЫ =================
+
+def make_order(n_items, product_id="tver_08"):
+    """Заказ с n_items доп. позиций: половина по прайсу (service_key), половина своих (name + price)"""
+    items = []
+    for i in range(n_items):
+        if i % 2 == 0:
+            items.append({"service_key": SERVICE_KEYS[i % len(SERVICE_KEYS)], "qty": 1 + i % 7})
+        else:
+            items.append({"name": f"Дополнительная работа №{i}: демонтаж старого септика и вывоз мусора",
+                          "price": 1500 + 10 * i, "qty": 1 + i % 3})
+    return {
+        "client_name": "Иванов Иван Иванович",
+        "address": "Волгоградская обл., СНТ Дружба, ул. Садовая 15",
+        "product_id": product_id,
+        "soil": "clay",
+        "pipe_length": 12,
+        "pipe_depth": 1.4,
+        "diamond_drilling": True,
+        "custom_items": items,
+    }
+
+
+ORDERS = {
+    "small": make_order(0),
+    "medium": make_order(20, "tver_11"),
+    "large": make_order(200),
+}
+
+MESSAGES = {
+    "short": "Иванов, 0.8, глина, труба 7м, бурение",
+    "long": (
+        "Клиент: Петров, адрес: снт Рассвет, участок 12. Нужна большая станция, тверь 11, "
+        "грунт суглинок, местами глина. Труба от дома 14 метров, глубина около 1.5 м, "
+        "фундамент бетонный - нужно алмазное бурение. Кабель протянуть 20 метров, розетку поставить, "
+        "греющий кабель на трубу метров 10. Песок подвозить вручную, кубов 3. "
+    ) * 4,
+}
+
+
+def noisy_answer(order, noise_lines=200):
+    """Длинный 'болтливый' ответ модели: рассуждения, markdown, JSON в блоке кода, хвост с комментарием"""
+    talk = "\n".join(f"- Шаг {i}: проверяю поле **pipe_length**, цена {i * 100} руб. (по прайсу)" for i in range(noise_lines))
+    body = json.dumps(order, ensure_ascii=False, indent=2)
+    return f"Хорошо, разберу заказ.\n{talk}\n```json\n{body}\n```\nЕсли нужно что-то поменять - напишите."
+
+
+def make_appendix(path, pages=8):
+    """Заглушка инструкций на случай, если assets/appendix.pdf нет в этой копии репозитория"""
+    from fpdf import FPDF
+    from font_cache import add_fonts
+    pdf = FPDF()
+    add_fonts(pdf, ('',))
+    for n in range(pages):
+        pdf.add_page()
+        pdf.set_font("MyFont", '', 10)
+        pdf.multi_cell(0, 5, f"Инструкция по эксплуатации, страница {n + 1}. " * 60)
+    pdf.output(path)
+    return path
+
+
+# ================= КЕЙСЫ =================
+
+def build_cases(tmp_dir):
+    """[(имя, функция без аргументов)] + заметки о том, на чем меряли"""
+    from estimate_generator import generate_strict_estimate
+    from pdf_generator import generate_pdf
+    from pdf_merge import APPENDIX_PATH, merge_with_appendix
+    from pricing import quote_order
+    from main import extract_json_from_response, format_order_text, parse_order_manually
+
+    # main.py включает INFO: лог fontTools и "ручной режим" на каждый вызов мерили бы запись в консоль
+    logging.disable(logging.INFO)
+
+    notes = {}
+    if os.path.exists(APPENDIX_PATH):
+        notes["appendix"] = APPENDIX_PATH
+
+        def estimate_merged(order):
+            return generate_strict_estimate(order, None)
+    else:
+        # Склейка = смета без инструкций + merge_with_appendix (ровно то, что делает appendix=True)
+        fixture = make_appendix(os.path.join(tmp_dir, "appendix.pdf"))
+        notes["appendix"] = "fixture (8 стр.)"
+
+        def estimate_merged(order):
+            return merge_with_appendix(generate_strict_estimate(order, None, appendix=False), fixture)
+
+    cases = []
+    for size, order in ORDERS.items():
+        cases += [
+            (f"generate_pdf[{size}]", lambda o=order: generate_pdf(o, None)),
+            (f"generate_strict_estimate[{size}]", lambda o=order: generate_strict_estimate(o, None, appendix=False)),
+            (f"generate_strict_estimate+merge[{size}]", lambda o=order: estimate_merged(o)),
+            (f"format_order_text[{size}]", lambda o=order: format_order_text(o)),
+        ]
+    # Расчет цен отдельно: его делят оба документа
+    cases.append(("quote_order[large]", lambda: quote_order(ORDERS["large"])))
+    for name, text in MESSAGES.items():
+        cases.append((f"parse_order_manually[{name}]", lambda t=text: parse_order_manually(t)))
+    for size in ("small", "large"):
+        answer = noisy_answer(ORDERS[size])
+        # Мерить имеет смысл только рабочий путь: JSON должен честно вытаскиваться
+        if extract_json_from_response(answer) != ORDERS[size]:
+            raise RuntimeError(f"extract_json_from_response не разобрал фикстуру noisy-{size}")
+        cases.append((f"extract_json_from_response[noisy-{size}]", lambda a=answer: extract_json_from_response(a)))
+    return cases, notes
+
+
+# ================= ЗАМЕРЫ =================
+
+def _loops_for(fn):
+    """Сколько вызовов в одном замере, чтобы он длился хотя бы MIN_SAMPLE (как timeit.autorange)"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - started >= MIN_SAMPLE:
+            return loops
+        loops *= 2
+
+
+def measure(fn, samples=SAMPLES):
+    """Время одного вызова (сек): медиана, минимум, среднее, разброс"""
+    fn()  # прогрев: кэши шрифтов, шаблоны КП, картинки
+    loops = _loops_for(fn)
+    times = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - started) / loops)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "samples": samples,
+        "loops": loops,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(name_filter=None, samples=SAMPLES):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases, notes = build_cases(tmp_dir)
+        if name_filter:
+            cases = [(name, fn) for name, fn in cases if name_filter in name]
+        results = {}
+        for name, fn in cases:
+            results[name] = measure(fn, samples)
+            print(f"{name:<45} мин {_fmt(results[name]['min'])}  медиана {_fmt(results[name]['median'])}")
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "machine": machine_info(),
+        "notes": notes,
+        "results": results,
+    }
+
+
+# ================= СРАВНЕНИЕ =================
+
+def _fmt(seconds):
+    if seconds >= 1:
+        return f"{seconds:8.3f} s "
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:8.3f} ms"
+    return f"{seconds * 1e6:8.3f} µs"
+
+
+def compare(current, baseline, threshold=THRESHOLD):
+    """Лучшие замеры текущего прогона против эталона -> {имя: {..., "ratio", "status"}}"""
+    report = {}
+    for name, res in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            report[name] = {"current": res[COMPARE_BY], "baseline": None, "ratio": None, "status": "new"}
+            continue
+        ratio = res[COMPARE_BY] / base[COMPARE_BY] if base[COMPARE_BY] else None
+        if ratio is None:
+            status = "ok"
+        elif ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        report[name] = {"current": res[COMPARE_BY], "baseline": base[COMPARE_BY], "ratio": ratio, "status": status}
+    return report
+
+
+def print_comparison(report, baseline):
+    print(f"\n===== СРАВНЕНИЕ С ЭТАЛОНОМ ({baseline.get('commit') or '?'}, {baseline.get('created', '?')}) =====")
+    marks = {"regression": "❌", "faster": "🚀", "ok": "  ", "new": "🆕"}
+    for name, row in report.items():
+        base = _fmt(row["baseline"]) if row["baseline"] is not None else "-".rjust(11)
+        ratio = f"x{row['ratio']:.2f}" if row["ratio"] is not None else ""
+        print(f"{marks[row['status']]} {name:<45} {base} -> {_fmt(row['current'])} {ratio}")
+
+
+def load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки горячих путей")
+    parser.add_argument("--filter", default=None, help="Только кейсы, в имени которых есть подстрока")
+    parser.add_argument("--quick", action="store_true", help=f"{QUICK_SAMPLES} замера вместо {SAMPLES}")
+    parser.add_argument("--output", default=RESULTS_PATH, help="Куда записать результаты (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Эталон для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результат как эталон")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Допустимый рост лучшего замера (0.15 = +15%%)")
+    args = parser.parse_args(argv)
+
+    current = run(args.filter, QUICK_SAMPLES if args.quick else SAMPLES)
+
+    baseline = load_json(args.baseline)
+    if baseline is not None:
+        current["comparison"] = compare(current, baseline, args.threshold)
+        print_comparison(current["comparison"], baseline)
+        if baseline.get("machine") != current["machine"]:
+            print("⚠️ Эталон снят на другой машине / версии Python - сравнение ориентировочное")
+    else:
+        print(f"\nЭталона {args.baseline} нет - сохрани его: python bench.py --save-baseline")
+
+    save_json(args.output, current)
+    print(f"Результаты: {args.output}")
+    if args.save_baseline:
+        baseline_data = {k: v for k, v in current.items() if k != "comparison"}
+        if args.filter and baseline is not None:
+            # Частичный прогон обновляет только свои кейсы, остальные эталоны остаются
+            baseline_data["results"] = {**baseline.get("results", {}), **current["results"]}
+        save_json(args.baseline, baseline_data)
+        print(f"Эталон обновлен: {args.baseline}")
+        return 0
+
+    regressions = [name for name, row in current.get("comparison", {}).items() if row["status"] == "regression"]
+    if regressions:
+        print(f"\n❌ Регрессии (> +{args.threshold:.0%}): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# catalog.py
+# Каталог товаров и прайс услуг: данные - в assets/catalog.json, не в коде.
+# Загрузка -> проверка -> неизменяемый снимок Catalog с готовыми индексами
+# (Decimal-цены, тарифы трубы по грунту, фрагмент промпта для модели) и версией = отпечатком содержимого.
+#
+# Горячая замена: start_watcher() раз в CATALOG_RELOAD_INTERVAL сек смотрит mtime файла.
+# Файл поменялся -> новый снимок собирается целиком и подменяет старый одним присваиванием.
+# Кривой файл (ошибка JSON, нет цены) -> остается прежний снимок, в логе ошибка.
+# Кто считает заказ, берет снимок один раз (current()) и работает с ним до конца - без смеси версий.
+# Кэши (PDF, ответы модели, шаблоны КП) включают версию в ключ, поэтому правка цен их не портит.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import NamedTuple
+
+CATALOG_FILE = os.getenv("CATALOG_FILE", "assets/catalog.json")
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))
+
+# Без этих позиций не посчитать ни один заказ (pricing.quote_order)
+REQUIRED_SERVICES = ("montage_base", "delivery_fix", "diamond_drilling_40")
+# Поля товара, которые читают расчет и верстка (pricing, kp_templates, static_media):
+# обязательные - без них упадет рендер, необязательные - проверяем тип, если поле есть
+PRODUCT_FIELDS = ("name", "price", "image")
+PRODUCT_OPTIONAL = {"short_name": str, "marketing_title": str, "users": str,
+                    "specs_list": list, "features": list, "aliases": list, "montage_price": (int, float)}
+
+_current = None
+_stamp = None  # (mtime_ns, size) файла, из которого собран _current
+_watch_task = None
+# Последние снимки по версии: рендер заказа, посчитанного по старой версии, получает именно ее
+_recent = OrderedDict()
+RECENT_VERSIONS = 4
+# Короткие названия действующего снимка - для short_name() без поиска снимка на каждый вызов
+_short_names = {}
+_default_short_name = None
+
+
+class CatalogError(ValueError):
+    """Файл каталога не проходит проверку - остаемся на прежней версии"""
+
+
+class CatalogVersionError(CatalogError):
+    """В воркере нужна версия каталога, которой уже (или еще) нет в файле"""
+
+
+class ServiceRow(NamedTuple):
+    name: str
+    unit: str
+    price: Decimal
+    desc: str  # Пояснение мелким шрифтом в КП
+
+
+class Catalog:
+    """Снимок каталога. Не меняется после сборки - новая версия = новый объект"""
+
+    def __init__(self, raw, source=CATALOG_FILE):
+        self.raw = raw
+        self.source = source
+        self.loaded_at = time.time()
+        self.label = str(raw.get("version", ""))  # Метка для людей ("2024-06"), версия - по содержимому
+        self.version = hashlib.sha256(
+            json.dumps(raw, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+
+        self.products = raw["products"]
+        self.price_list = raw["price_list"]
+        self.default_product = raw["default_product"]
+        self.default_soil = raw.get("default_soil", "sand")
+        self.product_description = raw.get("product_description", "")
+
+        # ================= ИНДЕКСЫ =================
+        self.services = {
+            key: ServiceRow(item["name"], item["unit"], Decimal(str(item["price"])), item.get("desc", ""))
+            for key, item in self.price_list.items()
+        }
+        self.product_prices = {key: Decimal(str(p["price"])) for key, p in self.products.items()}
+        self.short_names = {key: p.get("short_name") or p["name"] for key, p in self.products.items()}
+        # soil -> [(max_depth или None, ключ услуги)] по возрастанию глубины
+        self.pipe_tariffs = {
+            soil: [(t.get("max_depth"), t["service"]) for t in tariffs]
+            for soil, tariffs in raw["pipe_tariffs"].items()
+        }
+        # Как товар называют в тексте (order_parser): ключ -> регулярка по aliases (текст в нижнем регистре, ё -> е)
+        self.product_patterns = {
+            key: re.compile("|".join(f"(?:{alias})" for alias in p["aliases"]))
+            for key, p in self.products.items() if p.get("aliases")
+        }
+        # Услуги, которые модель может класть в custom_items (у них есть подсказка)
+        self.hint_keys = tuple(key for key, item in self.price_list.items() if item.get("hint"))
+        self.prompt_fragment = self._prompt_fragment()
+
+    def product(self, p_key):
+        """Товар по ключу; неизвестный -> товар по умолчанию"""
+        product = self.products.get(p_key) if isinstance(p_key, str) else None
+        return product or self.products[self.default_product]
+
+    def short_name(self, p_key):
+        """Короткое название для чата ("Тверь 0.8"), если его нет - полное"""
+        name = self.short_names.get(p_key) if isinstance(p_key, str) else None
+        return name or self.short_names[self.default_product]
+
+    def pipe_key(self, soil, depth=1.0):
+        """Тариф трубы по грунту и глубине -> ключ услуги"""
+        tariffs = self.pipe_tariffs.get(soil) or self.pipe_tariffs[self.default_soil]
+        for max_depth, key in tariffs:
+            if max_depth is None or depth <= max_depth:
+                return key
+        return tariffs[-1][1]
+
+    def _prompt_fragment(self):
+        lines = ['ТОВАРЫ (ключи для "product_id"):']
+        for key, product in self.products.items():
+            default = " (по умолч)" if key == self.default_product else ""
+            lines.append(f'- "{key}": {product["name"]}{default}')
+        lines.append('СПИСОК ДОП. УСЛУГ (Используй эти ключи в поле "service_key" для custom_items):')
+        for key in self.hint_keys:
+            lines.append(f'- "{key}": {self.price_list[key]["hint"]}')
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"<Catalog {self.label or '-'} {self.version}: {len(self.products)} товаров, {len(self.services)} услуг>"
+
+
+# ================= ЗАГРУЗКА =================
+
+def _validate(raw):
+    for section in ("products", "price_list", "pipe_tariffs"):
+        if not isinstance(raw.get(section), dict) or not raw[section]:
+            raise CatalogError(f"Нет раздела {section!r}")
+    for key, product in raw["products"].items():
+        if not isinstance(product, dict):
+            raise CatalogError(f"Товар {key!r}: ожидается объект")
+        for field in PRODUCT_FIELDS:
+            if field not in product:
+                raise CatalogError(f"Товар {key!r}: нет поля {field!r}")
+        for field in ("name", "image"):
+            if not isinstance(product[field], str) or not product[field]:
+                raise CatalogError(f"Товар {key!r}: поле {field!r} должно быть непустой строкой")
+        for field, kind in PRODUCT_OPTIONAL.items():
+            value = product.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, kind)):
+                raise CatalogError(f"Товар {key!r}: поле {field!r} неверного типа ({value!r})")
+        for field in ("specs_list", "features", "aliases"):
+            if not all(isinstance(line, str) for line in product.get(field) or ()):
+                raise CatalogError(f"Товар {key!r}: в {field!r} должны быть строки")
+        if product.get("montage_price", 0) < 0:
+            raise CatalogError(f"Товар {key!r}: montage_price должна быть >= 0")
+        for alias in product.get("aliases") or ():
+            try:
+                re.compile(alias)
+            except re.error as e:
+                raise CatalogError(f"Товар {key!r}: кривой шаблон в aliases {alias!r}: {e}") from e
+    for key, item in raw["price_list"].items():
+        for field in ("name", "unit", "price"):
+            if field not in item:
+                raise CatalogError(f"Услуга {key!r}: нет поля {field!r}")
+        for field in ("desc", "hint"):
+            if not isinstance(item.get(field, ""), str):
+                raise CatalogError(f"Услуга {key!r}: поле {field!r} должно быть строкой")
+    for entry in (*raw["products"].values(), *raw["price_list"].values()):
+        price = entry["price"]
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+            raise CatalogError(f"{entry['name']!r}: цена должна быть числом >= 0, пришло {price!r}")
+    missing = [key for key in REQUIRED_SERVICES if key not in raw["price_list"]]
+    if missing:
+        raise CatalogError(f"В прайсе нет обязательных услуг: {', '.join(missing)}")
+    if raw.get("default_product") not in raw["products"]:
+        raise CatalogError(f"Товар по умолчанию {raw.get('default_product')!r} не найден")
+    if raw.get("default_soil", "sand") not in raw["pipe_tariffs"]:
+        raise CatalogError(f"Нет тарифа трубы для грунта по умолчанию {raw.get('default_soil')!r}")
+    for soil, tariffs in raw["pipe_tariffs"].items():
+        if not tariffs:
+            raise CatalogError(f"Пустой список тарифов трубы для {soil!r}")
+        for tariff in tariffs:
+            if tariff.get("service") not in raw["price_list"]:
+                raise CatalogError(f"Тариф трубы {soil!r}: нет услуги {tariff.get('service')!r}")
+
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load(path=CATALOG_FILE):
+    """Файл -> Catalog (CatalogError / OSError, если файл кривой или его нет)"""
+    with open(path, encoding="utf-8") as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"{path}: {e}") from e
+    if not isinstance(raw, dict):
+        raise CatalogError(f"{path}: ожидается JSON-объект")
+    _validate(raw)
+    return Catalog(raw, path)
+
+
+def current():
+    """Действующий снимок каталога (при первом обращении - загрузка)"""
+    if _current is None:
+        reload()
+    return _current
+
+
+def reload(path=CATALOG_FILE):
+    """Перечитать файл. Ошибка при первой загрузке - наружу, при горячей замене - остаемся на старой версии"""
+    global _stamp
+    try:
+        stamp = _file_stamp(path)
+        try:
+            catalog = load(path)
+        except CatalogError:
+            _stamp = stamp  # Этот же кривой файл больше не перечитываем (ждем следующей правки)
+            raise
+    except (OSError, CatalogError) as e:
+        if _current is None:
+            raise
+        logging.error(f"Catalog: {path} не загружен, остаемся на {_current.version}: {e}")
+        return False
+    previous, _stamp = _current, stamp
+    _install(catalog)
+    if previous is None:
+        logging.info(f"Catalog: загружен {catalog!r}")
+    elif previous.version != catalog.version:
+        logging.info(f"Catalog: {previous.version} -> {catalog!r}")
+    return True
+
+
+def _install(catalog):
+    global _current, _short_names, _default_short_name
+    _short_names, _default_short_name = catalog.short_names, catalog.short_name(None)
+    _current = catalog
+    _recent[catalog.version] = catalog
+    _recent.move_to_end(catalog.version)
+    while len(_recent) > RECENT_VERSIONS:
+        _recent.popitem(last=False)
+
+
+def short_name(p_key):
+    """current().short_name(p_key) для горячего пути (текст заказа в чат)"""
+    if _current is None:
+        current()
+    try:
+        return _short_names.get(p_key) or _default_short_name
+    except TypeError:  # product_id от модели может прийти списком / объектом
+        return _default_short_name
+
+
+def snapshot(version):
+    """Снимок версии version, если он действующий или из недавних; иначе None"""
+    return _recent.get(version)
+
+
+def reload_if_changed(path=CATALOG_FILE):
+    """Файл поменялся (mtime / размер) -> reload(). True - подменили снимок"""
+    try:
+        stamp = _file_stamp(path)
+    except OSError as e:
+        logging.warning(f"Catalog: {path} недоступен: {e}")
+        return False
+    if stamp == _stamp:
+        return False
+    previous = _current
+    return reload(path) and (previous is None or previous.version != _current.version)
+
+
+def ensure(version, raw=None):
+    """
+    В воркере рендера: процесс бота считал заказ по version - рисуем ровно по ней.
+    Отстали -> перечитываем файл. raw - содержимое снимка от процесса бота (если в файле уже другая версия).
+    Нужной версии так и не получили -> CatalogVersionError
+    """
+    if current().version == version:
+        return _current
+    if raw is not None:
+        catalog = _recent.get(version) or Catalog(raw)
+    else:
+        catalog = _recent.get(version)
+        if catalog is None:
+            reload()
+            catalog = _current
+    if catalog.version != version:
+        raise CatalogVersionError(f"Нужна версия каталога {version}, есть {catalog.version}")
+    _install(catalog)
+    return catalog
+
+
+# ================= СЛЕЖЕНИЕ ЗА ФАЙЛОМ =================
+
+async def _watch_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        reload_if_changed()
+
+
+def start_watcher(interval=CATALOG_RELOAD_INTERVAL):
+    """Горячая замена прайса (вызывать внутри работающего event loop; 0 - не следить)"""
+    global _watch_task
+    current()
+    if interval > 0 and _watch_task is None:
+        _watch_task = asyncio.create_task(_watch_loop(interval))
+
+
+async def stop_watcher():
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        await asyncio.gather(_watch_task, return_exceptions=True)
+        _watch_task = None
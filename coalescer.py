@@ -0,0 +1,81 @@
+# coalescer.py
+# Последовательная обработка сообщений одного пользователя + склейка очередей.
+# Прораб шлет три правки подряд -> вместо трех параллельных запросов к модели (и победы того,
+# кто ответил последним, даже со старого состояния):
+# - каждое новое сообщение отменяет текущий запрос этого пользователя (HTTP к модели обрывается);
+# - после паузы COALESCE_WINDOW все накопившиеся сообщения уходят в модель одним запросом;
+# - результат сохраняется сразу после ответа, без await - следующий запрос видит свежее состояние.
+import asyncio
+import os
+import weakref
+
+import tracing
+
+# Сколько (сек) ждем следующее сообщение, прежде чем идти в модель
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0.5"))
+
+
+class Superseded(Exception):
+    """Сообщение ушло в модель вместе с более новым - отвечать на него не нужно"""
+
+
+class Coalescer:
+    def __init__(self, window=COALESCE_WINDOW):
+        self.window = window
+        self._texts = {}  # uid -> сообщения, которые еще не обработаны
+        self._tasks = {}  # uid -> текущая задача (не больше одной на пользователя)
+        # Задачи, отмененные более новым сообщением (отличаем от отмены при остановке бота;
+        # Task.cancelling() есть только с Python 3.11)
+        self._superseded = weakref.WeakSet()
+
+    async def submit(self, uid, text, job):
+        """
+        job(merged_text) - корутина, которая идет в модель и сохраняет результат.
+        Возвращает результат job для самого нового сообщения пачки,
+        для более старых поднимает Superseded.
+        """
+        self._texts.setdefault(uid, []).append(text)
+        previous = self._tasks.get(uid)
+        if previous is not None and not previous.done():
+            self._superseded.add(previous)
+        self.cancel(uid, keep_texts=True)
+        task = asyncio.create_task(self._run(uid, job))
+        self._tasks[uid] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Нашу задачу отменило более новое сообщение (а не остановка бота)
+            if task in self._superseded:
+                self._superseded.discard(task)
+                raise Superseded()
+            raise
+
+    def cancel(self, uid, keep_texts=False):
+        """Отменить текущий запрос пользователя (сброс заказа / новое сообщение)"""
+        task = self._tasks.pop(uid, None)
+        if task is not None and not task.done():
+            task.cancel()
+        if not keep_texts:
+            self._texts.pop(uid, None)
+
+    def busy(self, uid):
+        task = self._tasks.get(uid)
+        return task is not None and not task.done()
+
+    async def _run(self, uid, job):
+        try:
+            with tracing.span("coalesce"):
+                await asyncio.sleep(self.window)
+            texts = self._texts.get(uid, [])
+            try:
+                result = await job("\n".join(texts))
+            except Exception:
+                self._texts.pop(uid, None)
+                raise
+            # Между ответом job и этой строкой нет await: новых сообщений прийти не могло
+            self._texts.pop(uid, None)
+            return result
+        finally:
+            if self._tasks.get(uid) is asyncio.current_task():
+                del self._tasks[uid]
+
@@ -7,70 +7,6 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 # Настройки DeepSeek
 
 
-# ================= БАЗА ДАННЫХ ТОВАРОВ (PREMIUM) =================
-PRODUCTS = {
-    "tver_08": {
-        "name": "Тверь CLASSIC 0,8П",
-        "price": 157700,
-        "image": "assets/tver_08.png",
-        # Характеристики для таблицы
-        "specs_list": [
-            "Пользователи: до 5 чел.",
-            "Производительность: 0.8 м³/сут",
-            "Залповый сброс: 240 л",
-            "Корпус: Первичный полипропилен",
-            "Размеры: 2.0 x 1.1 x 1.67 м",
-            "Вес: 170 кг"
-        ],
-        # Продающий текст (Жирным в начале)
-        "marketing_title": "Идеальное решение для дачи и ПМЖ",
-        # Основные преимущества (из буклета)
-        "features": [
-            "• Степень очистки до 98% (соответствует СанПиН)",
-            "• Очищенную воду можно сливать прямо в грунт",
-            "• Гарантированное отсутствие засоров (без автоматики)",
-            "• Подходит для нестандартного заглубления трубы",
-            "• Гарантия на корпус — 10 лет, срок службы — 50 лет"
-        ],
-        "montage_price": 39000
-    },
-    "tver_11": {
-        "name": "Тверь CLASSIC 1,1П",
-        "price": 185000,
-        "image": "assets/tver_11.png",
-        "specs_list": [
-            "Пользователи: до 7 чел.",
-            "Производительность: 1.1 м³/сут",
-            "Залповый сброс: 330 л",
-            "Корпус: Усиленный полипропилен",
-            "Размеры: 2.5 x 1.1 x 1.67 м",
-            "Вес: 210 кг"
-        ],
-        "marketing_title": "Увеличенная мощность для большой семьи",
-        "features": [
-            "• Степень очистки до 98% (без запаха)",
-            "• Полная всеядность: не боится шерсти, химии",
-            "• Обслуживание 1 раз в 2 года (можно самому)",
-            "• Монтаж без бетонирования (якорение грунтозацепами)",
-            "• Гарантия на корпус — 10 лет"
-        ],
-        "montage_price": 45000  # Цена монтажа для большой станции
-    }
-    # Евролос пока убран, чтобы не было ошибок без картинки
-}
-
-# ================= ЦЕНЫ И ОПИСАНИЯ РАБОТ =================
-SERVICES = {
-    "delivery_fix": 13000,
-    "diamond_drilling": 6000,  # Исправили цену на 6000 (как в смете)
-    "sand_price_per_meter": 940,
-    "clay_price_per_meter": 1525,
-    "false_call_penalty": 5000,
-
-    # Красивое описание монтажа (как у папы)
-    "montage_description": (
-        "Включает: разгрузку, перемещение до 10м, спуск в котлован, "
-        "обсыпку песком с заполнением водой, укладку 4м трубы и кабеля, "
-        "пуско-наладочные работы, врезку патрубков, запуск компрессора."
-    )
-}
\ No newline at end of file
+# ================= ТОВАРЫ И ЦЕНЫ =================
+# Каталог моделей и прайс работ - в assets/catalog.json (catalog.py):
+# правка цен подхватывается на лету, без рестарта бота
@@ -0,0 +1,122 @@
+# documents.py
+# Печать и отправка документов заказа (КП + Смета) в чат.
+# Сначала смотрим кэш (pdf_cache): file_id от прошлой отправки -> ни рендера, ни загрузки;
+# готовый PDF -> без рендера. Рисуем в пуле (renderer) только то, чего нет.
+# SEPARATE_STATIC=1: брошюра модели и инструкции - отдельными файлами по file_id (static_media).
+import asyncio
+import logging
+from typing import NamedTuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, InputMediaDocument
+
+import catalog
+import metrics
+import renderer
+import static_media
+import tracing
+from pdf_cache import document_key, pdf_cache
+from pricing import quote_order
+
+
+class Document(NamedTuple):
+    kind: str  # "kp" / "smeta" / "brochure" / "appendix"
+    key: str  # ключ в pdf_cache (или static_media)
+    filename: str
+    caption: str
+    file_id: str  # file_id Telegram (если уже отправляли) или None
+    pdf: bytes  # готовый PDF или None
+
+
+def _render(kind, data, quote, separate, version):
+    if kind == "kp":
+        return renderer.render_kp(data, quote=quote, product_block=not separate, version=version)
+    return renderer.render_estimate(data, quote=quote, appendix=not separate, version=version)
+
+
+async def prepare_order_documents(data, captions, use_file_ids=True, separate=False):
+    """
+    captions: {"kp": "...", "smeta": "..."} -> [Document, ...] в том же порядке.
+    separate=True - КП без картинки/характеристик и смета без инструкций (они идут отдельно).
+    """
+    client = data.get('client_name')
+    names = {"kp": f"КП_{client}.pdf", "smeta": f"Смета_{client}.pdf"}
+    variant = "separate" if separate else ""
+    # Один снимок каталога на заказ: ключи кэша, расчет и рендер - по одной версии прайса
+    cat = catalog.current()
+    docs = []
+    for kind, caption in captions.items():
+        key = document_key(kind, data, variant, cat)
+        file_id = await pdf_cache.get_file_id(key) if use_file_ids else None
+        pdf = None if file_id else await pdf_cache.get(key)
+        docs.append(Document(kind, key, names[kind], caption, file_id, pdf))
+
+    missing = [n for n, doc in enumerate(docs) if doc.file_id is None and doc.pdf is None]
+    if missing:
+        # Цены считаем один раз на заказ - документы рисуют один и тот же расчет (параллельно в пуле)
+        with tracing.span("pricing"):
+            quote = quote_order(data, cat)
+        pdfs = await asyncio.gather(*[_render(docs[n].kind, data, quote, separate, cat.version) for n in missing])
+        for n, pdf in zip(missing, pdfs):
+            docs[n] = docs[n]._replace(pdf=pdf)
+        await asyncio.gather(*[pdf_cache.put(docs[n].key, docs[n].pdf) for n in missing])
+    logging.info(f"Документы: отрисовано {len(missing)} из {len(docs)} {pdf_cache.stats()}")
+    tracing.set_attrs(rendered=len(missing), documents=len(docs))
+    return docs
+
+
+async def prepare_static_documents(data, use_file_ids=True):
+    """Брошюра + инструкции: по file_id, а если еще не загружали - bytes для первой загрузки"""
+    docs = []
+    for item in static_media.items_for(data):
+        file_id = await static_media.file_ids.get(item.key) if use_file_ids else None
+        pdf = None if file_id else await static_media.load_bytes(item)
+        docs.append(Document(item.kind, item.key, item.filename, item.caption, file_id, pdf))
+    return docs
+
+
+def _media(doc):
+    media = doc.file_id or BufferedInputFile(doc.pdf, filename=doc.filename)
+    return InputMediaDocument(media=media, caption=doc.caption)
+
+
+async def _send(message, docs):
+    """Группа документов в чат + замер: files - что-то загружаем, file_id - только ссылки"""
+    upload = sum(len(doc.pdf) for doc in docs if doc.file_id is None and doc.pdf)
+    via = "files" if upload else "file_id"
+    with metrics.IN_FLIGHT.labels(stage="upload").track_inprogress(), metrics.UPLOAD_SECONDS.labels(via=via).time(), \
+            tracing.span("send", via=via, docs=len(docs), bytes=upload):
+        sent = await message.answer_media_group([_media(doc) for doc in docs])
+    metrics.UPLOAD_BYTES.inc(upload)
+    return sent
+
+
+async def _prepare_all(data, captions, separate, use_file_ids=True):
+    docs = await prepare_order_documents(data, captions, use_file_ids, separate)
+    if separate:
+        docs += await prepare_static_documents(data, use_file_ids)
+    return docs
+
+
+async def send_order_documents(message, data, captions, separate=None):
+    """Рисуем (или берем из кэша) документы заказа и отправляем одной группой в чат message"""
+    if separate is None:
+        separate = static_media.SEPARATE_STATIC
+    docs = await _prepare_all(data, captions, separate)
+    try:
+        sent = await _send(message, docs)
+    except TelegramBadRequest:
+        if not any(doc.file_id for doc in docs):
+            raise
+        # Старый file_id больше не годится - забываем и шлем файлы
+        logging.warning("Документы: Telegram не принял file_id, отправляю файлы заново")
+        await pdf_cache.forget_file_ids(doc.key for doc in docs if doc.file_id and doc.kind in captions)
+        await static_media.file_ids.forget(doc.key for doc in docs if doc.file_id and doc.kind not in captions)
+        docs = await _prepare_all(data, captions, separate, use_file_ids=False)
+        sent = await _send(message, docs)
+
+    # Запоминаем file_id: следующая такая же печать (и любая брошюра/инструкция) уйдет без загрузки
+    pairs = [(doc, msg.document.file_id) for doc, msg in zip(docs, sent) if msg.document is not None]
+    await pdf_cache.set_file_ids((doc.key, file_id) for doc, file_id in pairs if doc.kind in captions)
+    await static_media.file_ids.set_many((doc.key, file_id) for doc, file_id in pairs if doc.kind not in captions)
+    return sent
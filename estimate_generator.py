@@ -2,11 +2,11 @@
 import os
 from datetime import datetime
 from fpdf import FPDF
-from pypdf import PdfWriter, PdfReader  # Библиотека для склейки PDF
 
-# Импортируем базу товаров и услуг
-from config import PRODUCTS
-from services import PRICE_LIST, get_pipe_service
+# Единый расчет позиций и цен (тот же, что и в КП)
+from pricing import quote_order, format_amount
+from font_cache import add_fonts
+from pdf_merge import get_appendix, merge_with_appendix  # Склейка с инструкциями в памяти
 
 
 class StrictEstimatePDF(FPDF):
@@ -28,7 +28,12 @@ class StrictEstimatePDF(FPDF):
         self.cell(0, 10, 'Подпись Заказчика: _______________   Подпись Подрядчика: _______________', 0, 0, 'C')
 
 
-def generate_strict_estimate(data, filename="strict_smeta.pdf"):
+def generate_strict_estimate(data, filename="strict_smeta.pdf", quote=None, appendix=True):
+    """
+    Рисует строгую смету + инструкции. filename=None -> возвращаем bytes PDF без записи на диск.
+    quote - готовый расчет pricing.quote_order(data) (если уже посчитан для этого заказа).
+    appendix=False - только смета (инструкции отправляются отдельным файлом, static_media).
+    """
     pdf = StrictEstimatePDF()
 
     # 1. Подключаем русский шрифт (ОБЯЗАТЕЛЬНО)
@@ -37,8 +42,7 @@ def generate_strict_estimate(data, filename="strict_smeta.pdf"):
         print(f"ОШИБКА: Не найден шрифт {font_path}")
         return None
 
-    pdf.add_font('MyFont', '', font_path, uni=True)
-    pdf.add_font('MyFont', 'B', font_path, uni=True)
+    add_fonts(pdf, ('', 'B'), path=font_path)
 
     pdf.add_page()
 
@@ -76,87 +80,14 @@ def generate_strict_estimate(data, filename="strict_smeta.pdf"):
 
     pdf.set_font("MyFont", '', 9)
 
-    # --- СБОР ПОЗИЦИЙ ДЛЯ СМЕТЫ ---
-    items = []
-
-    # А) ОСНОВНОЕ ОБОРУДОВАНИЕ (СЕПТИК)
-    p_key = data.get('product_id', 'tver_08')
-    product = PRODUCTS.get(p_key, PRODUCTS['tver_08'])
-    items.append({
-        "name": f"Станция очистки {product['name']}",
-        "unit": "шт.",
-        "qty": 1,
-        "price": product['price']
-    })
-
-    # Б) МОНТАЖ (БАЗОВЫЙ)
-    # Берем цену монтажа из конфига продукта или базовую из services
-    montage_price = product.get('montage_price', PRICE_LIST['montage_base']['price'])
-    items.append({
-        "name": PRICE_LIST['montage_base']['name'],
-        "unit": PRICE_LIST['montage_base']['unit'],
-        "qty": 1,
-        "price": montage_price
-    })
-
-    # В) ТРУБОПРОВОД (Умный расчет из services.py)
-    soil = data.get('soil', 'sand')
-    pipe_len = int(data.get('pipe_length', 5))
-    # Выбираем правильную позицию прайса (глина/песок)
-    pipe_service = get_pipe_service(soil, 1.0)
-
-    items.append({
-        "name": pipe_service['name'],
-        "unit": pipe_service['unit'],
-        "qty": pipe_len,
-        "price": pipe_service['price']
-    })
-
-    # Г) ДОСТАВКА
-    deliv = PRICE_LIST['delivery_fix']
-    items.append({"name": deliv['name'], "unit": deliv['unit'], "qty": 1, "price": deliv['price']})
-
-    # Д) СПЕЦ. РАБОТЫ (Бурение фундамента)
-    # Если AI поставил флаг diamond_drilling
-    if data.get('diamond_drilling'):
-        drl = PRICE_LIST['diamond_drilling_40']
-        items.append({"name": drl['name'], "unit": drl['unit'], "qty": 1, "price": drl['price']})
-
-    # Е) ДОПОЛНИТЕЛЬНЫЕ УСЛУГИ (Custom Items от AI)
-    # AI может вернуть два типа допов:
-    # 1. Из нашего прайс-листа (есть ключ service_key)
-    # 2. Произвольный текст (нет ключа, просто name и price)
-
-    if data.get('custom_items'):
-        for custom in data['custom_items']:
-            service_key = custom.get('service_key')
-
-            # Вариант 1: Услуга из базы services.py
-            if service_key and service_key in PRICE_LIST:
-                service = PRICE_LIST[service_key]
-                items.append({
-                    "name": service['name'],
-                    "unit": service['unit'],
-                    "qty": custom.get('qty', 1),
-                    "price": service['price']
-                })
-            # Вариант 2: Произвольная услуга ("Сломать сарай")
-            else:
-                items.append({
-                    "name": custom.get('name', 'Доп. услуга'),
-                    "unit": "шт.",
-                    "qty": custom.get('qty', 1),
-                    "price": int(custom.get('price', 0))
-                })
+    # --- ПОЗИЦИИ СМЕТЫ (общий расчет с pricing.py, как и в КП) ---
+    if quote is None:
+        quote = quote_order(data)
 
     # --- ОТРИСОВКА СТРОК ТАБЛИЦЫ ---
-    total_sum = 0
     n = 1
 
-    for item in items:
-        sum_item = item['price'] * item['qty']
-        total_sum += sum_item
-
+    for item in quote.lines:
         # Хак для красивой отрисовки длинных названий (MultiCell)
         x_start = pdf.get_x()
         y_start = pdf.get_y()
@@ -166,7 +97,7 @@ def generate_strict_estimate(data, filename="strict_smeta.pdf"):
 
         # 2. Название (может быть многострочным)
         pdf.set_xy(x_start + cols[0], y_start)
-        pdf.multi_cell(cols[1], 6, item['name'], "L R", 'L')
+        pdf.multi_cell(cols[1], 6, item.name, "L R", 'L')
 
         # Вычисляем высоту, которую заняло название
         y_end = pdf.get_y()
@@ -175,10 +106,10 @@ def generate_strict_estimate(data, filename="strict_smeta.pdf"):
         # Возвращаемся наверх рисовать остальные ячейки
         pdf.set_xy(x_start + cols[0] + cols[1], y_start)
 
-        pdf.cell(cols[2], h_row, item['unit'], 1, 0, 'C')
-        pdf.cell(cols[3], h_row, str(item['qty']), 1, 0, 'C')
-        pdf.cell(cols[4], h_row, str(item['price']), 1, 0, 'R')
-        pdf.cell(cols[5], h_row, str(sum_item), 1, 1, 'R')
+        pdf.cell(cols[2], h_row, item.unit, 1, 0, 'C')
+        pdf.cell(cols[3], h_row, format_amount(item.qty), 1, 0, 'C')
+        pdf.cell(cols[4], h_row, format_amount(item.price), 1, 0, 'R')
+        pdf.cell(cols[5], h_row, format_amount(item.total), 1, 1, 'R')
 
         # Рисуем нижнюю линию для всей строки
         pdf.set_xy(x_start, y_end)
@@ -191,43 +122,23 @@ def generate_strict_estimate(data, filename="strict_smeta.pdf"):
     # 4. ИТОГО
     pdf.ln(5)
     pdf.set_font("MyFont", 'B', 11)
-    pdf.cell(0, 10, f"ИТОГО: {total_sum} руб.", 0, 1, 'R')
+    pdf.cell(0, 10, f"ИТОГО: {format_amount(quote.total)} руб.", 0, 1, 'R')
 
-    # Сохраняем временный файл (только таблица)
-    temp_filename = "temp_" + filename
-    pdf.output(temp_filename)
+    # Рендерим таблицу в память (без временного файла на диске)
+    pdf_bytes = bytes(pdf.output())
 
     # === 5. СКЛЕЙКА С ИНСТРУКЦИЯМИ (Appendix) ===
-    # Если файла appendix.pdf нет, отдадим просто смету
-    appendix_path = "assets/appendix.pdf"
-
-    if os.path.exists(appendix_path):
+    # appendix.pdf держим разобранным в памяти (pdf_merge). Если файла нет - отдадим просто смету
+    if appendix and get_appendix() is None:
+        print("Внимание: Файл appendix.pdf не найден в папке assets!")
+    elif appendix:
         try:
-            merger = PdfWriter()
-
-            # Добавляем нашу свежую смету
-            reader_smeta = PdfReader(temp_filename)
-            for page in reader_smeta.pages:
-                merger.add_page(page)
-
-            # Добавляем инструкции из файла
-            reader_app = PdfReader(appendix_path)
-            for page in reader_app.pages:
-                merger.add_page(page)
-
-            # Сохраняем итог
-            with open(filename, "wb") as f_out:
-                merger.write(f_out)
-
-            # Удаляем временный файл
-            os.remove(temp_filename)
-            return filename
-
+            pdf_bytes = merge_with_appendix(pdf_bytes)
         except Exception as e:
-            print(f"Ошибка склейки PDF: {e}")
-            return temp_filename  # Возвращаем хотя бы смету
-    else:
-        print("Внимание: Файл appendix.pdf не найден в папке assets!")
-        os.rename(temp_filename, filename)
-        return filename
+            print(f"Ошибка склейки PDF: {e}")  # Отдаем хотя бы смету
 
+    if filename is None:
+        return pdf_bytes
+    with open(filename, "wb") as f_out:
+        f_out.write(pdf_bytes)
+    return filename
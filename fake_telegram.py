@@ -0,0 +1,147 @@
+# fake_telegram.py
+# Подменная сессия aiogram для нагрузочных тестов: Bot никуда не ходит, а записывает вызовы
+# (метод, чат, текст, размер загрузки) и отвечает правдоподобными объектами Telegram.
+# Ответы разбираются тем же check_response, что и настоящие, поэтому message.edit_text,
+# bot.delete_message и answer_media_group в хендлерах работают как в бою.
+# Загруженные файлы (последние FILES_MAX) лежат в памяти: bot.download(file_id) отдает их обратно.
+#
+#   bot.session = FakeTelegramSession(latency=0.05, upload_mbps=20)
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import NamedTuple
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import BufferedInputFile
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Septic Bot", "username": "septic_bot"}
+# Сколько загруженных файлов держим для bot.download (остальные забываем, как протухший file_path)
+FILES_MAX = 256
+
+
+class Call(NamedTuple):
+    method: str  # sendMessage / editMessageText / sendMediaGroup ...
+    chat_id: int
+    text: str  # текст сообщения / подпись (для проверки исхода сценария)
+    upload_bytes: int  # сколько байт файлов ушло бы в Telegram
+    at: float  # time.perf_counter() ответа
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, latency=0.05, upload_mbps=20.0):
+        super().__init__()
+        self.latency = latency  # сек на любой вызов API
+        self.upload_mbps = upload_mbps  # ширина канала для загрузки файлов (Мбит/с)
+        self.calls = []
+        self.by_chat = defaultdict(list)
+        self.files = OrderedDict()  # file_id -> bytes
+        self._message_id = 0
+
+    # ================= ЗАПИСЬ =================
+
+    def _record(self, method, chat_id, text="", upload_bytes=0):
+        call = Call(method, chat_id, text or "", upload_bytes, time.perf_counter())
+        self.calls.append(call)
+        self.by_chat[chat_id].append(call)
+        return call
+
+    def counts(self):
+        return dict(Counter(call.method for call in self.calls))
+
+    def uploaded(self):
+        return sum(call.upload_bytes for call in self.calls)
+
+    def reset(self):
+        self.calls.clear()
+        self.by_chat.clear()
+
+    # ================= ОТВЕТЫ =================
+
+    def _message(self, chat_id, text=None, message_id=None, document=None):
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        msg = {"message_id": message_id, "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        if text is not None:
+            msg["text"] = text
+        if document is not None:
+            msg["document"] = document
+        return msg
+
+    def _document(self, media):
+        """InputMediaDocument -> (Document Telegram, байт загрузки). По file_id - без загрузки"""
+        if isinstance(media.media, BufferedInputFile):
+            data = media.media.data
+            file_id = "fake-" + hashlib.sha256(data).hexdigest()[:32]
+            self.files[file_id] = data
+            self.files.move_to_end(file_id)
+            while len(self.files) > FILES_MAX:
+                self.files.popitem(last=False)
+            name = media.media.filename
+            size = len(data)
+            return {"file_id": file_id, "file_unique_id": file_id[-16:], "file_name": name, "file_size": size}, size
+        return {"file_id": str(media.media), "file_unique_id": str(media.media)[-16:]}, 0
+
+    def _result(self, method):
+        name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        if name == "sendMessage":
+            self._record(name, chat_id, method.text)
+            return self._message(chat_id, method.text)
+        if name == "editMessageText":
+            self._record(name, chat_id, method.text)
+            return self._message(chat_id, method.text, method.message_id)
+        if name == "sendMediaGroup":
+            docs = [self._document(media) for media in method.media]
+            upload = sum(size for _, size in docs)
+            captions = " | ".join(media.caption or "" for media in method.media)
+            self._record(name, chat_id, captions, upload)
+            return [self._message(chat_id, document=doc) for doc, _ in docs]
+        if name == "getFile":
+            self._record(name, None)
+            data = self.files.get(method.file_id)
+            if data is None:
+                return None
+            return {"file_id": method.file_id, "file_unique_id": method.file_id[-16:],
+                    "file_size": len(data), "file_path": f"documents/{method.file_id}"}
+        if name == "sendDocument":
+            self._record(name, chat_id, method.caption)
+            return self._message(chat_id, document={"file_id": "fake-doc", "file_unique_id": "fake-doc"})
+        # deleteMessage, answerCallbackQuery, deleteWebhook ... - просто True
+        self._record(name, chat_id)
+        return True
+
+    def _upload_time(self, method):
+        if method.__api_method__ != "sendMediaGroup" or not self.upload_mbps:
+            return 0.0
+        size = sum(len(m.media.data) for m in method.media if isinstance(m.media, BufferedInputFile))
+        return size * 8 / (self.upload_mbps * 1_000_000)
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency + self._upload_time(method))
+        result = self._result(method)
+        if result is None:
+            # Как ответ Telegram на чужой / забытый file_id - check_response поднимет TelegramBadRequest
+            content = json.dumps({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"})
+            return self.check_response(bot, method, 400, content).result
+        # Тот же разбор, что у настоящей сессии: типы aiogram + привязка к bot
+        content = json.dumps({"ok": True, "result": result}, ensure_ascii=False)
+        return self.check_response(bot, method, 200, content).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        """Скачивание по file_path из getFile: отдаем загруженные ранее байты кусками chunk_size"""
+        await asyncio.sleep(self.latency)
+        data = self.files.get(url.rsplit("/", 1)[-1])
+        if data is None:
+            if raise_for_status:
+                raise TelegramAPIError(None, f"FakeTelegramSession: файла {url} нет среди загруженных")
+            return
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    async def close(self):
+        pass
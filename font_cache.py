@@ -0,0 +1,217 @@
+# font_cache.py
+# Кэш шрифта для PDF.
+# Раньше каждый документ делал pdf.add_font(...) по 2-3 раза, и fpdf каждый раз
+# заново разбирал 367 КБ TTF и пересчитывал таблицу ширин глифов (~50 мс на печать).
+# Теперь метрики считаются один раз на процесс (и сохраняются на диск в .cache/),
+# а каждому новому FPDF выдается легкая копия шрифта поверх общих байтов файла.
+#
+# Быстрый путь собирает TTFFont из внутренних полей fpdf2 - версия закреплена в requirements.txt.
+# Другая версия с другим набором полей -> обычный pdf.add_font (медленно, но правильно).
+import json
+import logging
+import os
+from collections import defaultdict
+from io import BytesIO
+
+FONT_PATH = "assets/font.ttf"
+FONT_FAMILY = "MyFont"
+
+# Папка для дисковых кэшей (метрики шрифта и т.п.)
+CACHE_DIR = os.getenv("SEPTIC_CACHE_DIR", ".cache")
+
+# Поднимаем при изменении формата файла метрик
+METRICS_FORMAT = 1
+
+_metrics = {}  # путь к шрифту -> dict с метриками
+_font_data = {}  # путь к шрифту -> bytes TTF (BytesIO поверх bytes не копирует их)
+
+# Поля TTFFont, которые заполняет _make_font (fpdf2 2.8.x)
+_FONT_SLOTS = frozenset((
+    "i", "type", "name", "desc", "glyph_ids", "_hbfont", "sp", "ss", "up", "ut", "cw", "ttffile", "fontkey",
+    "emphasis", "scale", "subset", "cmap", "ttfont", "missing_glyphs", "biggest_size_pt", "color_font",
+    "unicode_range", "palette_index", "is_compressed", "is_cff", "is_cid_keyed", "is_symbol", "cff_ros",
+    "collection_font_number",
+))
+
+try:
+    # Быстрый путь есть только в fpdf2 (в старом pyfpdf свой .pkl-кэш)
+    import fpdf
+    from fontTools import ttLib
+    from fpdf.enums import FontDescriptorFlags, TextEmphasis
+    from fpdf.fonts import PDFFontDescriptor, SubsetMap, TTFFont
+except ImportError:
+    TTFFont = None
+else:
+    if frozenset(getattr(TTFFont, "__slots__", ())) != _FONT_SLOTS:
+        logging.warning(f"Font cache: fpdf2 {getattr(fpdf, 'FPDF_VERSION', '?')} устроен иначе, "
+                        f"чем ждет кэш шрифта - подключаю шрифт через pdf.add_font")
+        TTFFont = None
+
+
+# ================= МЕТРИКИ =================
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}-{getattr(fpdf, 'FPDF_VERSION', '')}"
+
+
+def _metrics_file(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"font_{name}.json")
+
+
+def _parse_metrics(path):
+    """Полный разбор TTF средствами fpdf (медленно, один раз)"""
+    probe = fpdf.FPDF()
+    probe.add_font(FONT_FAMILY, "", path)
+    font = probe.fonts[f"{FONT_FAMILY.lower()}"]
+    desc = font.desc
+    return {
+        "scale": font.scale,
+        "desc": {
+            "ascent": desc.ascent,
+            "descent": desc.descent,
+            "cap_height": desc.cap_height,
+            "flags": desc.flags.value,
+            "font_b_box": desc.font_b_box,
+            "italic_angle": desc.italic_angle,
+            "stem_v": desc.stem_v,
+            "missing_width": desc.missing_width,
+        },
+        "cw": dict(font.cw),
+        "cmap": dict(font.cmap),
+        "glyph_ids": dict(font.glyph_ids),
+        "name": font.name,
+        "up": font.up,
+        "ut": font.ut,
+        "sp": font.sp,
+        "ss": font.ss,
+        "is_cff": font.is_cff,
+        "is_cid_keyed": font.is_cid_keyed,
+        "is_symbol": font.is_symbol,
+        "cff_ros": font.cff_ros,
+        "color_font": font.color_font is not None,
+    }
+
+
+def _load_metrics_file(path, stamp):
+    cache_file = _metrics_file(path)
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if raw.get("format") != METRICS_FORMAT or raw.get("stamp") != stamp:
+        return None
+    m = raw["metrics"]
+    # JSON хранит ключи словарей строками - возвращаем коды символов в int
+    for key in ("cw", "cmap", "glyph_ids"):
+        m[key] = {int(k): v for k, v in m[key].items()}
+    if m["cff_ros"] is not None:
+        m["cff_ros"] = tuple(m["cff_ros"])
+    return m
+
+
+def _save_metrics_file(path, stamp, metrics):
+    cache_file = _metrics_file(path)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"format": METRICS_FORMAT, "stamp": stamp, "metrics": metrics}, f, ensure_ascii=False)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logging.warning(f"Font cache: не смог сохранить {cache_file}: {e}")
+
+
+def get_metrics(path=FONT_PATH):
+    """Метрики шрифта: память процесса -> файл в .cache/ -> полный разбор TTF"""
+    stamp = _file_stamp(path)
+    cached = _metrics.get(path)
+    if cached is not None and cached["stamp"] == stamp:
+        return cached
+
+    m = _load_metrics_file(path, stamp)
+    if m is None:
+        m = _parse_metrics(path)
+        _save_metrics_file(path, stamp, m)
+
+    m["stamp"] = stamp
+    _metrics[path] = m
+
+    # Байты TTF читаем один раз - их читают все документы процесса
+    with open(path, "rb") as f:
+        _font_data[path] = f.read()
+    return m
+
+
+# ================= ПОДКЛЮЧЕНИЕ К FPDF =================
+
+def _make_font(pdf, path, fontkey, style, m):
+    """Собираем TTFFont из готовых метрик, без разбора файла"""
+    font = TTFFont.__new__(TTFFont)
+    font.i = len(pdf.fonts) + 1
+    font.type = "TTF"
+    font.ttffile = path
+    font.is_compressed = False
+    font._hbfont = None
+    font.fontkey = fontkey
+    font.biggest_size_pt = 0
+    font.collection_font_number = 0
+    # Свой ленивый TTFont на документ: при сохранении PDF fpdf урезает (subset) его на месте
+    font.ttfont = ttLib.TTFont(BytesIO(_font_data[path]), recalcTimestamp=False, lazy=True)
+    font.is_cff = m["is_cff"]
+    font.is_cid_keyed = m["is_cid_keyed"]
+    font.is_symbol = m["is_symbol"]
+    font.cff_ros = m["cff_ros"]
+    font.scale = m["scale"]
+
+    desc = dict(m["desc"])
+    desc["flags"] = FontDescriptorFlags(desc["flags"])
+    font.desc = PDFFontDescriptor(**desc)
+
+    default_width = desc["missing_width"]
+    font.cw = defaultdict(lambda: default_width, m["cw"])
+    font.cmap = m["cmap"]
+    font.glyph_ids = m["glyph_ids"]
+    font.missing_glyphs = []
+    font.name = m["name"]
+    font.up = m["up"]
+    font.ut = m["ut"]
+    font.sp = m["sp"]
+    font.ss = m["ss"]
+    font.emphasis = TextEmphasis.coerce(style)
+    font.subset = SubsetMap(font)
+    font.palette_index = 0
+    font.color_font = None
+    font.unicode_range = None
+    return font
+
+
+def add_fonts(pdf, styles=("", "B", "I"), family=FONT_FAMILY, path=FONT_PATH):
+    """Замена серии pdf.add_font(...): подключает шрифт во всех нужных начертаниях"""
+    m = None
+    if TTFFont is not None:
+        try:
+            m = get_metrics(path)
+        except Exception as e:
+            logging.warning(f"Font cache: работаю без кэша ({e})")
+
+    for style in styles:
+        if m is None or m["color_font"]:
+            pdf.add_font(family, style, path, uni=True)
+            continue
+        fontkey = f"{family.lower()}{''.join(sorted(style.upper()))}"
+        if fontkey in pdf.fonts:
+            continue
+        try:
+            pdf.fonts[fontkey] = _make_font(pdf, path, fontkey, style, m)
+        except (AttributeError, TypeError, ValueError) as e:
+            logging.warning(f"Font cache: не собрал шрифт из кэша ({e}), подключаю через pdf.add_font")
+            pdf.add_font(family, style, path, uni=True)
+
+
+def warm_up(path=FONT_PATH):
+    """Вызывается при старте воркера рендера"""
+    if TTFFont is not None and os.path.exists(path):
+        get_metrics(path)
@@ -0,0 +1,102 @@
+# image_assets.py
+# Картинки для PDF (логотип, фото станций): уменьшаются до печатного размера при IMAGE_DPI,
+# декодируются и сжимаются ОДИН раз на процесс. Каждый документ получает уже готовый поток:
+# fpdf находит картинку в своем image_cache и не читает PNG заново.
+# Меньше пикселей -> быстрее печать и легче PDF.
+import logging
+import os
+
+import catalog
+
+# Разрешение печати: 150 dpi достаточно для экрана и офисного принтера
+IMAGE_DPI = int(os.getenv("IMAGE_DPI", "150"))
+
+# Где какая картинка печатается (ширина в мм) - для прогрева воркеров
+PRINT_WIDTHS = {
+    "assets/logo.png": 40,
+}
+# Фото станций (поле image товаров в каталоге) в блоке товара КП
+PRODUCT_IMAGE_WIDTH = 80
+
+MM_PER_INCH = 25.4
+
+# (путь, ширина мм, dpi, фильтр) -> (отпечаток файла, RasterImageInfo)
+_prepared = {}
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _prepare(path, width_mm, image_filter):
+    """PNG -> уменьшенная картинка -> готовый для PDF поток (как это делает fpdf внутри image())"""
+    from PIL import Image
+    from fpdf.image_parsing import get_img_info
+
+    with Image.open(path) as img:
+        img.load()
+        target = round(width_mm / MM_PER_INCH * IMAGE_DPI)
+        if img.width > target:
+            height = max(1, round(img.height * target / img.width))
+            img = img.resize((target, height), Image.LANCZOS)
+        return get_img_info(path, img, image_filter)
+
+
+def _get(path, width_mm, image_filter):
+    """Готовая картинка из кэша процесса (перечитываем, если файл поменялся). None - не вышло"""
+    key = (path, width_mm, IMAGE_DPI, image_filter)
+    stamp = _stamp(path)
+    entry = _prepared.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    if stamp is None:
+        return None
+    try:
+        info = _prepare(path, width_mm, image_filter)
+    except Exception as e:
+        logging.warning(f"Images: не удалось подготовить {path}: {e}")
+        return None
+    _prepared[key] = (stamp, info)
+    return info
+
+
+def use_image(pdf, path, width_mm):
+    """
+    Кладет в pdf.image_cache готовую картинку под именем path.
+    Дальше обычный pdf.image(path, ...) берет ее оттуда. Если что-то пошло не так -
+    ничего не делаем, и fpdf прочитает исходный файл сам.
+    """
+    cache = pdf.image_cache
+    if path in cache.images:
+        return
+    prepared = _get(path, width_mm, cache.image_filter)
+    if prepared is None:
+        return
+
+    # Копия на документ: номер картинки и счетчик использований у каждого PDF свои,
+    # а сжатые данные (bytes) общие
+    info = type(prepared)(prepared)
+    info["i"] = len(cache.images) + 1
+    info["usages"] = 0
+    info["iccp_i"] = None
+    iccp = info.get("iccp")
+    if iccp is not None:
+        info["iccp_i"] = cache.icc_profiles.setdefault(iccp, len(cache.icc_profiles))
+        info["iccp"] = None
+    cache.images[path] = info
+
+
+def warm_up():
+    """Готовим все известные картинки заранее (в воркере пула при старте)"""
+    from fpdf.image_datastructures import ImageCache
+
+    image_filter = ImageCache().image_filter
+    widths = dict(PRINT_WIDTHS)
+    for product in catalog.current().products.values():
+        widths.setdefault(product['image'], PRODUCT_IMAGE_WIDTH)
+    for path, width_mm in widths.items():
+        _get(path, width_mm, image_filter)
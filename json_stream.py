@@ -0,0 +1,80 @@
+# json_stream.py
+# Разбор JSON из ответа модели по мере прихода токенов.
+# - Понимает, когда закрылась внешняя фигурная скобка (дальше модель можно не слушать).
+# - По дороге отдает уже распознанные простые поля (клиент, товар, грунт...) для живого предпросмотра.
+import json
+import re
+
+# Простые поля заказа верхнего уровня, которые можно показать до конца ответа
+PREVIEW_FIELDS = ("client_name", "address", "product_id", "soil", "pipe_length", "diamond_drilling")
+
+_FIELD_RE = re.compile(
+    r'"(' + "|".join(PREVIEW_FIELDS) + r')"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|true|false|null)\s*[,}\n]'
+)
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.buffer = []  # куски текста начиная с первой "{"
+        self.done = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """Добавить кусок ответа. True - внешний объект закрылся, можно разбирать"""
+        if self.done:
+            return True
+        start = 0
+        if not self._started:
+            # Пропускаем болтовню и ```json до первой скобки
+            start = chunk.find("{")
+            if start < 0:
+                return False
+            self._started = True
+
+        for i in range(start, len(chunk)):
+            ch = chunk[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.buffer.append(chunk[start:i + 1])
+                    self.done = True
+                    return True
+
+        self.buffer.append(chunk[start:])
+        return False
+
+    def text(self):
+        return "".join(self.buffer)
+
+    def fields(self):
+        """Уже полностью пришедшие простые поля: {"client_name": "Иван", "soil": "clay", ...}"""
+        found = {}
+        for name, raw in _FIELD_RE.findall(self.text()):
+            try:
+                found[name] = json.loads(raw)
+            except ValueError:
+                pass
+        return found
+
+    def result(self):
+        """Готовый объект (после того как feed вернул True), иначе None"""
+        if not self.done:
+            return None
+        try:
+            return json.loads(self.text())
+        except ValueError:
+            return None
@@ -0,0 +1,220 @@
+# kp_templates.py
+# Скомпилированные фрагменты КП: шапка страницы и блок товара.
+# Они зависят только от модели (товар из каталога) и заголовка, а не от заказа, поэтому
+# раскладка (переносы строк multi_cell, координаты колонок) считается один раз на процесс,
+# а при печати только "проигрывается" готовый список команд FPDF.
+# Поменялся товар в catalog.json (или картинка) -> другой отпечаток -> шаблон пересобирается.
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from image_assets import use_image
+
+FONT_FAMILY = "MyFont"
+
+LOGO_PATH = "assets/logo.png"
+CONTACTS = "Тел: +7(960)879-13-62\nEmail: vlg-septik@yandex.ru\nСайт: www.vlg-septik.ru"
+
+# Сколько скомпилированных шаблонов держим (моделей единицы, запас на правки прайса)
+TEMPLATES_MAX = 64
+
+# Картинки (логотип, фото станций) перепроверяем os.stat не чаще раза в N сек, а не на каждой странице
+IMAGE_STAMP_TTL = 30.0
+
+_compiled = OrderedDict()  # отпечаток -> tuple команд
+_stamps = {}  # путь картинки -> (отпечаток, когда снят)
+# id(товар) -> (товар, sha256): товары снимка каталога не меняются, хэш считаем раз на версию каталога.
+# Сам товар держим в записи - пока он жив, его id не достанется другому dict
+_digests = OrderedDict()
+
+
+# ================= ПРОИГРЫВАНИЕ =================
+# Команды:
+#   ("font", style, size)            ("color", r, g, b)
+#   ("xy", x, y)  - абсолютные координаты       ("at", x, dy) - относительно метки
+#   ("mark",)     - метка = текущий Y            ("y", dy)    - set_y(метка + dy)
+#   ("cell", w, h, text, ln, align)  ("multi", w, h, text) - строка, которую надо переносить с выравниванием
+#   ("image", path, x, dy, w)        ("ln", h)
+
+def replay(pdf, ops):
+    y0 = pdf.get_y()
+    for op in ops:
+        code = op[0]
+        if code == "cell":
+            pdf.cell(op[1], op[2], op[3], 0, op[4], op[5])
+        elif code == "font":
+            pdf.set_font(FONT_FAMILY, op[1], op[2])
+        elif code == "at":
+            pdf.set_xy(op[1], y0 + op[2])
+        elif code == "color":
+            pdf.set_text_color(op[1], op[2], op[3])
+        elif code == "xy":
+            pdf.set_xy(op[1], op[2])
+        elif code == "mark":
+            y0 = pdf.get_y()
+        elif code == "y":
+            pdf.set_y(y0 + op[1])
+        elif code == "multi":
+            pdf.multi_cell(op[1], op[2], op[3])
+        elif code == "image":
+            # Уменьшенная и уже сжатая картинка из кэша процесса (image_assets)
+            use_image(pdf, op[1], op[4])
+            pdf.image(op[1], x=op[2], y=y0 + op[3], w=op[4])
+        elif code == "ln":
+            pdf.ln(op[1])
+
+
+def _text_lines(pdf, ops, x, dy, w, h, text, align="L"):
+    """
+    multi_cell -> готовые строки. Одна строка - обычный cell (переносы уже не нужны).
+    Несколько строк при выравнивании по ширине оставляем multi_cell (cell не умеет "J").
+    Возвращает новый dy.
+    """
+    lines = pdf.multi_cell(w, h, text, align=align, dry_run=True, output="LINES")
+    if len(lines) > 1 and align == "J":
+        ops.append(("at", x, dy))
+        ops.append(("multi", w, h, text))
+        return dy + h * len(lines)
+    for line in lines:
+        ops.append(("at", x, dy))
+        ops.append(("cell", w, h, line, 0, "R" if align == "R" else "L"))
+        dy += h
+    return dy
+
+
+def _scratch():
+    """Черновой документ со шрифтами: на нем меряем строки при компиляции (живой документ не трогаем)"""
+    from fpdf import FPDF
+    from font_cache import add_fonts
+    pdf = FPDF()
+    add_fonts(pdf, ('', 'B', 'I'), family=FONT_FAMILY)
+    pdf.add_page()
+    return pdf
+
+
+def _remember(key, ops):
+    _compiled[key] = ops
+    while len(_compiled) > TEMPLATES_MAX:
+        _compiled.popitem(last=False)
+    return ops
+
+
+def _image_stamp(path):
+    now = time.monotonic()
+    cached = _stamps.get(path)
+    if cached is not None and now - cached[1] < IMAGE_STAMP_TTL:
+        return cached[0]
+    try:
+        st = os.stat(path)
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        stamp = "-"
+    _stamps[path] = (stamp, now)
+    return stamp
+
+
+# ================= ШАПКА СТРАНИЦЫ =================
+
+def compile_header(pdf, title):
+    # Шапка в абсолютных координатах страницы: метка на y=0
+    ops = [("xy", 0, 0), ("mark",)]
+    # 1. Логотип (слева): x=10, y=8, w=40
+    if os.path.exists(LOGO_PATH):
+        ops.append(("image", LOGO_PATH, 10, 8, 40))
+    # 2. Контакты компании (справа вверху), серым
+    ops.append(("font", "", 9))
+    ops.append(("color", 100, 100, 100))
+    pdf.set_font(FONT_FAMILY, "", 9)
+    _text_lines(pdf, ops, 120, 10, 80, 4, CONTACTS, align="R")
+    # 3. Заголовок документа
+    ops.append(("xy", pdf.l_margin, 30))
+    ops.append(("font", "B", 16))
+    ops.append(("color", 0, 0, 0))
+    ops.append(("cell", 0, 10, title, 1, "C"))
+    ops.append(("ln", 2))
+    return tuple(ops)
+
+
+def draw_header(pdf, title):
+    key = ("header", title, _image_stamp(LOGO_PATH))
+    ops = _compiled.get(key)
+    if ops is None:
+        ops = _remember(key, compile_header(_scratch(), title))
+    replay(pdf, ops)
+
+
+# ================= БЛОК ТОВАРА =================
+
+def compile_product_block(pdf, product, with_media=True):
+    ops = [
+        # Заголовок товара (Синий)
+        ("font", "B", 14), ("color", 0, 102, 204), ("cell", 0, 8, product['name'], 1, "L"),
+        # Подзаголовок (Маркетинговый)
+        ("font", "I", 10), ("color", 50, 50, 50),
+        ("cell", 0, 6, product.get('marketing_title', 'Надежное решение'), 1, "L"),
+        ("ln", 4),
+    ]
+    if not with_media:
+        # Картинка и характеристики уходят отдельным файлом (брошюра, static_media)
+        ops += [("font", "", 9),
+                ("cell", 0, 5, "Фото, характеристики и преимущества модели - в приложенной брошюре.", 1, "L"),
+                ("ln", 6)]
+        return tuple(ops)
+
+    # Начало колонок
+    ops.append(("mark",))
+
+    # --- КОЛОНКА 1 (ЛЕВАЯ): КАРТИНКА шириной 80 мм ---
+    if os.path.exists(product['image']):
+        ops.append(("image", product['image'], 10, 0, 80))
+
+    # --- КОЛОНКА 2 (ПРАВАЯ): ХАРАКТЕРИСТИКИ (x=95) ---
+    ops += [("at", 95, 0), ("font", "B", 10), ("color", 0, 0, 0),
+            ("cell", 0, 6, "Технические характеристики:", 1, "L")]
+    dy = 6
+    ops.append(("font", "", 9))
+    for spec in product.get('specs_list', []):
+        ops.append(("at", 95, dy))
+        ops.append(("cell", 0, 5, f"- {spec}", 1, "L"))
+        dy += 5
+    dy += 3
+
+    # Блок "Преимущества" (Маркетинг)
+    ops += [("at", 95, dy), ("font", "B", 10), ("cell", 0, 6, "Почему выбирают эту модель:", 1, "L")]
+    dy += 6
+    ops.append(("font", "", 9))
+    pdf.set_font(FONT_FAMILY, "", 9)
+    for feat in product.get('features', []):
+        dy = _text_lines(pdf, ops, 95, dy, 100, 5, feat, align="J")
+
+    # Курсор ниже самой длинной колонки (картинки или текста) + запас
+    ops.append(("y", 65))
+    return tuple(ops)
+
+
+def _product_digest(product):
+    cached = _digests.get(id(product))
+    if cached is not None and cached[0] is product:
+        return cached[1]
+    raw = json.dumps(product, ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    _digests[id(product)] = (product, digest)
+    while len(_digests) > TEMPLATES_MAX:
+        _digests.popitem(last=False)
+    return digest
+
+
+def product_key(product, with_media):
+    return ("product", _product_digest(product), _image_stamp(product.get('image', '')), with_media)
+
+
+def draw_product_block(pdf, product, with_media=True):
+    key = product_key(product, with_media)
+    ops = _compiled.get(key)
+    if ops is None:
+        ops = _remember(key, compile_product_block(_scratch(), product, with_media))
+    else:
+        _compiled.move_to_end(key)
+    replay(pdf, ops)
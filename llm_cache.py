@@ -0,0 +1,166 @@
+# llm_cache.py
+# Кэш ответов нейросети по содержимому запроса.
+# Ключ = нормализованный текст прораба + канонический JSON текущего заказа + версия промпта.
+# Повторное "Тверь 0.8 песок 10 метров" отдается из памяти за микросекунды вместо похода в DeepSeek.
+# Уровни: LRU в памяти -> (опционально) SQLite на диске.
+# Хендлеры зовут aget()/aput(): SQLite читается и пишется в отдельном потоке, event loop его не ждет.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+# Путь к SQLite-файлу дискового уровня (пусто - только память)
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+LLM_CACHE_DISK_MAX = int(os.getenv("LLM_CACHE_DISK_MAX", "50000"))
+# Как часто (раз в N записей) подрезаем дисковый уровень до LLM_CACHE_DISK_MAX
+_TRIM_EVERY = 100
+
+
+def normalize_text(text):
+    """Регистр и лишние пробелы не меняют смысл заказа"""
+    return " ".join(text.split()).casefold()
+
+
+def make_key(text, current_data=None, prompt_version=""):
+    state = json.dumps(current_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    raw = f"{prompt_version}\x00{normalize_text(text)}\x00{state}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, db_path=LLM_CACHE_DB,
+                 disk_max_entries=LLM_CACHE_DISK_MAX):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.disk_max_entries = disk_max_entries
+        # key -> (json-строка результата, истекает_в)
+        self._mem = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_puts = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Результат разбора (новый dict на каждый вызов) или None. Промах по памяти читает SQLite прямо в loop"""
+        entry = self._mem.get(key)
+        if entry is None:
+            entry = self._from_disk(key, self._disk_get(key))
+        return self._result(key, entry)
+
+    async def aget(self, key):
+        """get() для хендлеров: промах по памяти читает SQLite в отдельном потоке"""
+        entry = self._mem.get(key)
+        if entry is None and self.db_path:
+            row = await asyncio.to_thread(self._disk_get, key)
+            # Пока читали, ответ могли положить в память - он не старше диска
+            entry = self._mem.get(key) or self._from_disk(key, row)
+        return self._result(key, entry)
+
+    def _from_disk(self, key, row):
+        if row is not None:
+            self.disk_hits += 1
+            self._mem_put(key, row)
+        return row
+
+    def _result(self, key, entry):
+        if entry is None or entry[1] < time.time():
+            self._mem.pop(key, None)
+            self.misses += 1
+            return None
+        self._mem.move_to_end(key)
+        self.hits += 1
+        # Отдаем копию: хендлеры могут менять заказ, кэш должен остаться нетронутым
+        return json.loads(entry[0])
+
+    def put(self, key, result):
+        entry = (json.dumps(result, ensure_ascii=False), time.time() + self.ttl)
+        self._mem_put(key, entry)
+        self._disk_put(key, entry)
+
+    async def aput(self, key, result):
+        """put() для хендлеров: запись в SQLite - в отдельном потоке"""
+        entry = (json.dumps(result, ensure_ascii=False), time.time() + self.ttl)
+        self._mem_put(key, entry)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_put, key, entry)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._mem),
+        }
+
+    def _mem_put(self, key, entry):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    # ================= ДИСК (опционально) =================
+
+    def _connect(self):
+        if self._db is None and self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _disk_get(self, key):
+        try:
+            with self._db_lock:
+                db = self._connect()
+                if db is None:
+                    return None
+                row = db.execute("SELECT data, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    with db:
+                        db.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+                return row
+        except sqlite3.Error as e:
+            logging.warning(f"LLM cache: ошибка чтения с диска: {e}")
+            return None
+
+    def _disk_put(self, key, entry):
+        try:
+            with self._db_lock:
+                db = self._connect()
+                if db is None:
+                    return
+                self._disk_puts += 1
+                with db:
+                    db.execute("INSERT OR REPLACE INTO llm_cache (key, data, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                               (key, entry[0], entry[1], time.time()))
+                    if self._disk_puts % _TRIM_EVERY:
+                        return
+                    # Ограничение размера: выкидываем просроченные и самые давно использованные
+                    db.execute(
+                        "DELETE FROM llm_cache WHERE expires_at < ? OR key IN ("
+                        "SELECT key FROM llm_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                        (time.time(), self.disk_max_entries),
+                    )
+        except sqlite3.Error as e:
+            logging.warning(f"LLM cache: ошибка записи на диск: {e}")
+
+
+# Общий кэш разборов на процесс
+parse_cache = LLMCache()
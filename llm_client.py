@@ -0,0 +1,251 @@
+# llm_client.py
+# Асинхронный клиент DeepSeek (OpenAI-совместимый API).
+# Один общий пул HTTP-соединений с keep-alive на весь процесс:
+# запросы разных прорабов летят параллельно и не блокируют event loop бота.
+import asyncio
+import logging
+import os
+import time
+from typing import NamedTuple
+
+# openai и httpx импортируются в get_client(): SDK грузится ~0.5 с, а боту для старта он не нужен
+
+AI_API_KEY = os.getenv("AI_API_KEY")
+# Настройки для DeepSeek (AI_BASE_URL - любой OpenAI-совместимый сервер, например llm_stub.py для нагрузочных тестов)
+AI_BASE_URL = os.getenv("AI_BASE_URL", "https://api.deepseek.com")
+AI_MODEL = "deepseek-chat"
+
+# Таймауты (сек). AI_TIMEOUT - потолок на весь вызов, включая ожидание ответа модели
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "40"))
+AI_CONNECT_TIMEOUT = 5.0
+
+# Пул соединений: сколько запросов к модели может висеть одновременно
+# и сколько "тёплых" соединений держим открытыми между запросами
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "50"))
+AI_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_KEEPALIVE_CONNECTIONS", "20"))
+AI_KEEPALIVE_EXPIRY = 120.0
+
+# Повторы делаем сами (через План Б), поэтому внутренние ретраи SDK минимальны
+AI_MAX_RETRIES = 1
+
+# Потоковый режим: ответ модели читаем по мере генерации (AI_STREAM=0 - выключить)
+AI_STREAM = os.getenv("AI_STREAM", "1") != "0"
+
+# Сколько (сек) дочитываем хвост потока в фоне ради usage, когда ответ уже разобран
+AI_USAGE_GRACE = float(os.getenv("AI_USAGE_GRACE", "1.0"))
+
+_client = None
+_drains = set()
+
+
+# ================= УЧЕТ ТОКЕНОВ И ВРЕМЕНИ =================
+
+class CallUsage(NamedTuple):
+    prompt_tokens: int
+    cached_tokens: int  # Сколько токенов промпта провайдер взял из своего кэша
+    completion_tokens: int
+    ttft: float  # сек до первого токена ответа
+    latency: float  # сек на весь вызов
+    has_usage: bool  # False - провайдер не прислал usage (поток оборвали раньше)
+
+
+class UsageStats:
+    """Счетчики по всем вызовам модели за время жизни процесса"""
+
+    def __init__(self):
+        self.calls = 0
+        self.calls_without_usage = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.ttft_total = 0.0
+        self.latency_total = 0.0
+        self.last = None
+
+    def record(self, call):
+        self.calls += 1
+        self.last = call
+        if call.has_usage:
+            self.prompt_tokens += call.prompt_tokens
+            self.cached_tokens += call.cached_tokens
+            self.completion_tokens += call.completion_tokens
+        else:
+            self.calls_without_usage += 1
+        self.ttft_total += call.ttft
+        self.latency_total += call.latency
+        logging.info(
+            f"LLM: prompt={call.prompt_tokens} (cached {call.cached_tokens}) "
+            f"completion={call.completion_tokens} ttft={call.ttft:.2f}s total={call.latency:.2f}s"
+        )
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "calls_without_usage": self.calls_without_usage,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hit_rate": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "avg_ttft": round(self.ttft_total / self.calls, 3) if self.calls else 0.0,
+            "avg_latency": round(self.latency_total / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+usage = UsageStats()
+
+
+def _cached_tokens(u):
+    """DeepSeek: prompt_cache_hit_tokens, OpenAI-стиль: prompt_tokens_details.cached_tokens"""
+    hit = getattr(u, "prompt_cache_hit_tokens", None)
+    if hit is None and u.prompt_tokens_details is not None:
+        hit = u.prompt_tokens_details.cached_tokens
+    return hit or 0
+
+
+def _record(u, started, first_token_at):
+    now = time.perf_counter()
+    ttft = (first_token_at or now) - started
+    if u is None:
+        usage.record(CallUsage(0, 0, 0, ttft, now - started, False))
+    else:
+        usage.record(CallUsage(u.prompt_tokens, _cached_tokens(u), u.completion_tokens, ttft, now - started, True))
+
+
+def get_client():
+    """Общий AsyncOpenAI на процесс (создается при первом обращении)"""
+    global _client
+    if _client is None:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=AI_MAX_CONNECTIONS,
+                max_keepalive_connections=AI_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=Timeout(AI_TIMEOUT, connect=AI_CONNECT_TIMEOUT),
+        )
+        _client = AsyncOpenAI(
+            api_key=AI_API_KEY,
+            base_url=AI_BASE_URL,
+            http_client=http_client,
+            max_retries=AI_MAX_RETRIES,
+        )
+    return _client
+
+
+async def chat_completion(messages, timeout=AI_TIMEOUT, temperature=0.1):
+    """
+    Один запрос к модели. Возвращает текст ответа.
+    timeout - жесткий потолок на весь вызов (с учетом ретраев SDK).
+    Отмена задачи (task.cancel()) сразу обрывает HTTP-запрос.
+    """
+    client = get_client()
+    started = time.perf_counter()
+    response = await asyncio.wait_for(
+        client.chat.completions.create(
+            model=AI_MODEL,
+            messages=messages,
+            temperature=temperature,
+            stream=False,
+            timeout=timeout,
+        ),
+        timeout=timeout,
+    )
+    # Без потока первый токен приходит вместе с последним
+    _record(response.usage, started, None)
+    return response.choices[0].message.content
+
+
+async def stream_chat_completion(messages, timeout=AI_TIMEOUT, temperature=0.1):
+    """
+    Потоковый запрос: async-генератор кусочков текста по мере генерации.
+    timeout - потолок на весь ответ целиком. Если вызывающий код выходит из цикла раньше
+    (например, JSON уже закрылся), поток закрывается и модель перестает генерировать.
+    """
+    client = get_client()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    started = time.perf_counter()
+    first_token_at = None
+    call_usage = None
+    stream = await asyncio.wait_for(
+        client.chat.completions.create(
+            model=AI_MODEL,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            # usage приходит последним куском (если дочитали поток до конца)
+            stream_options={"include_usage": True},
+            timeout=timeout,
+        ),
+        timeout=timeout,
+    )
+    try:
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                break
+            if chunk.usage is not None:
+                call_usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+        _record(call_usage, started, first_token_at)
+
+
+async def _read_all(chunks):
+    async for _ in chunks:
+        pass
+
+
+async def _drain(chunks):
+    # wait_for, а не asyncio.timeout: тот появился только в Python 3.11, а бот работает и на 3.10
+    try:
+        await asyncio.wait_for(_read_all(chunks), AI_USAGE_GRACE)
+    except Exception:
+        pass
+    finally:
+        await chunks.aclose()
+
+
+def finish_stream(chunks):
+    """
+    Ответ уже получен, хвост потока не нужен вызывающему коду. Дочитываем его в фоне
+    (не дольше AI_USAGE_GRACE), чтобы получить usage последним куском, затем закрываем.
+    """
+    if AI_USAGE_GRACE <= 0:
+        return asyncio.ensure_future(chunks.aclose())
+    task = asyncio.create_task(_drain(chunks))
+    _drains.add(task)
+    task.add_done_callback(_drains.discard)
+    return task
+
+
+async def warm_up():
+    """Прогрев при старте: импорт SDK + TCP/TLS-соединение в пул keep-alive (первый запрос не ждет рукопожатия)"""
+    client = get_client()
+    try:
+        await client.with_options(max_retries=0, timeout=AI_CONNECT_TIMEOUT * 2).models.list()
+    except Exception as e:
+        # 401/404 тоже годятся: соединение уже открыто и осталось в пуле
+        logging.debug(f"LLM warm-up: {e}")
+
+
+async def close():
+    """Закрываем пул соединений при остановке бота"""
+    global _client
+    if _drains:
+        await asyncio.gather(*_drains, return_exceptions=True)
+    if _client is not None:
+        try:
+            await _client.close()
+        except Exception as e:
+            logging.warning(f"LLM client close error: {e}")
+        _client = None
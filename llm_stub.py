@@ -0,0 +1,205 @@
+# llm_stub.py
+# Локальная заглушка DeepSeek (OpenAI-совместимый /chat/completions) для нагрузочных тестов.
+# Отвечает правдоподобным JSON заказа (или патчем {"ops": [...]} на правку), умеет поток (SSE)
+# с usage последним куском, задержки и сбои: 500, 429, зависание, мусор вместо JSON, обрыв потока.
+#
+#   python llm_stub.py --port 8765 --latency 0.8 --token-delay 0.01 --error-rate 0.05
+#   AI_BASE_URL=http://127.0.0.1:8765 AI_API_KEY=stub python main.py
+#
+# GET /stats - счетчики запросов и исходов (их забирает loadtest.py).
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import NamedTuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_MODEL = "deepseek-chat"
+
+
+class StubConfig(NamedTuple):
+    latency: float = 0.5  # сек до первого токена (в среднем)
+    jitter: float = 0.3  # разброс задержки: latency * (1 ± jitter)
+    token_delay: float = 0.01  # сек между кусками потока
+    chunk_chars: int = 12  # символов в одном куске потока
+    error_rate: float = 0.0  # доля ответов 500
+    rate_limit_rate: float = 0.0  # доля ответов 429
+    hang_rate: float = 0.0  # доля запросов, на которые не отвечаем (клиент упрется в таймаут)
+    garbage_rate: float = 0.0  # доля ответов текстом без JSON
+    cut_rate: float = 0.0  # доля потоков, оборванных на середине
+    seed: int = 0
+
+
+# ================= ОТВЕТЫ =================
+
+SERVICE_KEYS = ("cable_laying", "socket_install", "heating_cable", "hole_in_ring", "manual_sand_transport")
+PATCH_FIELDS = (("l", lambda rnd: rnd.randint(3, 30)), ("s", lambda rnd: rnd.choice(["sand", "clay"])),
+                ("d", lambda rnd: rnd.random() < 0.5))
+
+
+def _is_edit(messages):
+    # Промпт правки содержит формат патча (prompts.EDIT_PROMPT -> order_patch.PATCH_HINT)
+    return any('"ops"' in str(m.get("content", "")) for m in messages if m.get("role") == "system")
+
+
+def make_answer(messages, rnd):
+    if _is_edit(messages):
+        field, value = rnd.choice(PATCH_FIELDS)
+        ops = [{"op": "set", "f": field, "v": value(rnd)}]
+        if rnd.random() < 0.3:
+            ops.append({"op": "add", "v": {"k": rnd.choice(SERVICE_KEYS), "q": rnd.randint(1, 10)}})
+        return json.dumps({"ops": ops})
+    order = {
+        "client_name": rnd.choice(["Иванов", "Петров", "Сидоров", "Кузнецов"]),
+        "address": f"СНТ Дружба, участок {rnd.randint(1, 300)}",
+        "product_id": rnd.choice(["tver_08", "tver_11"]),
+        "soil": rnd.choice(["sand", "clay"]),
+        "pipe_length": rnd.randint(3, 25),
+        "diamond_drilling": rnd.random() < 0.5,
+        "custom_items": [{"service_key": rnd.choice(SERVICE_KEYS), "qty": rnd.randint(1, 10)}
+                         for _ in range(rnd.randint(0, 3))],
+    }
+    # Как настоящая модель: JSON в блоке кода
+    return "```json\n" + json.dumps(order, ensure_ascii=False, indent=1) + "\n```"
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+def make_usage(messages, answer):
+    prompt = _tokens("".join(str(m.get("content", "")) for m in messages))
+    # Системные сообщения - общий префикс, провайдер берет их из кэша
+    cached = _tokens("".join(str(m.get("content", "")) for m in messages if m.get("role") == "system"))
+    completion = _tokens(answer)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_cache_hit_tokens": min(cached, prompt),
+        "prompt_cache_miss_tokens": max(prompt - cached, 0),
+    }
+
+
+def _chunk(call_id, created, delta, finish_reason=None, usage=None):
+    body = {
+        "id": call_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": STUB_MODEL,
+        "choices": [] if usage is not None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        body["usage"] = usage
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+
+# ================= СЕРВЕР =================
+
+def create_app(config=StubConfig()):
+    app = FastAPI()
+    rnd = random.Random(config.seed)
+    stats = Counter()
+
+    def delay():
+        return max(0.0, config.latency * (1 + rnd.uniform(-config.jitter, config.jitter)))
+
+    def pick_outcome():
+        roll = rnd.random()
+        for outcome, rate in (("error", config.error_rate), ("rate_limit", config.rate_limit_rate),
+                              ("hang", config.hang_rate), ("garbage", config.garbage_rate),
+                              ("cut", config.cut_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return "ok"
+
+    async def completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        stream = bool(body.get("stream"))
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        outcome = pick_outcome()
+        stats["requests"] += 1
+        stats[outcome] += 1
+        stats["stream" if stream else "plain"] += 1
+
+        if outcome == "hang":
+            # Держим соединение, пока клиент не отвалится по таймауту
+            await asyncio.sleep(3600)
+        await asyncio.sleep(delay())
+        if outcome == "error":
+            return JSONResponse({"error": {"message": "stub: internal error", "type": "server_error"}},
+                                status_code=500)
+        if outcome == "rate_limit":
+            return JSONResponse({"error": {"message": "stub: rate limit", "type": "rate_limit_error"}},
+                                status_code=429, headers={"retry-after": "1"})
+
+        answer = "Извините, не могу разобрать заказ." if outcome == "garbage" else make_answer(messages, rnd)
+        usage = make_usage(messages, answer)
+        call_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not stream:
+            return JSONResponse({
+                "id": call_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": STUB_MODEL,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def events():
+            yield _chunk(call_id, created, {"role": "assistant", "content": ""})
+            step = max(1, config.chunk_chars)
+            cut_at = len(answer) // 2 if outcome == "cut" else None
+            for i in range(0, len(answer), step):
+                if cut_at is not None and i >= cut_at:
+                    # Провайдер закрыл поток посреди ответа: ни finish_reason, ни usage, ни [DONE]
+                    return
+                yield _chunk(call_id, created, {"content": answer[i:i + step]})
+                if config.token_delay:
+                    await asyncio.sleep(config.token_delay)
+            yield _chunk(call_id, created, {}, finish_reason="stop")
+            if include_usage:
+                yield _chunk(call_id, created, {}, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # DeepSeek: base_url без /v1, OpenAI: с /v1 - принимаем оба
+    app.add_api_route("/chat/completions", completions, methods=["POST"])
+    app.add_api_route("/v1/chat/completions", completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    defaults = StubConfig()
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка модели для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for field in StubConfig._fields:
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(getattr(defaults, field)),
+                            default=getattr(defaults, field))
+    args = parser.parse_args(argv)
+    config = StubConfig(**{field: getattr(args, field) for field in StubConfig._fields})
+    print(f"LLM stub: http://{args.host}:{args.port} {config}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
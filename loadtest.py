@@ -0,0 +1,361 @@
+# loadtest.py
+# Нагрузочный тест бота целиком, без DeepSeek и без Telegram:
+# - llm_stub.py (отдельный процесс) отвечает вместо модели - с задержками и сбоями;
+# - FakeTelegramSession (fake_telegram.py) записывает всё, что бот отправил бы в Telegram;
+# - драйвер кормит синтетическими апдейтами диспетчеры main.py и webapp.py (dp.feed_update).
+#
+# Сценарий одного прораба: новый заказ текстом -> N правок -> кнопка print_docs,
+# плюс заказ из WebApp (web_app_data) во втором боте. Прорабов запускаем одновременно
+# ступенями (--users 1,5,10,25) и для каждой ступени считаем пропускную способность
+# и p50/p95/p99 задержки по этапам.
+#
+#   python loadtest.py --users 1,5,10 --edits 2 --latency 0.8 --error-rate 0.02 --json loadtest.json
+#   TRACE_FILE=traces.jsonl PROFILE_SLOW=2 PROFILE_DIR=profiles python loadtest.py --users 10
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+STAGES = ("new_order", "edit", "print_docs", "web_app_data")
+
+EDITS = (
+    "сделай трубу {n} метров",
+    "добавь прокладку кабеля {n} м",
+    "грунт глина, бурение не нужно",
+    "поменяй на тверь 11",
+)
+
+
+# ================= ОКРУЖЕНИЕ =================
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_env(stub_url, tmp_dir, coalesce_window):
+    """До импорта main / webapp: ключи-заглушки, адрес заглушки модели, кэши во временной папке"""
+    os.environ.setdefault("TELEGRAM_TOKEN", "123456:loadtest")
+    os.environ["AI_API_KEY"] = "stub"
+    os.environ["AI_BASE_URL"] = stub_url
+    os.environ["BOT_MODE"] = "polling"
+    os.environ["SEPTIC_CACHE_DIR"] = os.path.join(tmp_dir, "cache")
+    os.environ["SESSIONS_DB"] = os.path.join(tmp_dir, "sessions.sqlite3")
+    if coalesce_window is not None:
+        os.environ["COALESCE_WINDOW"] = str(coalesce_window)
+
+
+async def start_stub(port, stub_args):
+    """llm_stub.py отдельным процессом (его JSON и SSE не едят CPU бота). Ждем, пока поднимется"""
+    import httpx
+
+    proc = subprocess.Popen([sys.executable, "llm_stub.py", "--port", str(port), *stub_args])
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            if proc.poll() is not None:
+                raise RuntimeError("llm_stub.py не запустился")
+            try:
+                await client.get(url + "/stats")
+                return proc
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("llm_stub.py не отвечает")
+
+
+async def stub_stats(url):
+    import httpx
+
+    try:
+        async with httpx.AsyncClient() as client:
+            return (await client.get(url + "/stats")).json()
+    except httpx.HTTPError:
+        return {}
+
+
+# ================= СИНТЕТИЧЕСКИЕ АПДЕЙТЫ =================
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_id = 0
+        self._message_id = 10_000_000
+
+    def _next(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    @staticmethod
+    def _user(uid):
+        return {"id": uid, "is_bot": False, "first_name": f"Прораб {uid}"}
+
+    def _message(self, uid, **fields):
+        update_id, message_id = self._next()
+        msg = {"message_id": message_id, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"}, "from": self._user(uid), **fields}
+        return {"update_id": update_id, "message": msg}
+
+    def text(self, uid, text):
+        return self._message(uid, text=text)
+
+    def web_app_data(self, uid, data):
+        return self._message(uid, web_app_data={"data": json.dumps(data, ensure_ascii=False),
+                                                "button_text": "📝 Открыть смету"})
+
+    def callback(self, uid, data):
+        from fake_telegram import BOT_USER
+        update_id, message_id = self._next()
+        msg = {"message_id": message_id, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"}, "from": BOT_USER, "text": "📋 ИТОГОВЫЕ ДАННЫЕ"}
+        return {"update_id": update_id,
+                "callback_query": {"id": str(update_id), "from": self._user(uid), "chat_instance": str(uid),
+                                   "data": data, "message": msg}}
+
+
+def new_order_text(uid):
+    # Хвост без шаблона ("соседский забор...") локальный разбор не решает -> запрос к модели
+    return (f"Клиент Прораб{uid}, снт Рассвет, участок {uid % 500}, тверь 08, глина, труба {5 + uid % 20} м, "
+            f"проложить кабель 15 м, соседский забор аккуратно")
+
+
+def web_app_order(uid):
+    return {"client_name": f"Заказчик {uid}", "address": f"Волжский, ул. Мира {uid % 300}",
+            "product_id": "tver_11" if uid % 2 else "tver_08", "soil": "sand", "pipe_length": 4 + uid % 15,
+            "diamond_drilling": bool(uid % 3), "custom_items": []}
+
+
+# ================= ДРАЙВЕР =================
+
+class Driver:
+    def __init__(self, session, edits):
+        import main
+        import webapp
+        from aiogram.types import Update
+
+        self.main = main
+        self.webapp = webapp
+        self.Update = Update
+        self.session = session
+        self.edits = edits
+        self.updates = UpdateFactory()
+        # Оба бота ходят в одну записывающую сессию
+        main.bot.session = session
+        webapp.bot.session = session
+        self.samples = defaultdict(list)  # этап -> [сек]
+        self.failures = defaultdict(int)  # этап -> сколько раз исход не тот
+        self.errors = defaultdict(int)  # этап -> исключений из хендлеров
+
+    async def _feed(self, stage, dp, bot, raw, ok):
+        """Один апдейт через диспетчер; ok(новые вызовы Telegram) -> исход сценария"""
+        uid = (raw.get("message") or raw["callback_query"]["message"])["chat"]["id"]
+        sent_before = len(self.session.by_chat[uid])
+        update = self.Update.model_validate(raw, context={"bot": bot})
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            self.errors[stage] += 1
+        self.samples[stage].append(time.perf_counter() - started)
+        calls = self.session.by_chat[uid][sent_before:]
+        if not ok(calls):
+            self.failures[stage] += 1
+        return calls
+
+    async def foreman(self, uid):
+        main, webapp = self.main, self.webapp
+
+        def has_order(calls):
+            return any(c.method == "sendMessage" and "ИТОГОВЫЕ ДАННЫЕ" in c.text for c in calls)
+
+        def has_docs(calls):
+            return any(c.method == "sendMediaGroup" for c in calls)
+
+        calls = await self._feed("new_order", main.dp, main.bot,
+                                 self.updates.text(uid, new_order_text(uid)), has_order)
+        for n in range(self.edits):
+            text = EDITS[n % len(EDITS)].format(n=10 + (uid + n) % 20)
+            calls = await self._feed("edit", main.dp, main.bot, self.updates.text(uid, text), has_order)
+
+        if has_order(calls):
+            # Кнопка "Печать" под последним сообщением с итогом
+            await self._feed("print_docs", main.dp, main.bot, self.updates.callback(uid, "print_docs"), has_docs)
+        else:
+            self.failures["print_docs"] += 1
+
+        await self._feed("web_app_data", webapp.dp, webapp.bot,
+                         self.updates.web_app_data(uid, web_app_order(uid)), has_docs)
+
+    async def run_level(self, users, base_uid):
+        self.samples.clear()
+        self.failures.clear()
+        self.errors.clear()
+        self.session.reset()
+        usage_before = dict(self.main.llm_client.usage.stats())
+        started = time.perf_counter()
+        await asyncio.gather(*[self.foreman(base_uid + n) for n in range(users)])
+        elapsed = time.perf_counter() - started
+        return self._level_report(users, elapsed, usage_before)
+
+    def _level_report(self, users, elapsed, usage_before):
+        updates = sum(len(v) for v in self.samples.values())
+        usage = self.main.llm_client.usage.stats()
+        calls = usage["calls"] - usage_before["calls"]
+        return {
+            "users": users,
+            "seconds": round(elapsed, 3),
+            "updates": updates,
+            "updates_per_sec": round(updates / elapsed, 2),
+            "scenarios_per_sec": round(users / elapsed, 3),
+            "stages": {stage: {**percentiles(self.samples[stage]),
+                               "failed": self.failures[stage], "errors": self.errors[stage]}
+                       for stage in STAGES if self.samples[stage] or self.failures[stage]},
+            "llm_calls": calls,
+            "telegram": self.session.counts(),
+            "uploaded_mb": round(self.session.uploaded() / 1024 / 1024, 2),
+        }
+
+
+# ================= СТАТИСТИКА =================
+
+def percentile(sorted_values, q):
+    """Ближайший ранг: p95 из 20 значений - 19-е"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def percentiles(values):
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "p50": _round(percentile(values, 50)),
+        "p95": _round(percentile(values, 95)),
+        "p99": _round(percentile(values, 99)),
+        "max": _round(values[-1] if values else None),
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def print_level(report):
+    print(f"\n===== {report['users']} прорабов одновременно: {report['seconds']:.1f} с, "
+          f"{report['updates_per_sec']} апдейтов/с, {report['scenarios_per_sec']} сценариев/с =====")
+    print(f"{'этап':<14}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'сбоев':>7}")
+    for stage, row in report["stages"].items():
+        cells = "".join(f"{row[k]:>9.3f}" if row[k] is not None else f"{'-':>9}" for k in ("p50", "p95", "p99", "max"))
+        print(f"{stage:<14}{row['n']:>5}{cells}{row['failed'] + row['errors']:>7}")
+    print(f"Запросов к модели: {report['llm_calls']}, Telegram: {report['telegram']}, "
+          f"загружено {report['uploaded_mb']} МБ")
+
+
+# ================= ЗАПУСК =================
+
+async def run(args):
+    tmp_dir = tempfile.mkdtemp(prefix="septic-loadtest-")
+    stub = None
+    if args.stub_url:
+        stub_url = args.stub_url
+    else:
+        port = _free_port()
+        stub_url = f"http://127.0.0.1:{port}"
+        stub_args = ["--latency", str(args.latency), "--jitter", str(args.jitter),
+                     "--token-delay", str(args.token_delay), "--error-rate", str(args.error_rate),
+                     "--rate-limit-rate", str(args.rate_limit_rate), "--hang-rate", str(args.hang_rate),
+                     "--garbage-rate", str(args.garbage_rate), "--cut-rate", str(args.cut_rate)]
+        stub = await start_stub(port, stub_args)
+    prepare_env(stub_url, tmp_dir, args.coalesce_window)
+
+    # Импорты - только после prepare_env: модули читают настройки при импорте
+    import llm_client
+    import renderer
+    import tracing
+    from fake_telegram import FakeTelegramSession
+
+    session = FakeTelegramSession(latency=args.tg_latency, upload_mbps=args.upload_mbps)
+    driver = Driver(session, args.edits)
+    if not args.verbose:
+        # main.py / webapp.py включают INFO для всего процесса
+        logging.getLogger().setLevel(logging.WARNING)
+    await renderer.start()
+    driver.main.user_orders.start()
+    # Как при старте бота: PROFILE_SLOW=... включает профилировщик медленных апдейтов
+    tracing.start_profiler()
+
+    reports = []
+    try:
+        for level, users in enumerate(args.users):
+            stub_before = await stub_stats(stub_url)
+            # print() хендлеров ("AI Response: ...") на каждый апдейт утопил бы отчет
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+                report = await driver.run_level(users, base_uid=(level + 1) * 1_000_000)
+            stub_after = await stub_stats(stub_url)
+            report["stub"] = {k: v - stub_before.get(k, 0) for k, v in stub_after.items()}
+            print_level(report)
+            reports.append(report)
+    finally:
+        tracing.stop_profiler()
+        tracing.shutdown()
+        renderer.shutdown()
+        await driver.main.user_orders.close()
+        await llm_client.close()
+        if stub is not None:
+            stub.terminate()
+            stub.wait(timeout=5)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        "llm_usage": llm_client.usage.stats(),
+        "levels": reports,
+    }
+
+
+def _users(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест: заглушка модели + подменный Telegram")
+    parser.add_argument("--users", type=_users, default=[1, 5, 10, 25], help="Ступени нагрузки: 1,5,10,25")
+    parser.add_argument("--edits", type=int, default=2, help="Правок на прораба")
+    parser.add_argument("--stub-url", default=None, help="Уже запущенная заглушка (иначе поднимаем свою)")
+    parser.add_argument("--latency", type=float, default=0.8, help="Заглушка: сек до первого токена")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--garbage-rate", type=float, default=0.0)
+    parser.add_argument("--cut-rate", type=float, default=0.0)
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="Telegram: сек на вызов API")
+    parser.add_argument("--upload-mbps", type=float, default=20.0, help="Telegram: канал для PDF (Мбит/с)")
+    parser.add_argument("--coalesce-window", type=float, default=None,
+                        help="COALESCE_WINDOW для теста (по умолчанию - как в боте)")
+    parser.add_argument("--json", default=None, help="Сохранить отчет в JSON")
+    parser.add_argument("--verbose", action="store_true", help="Не глушить логи и print() бота")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"\nОтчет: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
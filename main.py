@@ -1,41 +1,82 @@
 # main.py
+# Замеры холодного старта (импортируется первым, чтобы видеть всю загрузку)
+import startup
+
 import asyncio
-import os
 import json
 import logging
+import os
 import re
+import time
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, \
-    InputMediaDocument
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import CommandStart
-from openai import OpenAI
+
+startup.mark("aiogram")
 
 # Импорт настроек
 from config import TELEGRAM_TOKEN
 
-AI_API_KEY = os.getenv("AI_API_KEY")
-# Настройки для DeepSeek
-AI_BASE_URL = "https://api.deepseek.com"
-AI_MODEL = "deepseek-chat"
+# Асинхронный клиент DeepSeek (общий пул соединений)
+import llm_client
+
+# Разбор JSON на лету (потоковый ответ модели)
+from json_stream import IncrementalJSONParser
+
+# Кэш ответов нейросети (одинаковый запрос -> ответ из памяти)
+from llm_cache import parse_cache, make_key
+
+# Быстрый локальный разбор (регулярки): нейросеть - только для непонятных полей
+from order_parser import parse_local
+
+# Правка заказа патчем (модель возвращает только изменения)
+from order_patch import PatchError, apply_patch, valid_items
+
+# Промпты (собраны один раз на версию каталога, неизменный префикс кэшируется провайдером)
+import prompts
+from prompts import edit_messages, new_order_messages
+
+# Товары и прайс (assets/catalog.json, горячая замена без рестарта)
+import catalog
+
+# Склейка быстрых правок одного пользователя
+from coalescer import Coalescer, Superseded
+
+# Черновики заказов (память + SQLite)
+from session_store import SessionStore
+
+# Прием апдейтов вебхуком (BOT_MODE=webhook)
+import webhook
+
+# Печать PDF: пул процессов (КП + Смета рисуются параллельно, не блокируя бота)
+import renderer
 
-# Импорт ГЕНЕРАТОРОВ (Оба файла должны лежать рядом)
-from pdf_generator import generate_pdf as generate_kp  # Красивое КП
-from estimate_generator import generate_strict_estimate  # Строгая Смета + Инструкции
+# Отправка документов (с кэшем готовых PDF и file_id Telegram)
+from documents import send_order_documents
+
+# Метрики Prometheus (/metrics: в режиме вебхука - на его FastAPI, при поллинге - METRICS_PORT)
+import metrics
+
+# Трассы апдейтов (этапы с временем) + профилировщик медленных запросов
+import tracing
+
+startup.mark("modules")
 
 # Включаем логирование
 logging.basicConfig(level=logging.INFO)
 
-# Настройка нейросети
-ai_client = OpenAI(api_key=AI_API_KEY, base_url=AI_BASE_URL)
-
 # Настройка бота
 bot = Bot(token=TELEGRAM_TOKEN)
 dp = Dispatcher()
 
 # === ПАМЯТЬ БОТА ===
 # Здесь мы храним текущий заказ, пока папа его редактирует
-# Структура: { user_id: {json_data} }
-user_orders = {}
+# Структура: { user_id: {json_data} } - в памяти (LRU/TTL) + SQLite, переживает рестарт
+user_orders = SessionStore()
+metrics.USER_ORDERS.set_function(lambda: len(user_orders))
+
+# Сообщения одного прораба обрабатываются по очереди, пачка правок - одним запросом
+coalescer = Coalescer()
 
 
 # --- ХЕЛПЕР: Вытаскиваем JSON из ответа ---
@@ -54,133 +95,133 @@ def extract_json_from_response(text):
 # --- ПЛАН Б: РУЧНОЙ ПОИСК (Если AI сломался) ---
 def parse_order_manually(text):
     logging.info("⚠️ Использую ручной режим (Regex)...")
-    original_text = text
-    text = text.lower()
-    data = {}
-
-    # 1. Имя
-    name_match = re.search(r'(клиент|заказчик|зовут)\s+([А-Яа-яA-Za-z]+)', original_text, re.IGNORECASE)
-    data['client_name'] = name_match.group(2).capitalize() if name_match else "Клиент"
-
-    # 2. Товар
-    if any(w in text for w in ['1.1', 'большая', 'единичка', 'один и один']):
-        data['product_id'] = 'tver_11'
-    elif 'евролос' in text:
-        data['product_id'] = 'eurolos'
-    else:
-        data['product_id'] = 'tver_08'
-
-    # 3. Грунт
-    if any(w in text for w in ['глина', 'суглинок', 'тяжело', 'твердый']):
-        data['soil'] = 'clay'
-    else:
-        data['soil'] = 'sand'
-
-    # 4. Труба (число)
-    meters_match = re.search(r'(\d+)\s*(м|метр)', text)
-    data['pipe_length'] = int(meters_match.group(1)) if meters_match else 5
-
-    # 5. Бурение
-    if any(w in text for w in ['бур', 'прокол', 'фундамент', 'дырк', 'алмаз']):
-        data['diamond_drilling'] = True
-    else:
-        data['diamond_drilling'] = False
-
-    # 6. Адрес
-    address_match = re.search(r'(адрес|снт|улица|ул\.|поселок|г\.|город)\s+([А-Яа-я0-9\s\.\-]{3,20})', original_text,
-                              re.IGNORECASE)
-    data['address'] = f"{address_match.group(1)} {address_match.group(2)}".strip() if address_match else "Не указан"
-
-    # 7. Custom items (простой поиск ключевых слов для демо)
-    data['custom_items'] = []
-    if "вывоз" in text:
-        data['custom_items'].append({"name": "Вывоз грунта", "price": 5000})
+    return parse_local(text).data
+
+
+# Как часто (сек) обновляем сообщение "Думаю..." распознанными полями (лимиты Telegram на edit)
+PREVIEW_INTERVAL = 1.0
+
+
+# --- ЗАПРОС К МОДЕЛИ ---
+async def ask_model(messages, on_progress=None):
+    """
+    Запрос к нейросети -> dict заказа.
+    В потоковом режиме JSON разбирается по мере прихода токенов: on_progress(parser) вызывается
+    на каждом куске, а как только закрылась внешняя скобка - ответ готов, хвост не ждем.
+    """
+    if not llm_client.AI_STREAM:
+        content = await llm_client.chat_completion(messages, temperature=0.1)
+        print(f"AI Response: {content}")  # Лог для отладки
+        return extract_json_from_response(content)
 
+    parser = IncrementalJSONParser()
+    chunks = llm_client.stream_chat_completion(messages, temperature=0.1)
+    done = False
+    try:
+        async for chunk in chunks:
+            if parser.feed(chunk):
+                done = True
+                break
+            if on_progress is not None:
+                on_progress(parser)
+    finally:
+        if done:
+            # JSON закрылся - отвечаем сразу, хвост (и usage) дочитается в фоне
+            llm_client.finish_stream(chunks)
+        else:
+            await chunks.aclose()
+
+    content = parser.text()
+    print(f"AI Response: {content}")  # Лог для отладки
+    return parser.result() or extract_json_from_response(content)
+
+
+def merge_local(local, answer):
+    """Локальный разбор + ответ модели: модель перезаписывает только нерешенные поля"""
+    data = dict(local.data)
+    for field in local.unresolved:
+        if field == 'custom_items':
+            # Уверенно найденные услуги оставляем, модель добавляет непонятое
+            # (не объекты от модели - мусор: дальше их ждут как dict правка, расчет и текст заказа)
+            data['custom_items'] = local.data['custom_items'] + valid_items(answer)
+        elif answer.get(field) is not None:
+            data[field] = answer[field]
     return data
 
 
 # --- ФУНКЦИЯ 1: МОЗГИ (DEEPSEEK С ПОНИМАНИЕМ ПРАЙСА) ---
-def analyze_request_ai(text, current_data=None):
-    # Подсказка для нейросети по услугам (из services.py)
-    # Мы учим AI использовать правильные ключи
-    services_hint = """
-    СПИСОК ДОП. УСЛУГ (Используй эти ключи в поле "service_key" для custom_items):
-    - "manual_sand_transport": если надо таскать песок вручную или далеко (>10м).
-    - "manual_soil_transport": вывоз грунта вручную/тачкой.
-    - "cable_laying": прокладка электрического кабеля (в гофре).
-    - "socket_install": установка розетки.
-    - "diamond_drilling_40": алмазное бурение (если толстый бетон/фундамент).
-    - "opalubka_t4": если упомянут плывун, осыпающийся грунт или нужна опалубка.
-    - "hole_in_ring": прокол кольца жби.
-    - "shakhtersky_podkop": шахтерский подкоп.
-    """
+async def analyze_request_ai(text, current_data=None, on_progress=None):
+    # Замер всего разбора: mode - новый заказ / правка, outcome - откуда взят результат
+    mode = "edit" if current_data else "new"
+    outcome = "failed"
+    started = time.perf_counter()
+    try:
+        outcome, result = await _analyze(text, current_data, on_progress)
+        return result
+    except asyncio.CancelledError:
+        # Задачу отменило более новое сообщение (coalescer) - в счетчик исходов не идет
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.LLM_SECONDS.labels(mode=mode, outcome=outcome).observe(time.perf_counter() - started)
+        tracing.set_attrs(mode=mode, parse=outcome)
+        if outcome != "cancelled":
+            metrics.PARSE_TOTAL.labels(path=outcome).inc()
+
+
+async def _analyze(text, current_data, on_progress):
+    """-> (откуда результат: cache / local / llm / fallback / failed, заказ или None)"""
+    # 0. Такой же запрос уже разбирали (повтор сообщения, типовая фраза) -> ответ из кэша
+    # prompt_id зависит от версии каталога: поменялись услуги/товары -> старые ответы не используем
+    cache_key = make_key(text, current_data, prompts.prompt_id())
+    cached = await parse_cache.aget(cache_key)
+    if cached is not None:
+        logging.info(f"LLM cache hit {parse_cache.stats()}")
+        return "cache", cached
 
     # 1. СЦЕНАРИЙ: НОВЫЙ ЗАКАЗ
+    local = None
     if not current_data:
-        system_prompt = f"""
-        Ты - калькулятор смет. Твоя цель: превратить текст прораба в JSON.
-
-        {services_hint}
-
-        СТРУКТУРА JSON:
-        {{
-            "client_name": "Имя (или Заказчик)",
-            "address": "Адрес (или Не указан)",
-            "product_id": "tver_08" (по умолч) или "tver_11",
-            "soil": "sand" (по умолч) или "clay",
-            "pipe_length": int (метров, по умолч 5),
-            "diamond_drilling": bool (обычное бурение),
-
-            "custom_items": [
-                // Если фраза совпадает с услугой из списка выше -> пиши service_key и qty (кол-во)
-                {{ "service_key": "manual_sand_transport", "qty": 5 }},
-                // Если услуги нет в списке -> пиши просто name и price (цену придумай адекватную или возьми из текста)
-                {{ "name": "Демонтаж старого туалета", "price": 3000, "qty": 1 }}
-            ]
-        }}
-        """
-        user_content = f"Заказ: {text}"
-
-    # 2. СЦЕНАРИЙ: ПРАВКА СУЩЕСТВУЮЩЕГО
-    else:
-        system_prompt = f"""
-        Ты - редактор JSON данных. 
-        {services_hint}
-
-        ПРАВИЛА ОБНОВЛЕНИЯ:
-        1. ОТРИЦАНИЯ: Если написано "не нужно бурить" -> ставь "diamond_drilling": false.
-        2. ИЗМЕНЕНИЯ: Если меняют имя/адрес/метры -> перезапиши поле.
-        3. ДОБАВЛЕНИЯ: Добавляй услуги в массив "custom_items" (используй ключи service_key, если подходит).
-           НЕ удаляй старые услуги из списка, если не просили!
-
-        ВЕРНИ ТОЛЬКО ПОЛНЫЙ ОБНОВЛЕННЫЙ JSON.
-        """
-        # Передаем текущее состояние и просьбу пользователя
-        user_content = f"ТЕКУЩИЙ JSON:\n{json.dumps(current_data, ensure_ascii=False)}\n\nПРАВКА ПОЛЬЗОВАТЕЛЯ:\n{text}"
-
-    # Отправляем запрос
+        # Сначала разбираем сами: типовой заказ готов без похода в DeepSeek
+        with tracing.span("parse") as sp:
+            local = parse_local(text)
+            sp.set(unresolved=list(local.unresolved))
+        if not local.unresolved:
+            logging.info("Заказ разобран локально, без нейросети")
+            return "local", local.data
+
+    # Отправляем запрос (не блокирует бота: пока ждем модель, остальные апдейты обрабатываются)
     try:
-        response = ai_client.chat.completions.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=0.1,  # Низкая температура для точности
-            stream=False,
-            timeout=40.0
-        )
-        content = response.choices[0].message.content
-        print(f"AI Response: {content}")  # Лог для отладки
-
-        return extract_json_from_response(content)
+        if local is not None:
+            # В модель уходят только нерешенные поля и непонятный кусок текста
+            messages = new_order_messages(local, text)
+        else:
+            # 2. СЦЕНАРИЙ: ПРАВКА СУЩЕСТВУЮЩЕГО (модель возвращает только изменения)
+            messages = edit_messages(current_data, text)
+        with metrics.IN_FLIGHT.labels(stage="llm").track_inprogress(), tracing.span("llm"):
+            result = await ask_model(messages, on_progress=on_progress)
+        if result and local is not None:
+            result = merge_local(local, result)
+        elif result and current_data:
+            # Модель вернула только операции - собираем новый заказ сами
+            with tracing.span("patch"):
+                result = apply_patch(current_data, result)
+        # Кэшируем только настоящие ответы модели (не План Б)
+        if result:
+            await parse_cache.aput(cache_key, result)
+        return ("llm" if result else "failed"), result
+
+    except PatchError as e:
+        logging.warning(f"Патч от модели отклонен: {e}")
+        return "failed", None
 
     except Exception as e:
         print(f"API Error: {e}")
         # ЕСЛИ AI УПАЛ (Timeout/Error) -> ВКЛЮЧАЕМ ПЛАН Б (Regex), но только для новых заказов
-        if not current_data:
-            return parse_order_manually(text)
-        return None
+        if local is not None:
+            logging.info("⚠️ Использую ручной режим (Regex)...")
+            return "fallback", local.data
+        return "failed", None
 
 
 # --- КЛАВИАТУРА ---
@@ -191,9 +232,58 @@ def get_keyboard():
     ])
 
 
+# --- ЖИВОЙ ПРЕДПРОСМОТР (ПОКА МОДЕЛЬ ПИШЕТ ОТВЕТ) ---
+def format_preview(fields):
+    lines = ["🧠 Думаю..."]
+    if 'client_name' in fields:
+        lines.append(f"👤 {fields['client_name']}")
+    if 'address' in fields:
+        lines.append(f"📍 {fields['address']}")
+    if 'product_id' in fields:
+        lines.append(f"📦 {catalog.short_name(fields['product_id'])}")
+    if 'soil' in fields:
+        lines.append("🌍 Глина" if fields['soil'] == 'clay' else "🌍 Песок")
+    if 'pipe_length' in fields:
+        lines.append(f"📏 Труба: {fields['pipe_length']} м")
+    return "\n".join(lines)
+
+
+class LivePreview:
+    """Редактирует сообщение "Думаю..." уже распознанными полями не чаще раза в PREVIEW_INTERVAL"""
+
+    def __init__(self, msg, interval=PREVIEW_INTERVAL):
+        self.msg = msg
+        self.interval = interval
+        self._last_text = msg.text
+        self._last_at = time.monotonic()
+        self._task = None
+
+    def __call__(self, parser):
+        now = time.monotonic()
+        # Не чаще interval и не больше одной правки одновременно (поток токенов не ждет Telegram)
+        if now - self._last_at < self.interval or (self._task is not None and not self._task.done()):
+            return
+        text = format_preview(parser.fields())
+        if text == self._last_text:
+            return
+        self._last_at = now
+        self._last_text = text
+        self._task = asyncio.create_task(self._edit(text))
+
+    async def _edit(self, text):
+        try:
+            await self.msg.edit_text(text)
+        except Exception:
+            pass
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
 # --- ОПИСАНИЕ ЗАКАЗА (ДЛЯ ЧАТА) ---
 def format_order_text(data):
-    p_name = "Тверь 0.8" if data.get('product_id') == 'tver_08' else "Тверь 1.1"
+    p_name = catalog.short_name(data.get('product_id'))
     soil = "Глина" if data.get('soil') == 'clay' else "Песок"
 
     # Формируем список допов для предпросмотра
@@ -201,6 +291,8 @@ def format_order_text(data):
     if data.get('custom_items'):
         custom_text = "\n➕ **Доп. услуги:**\n"
         for item in data['custom_items']:
+            if not isinstance(item, dict):
+                continue  # Не объект - в расчет (pricing) тоже не попадет
             # Если есть ключ сервиса, мы покажем его код (или можно сделать маппинг имен, но для теста сойдет)
             name = item.get('name', item.get('service_key', 'Услуга'))
             price = item.get('price', 'по прайсу')
@@ -222,6 +314,7 @@ def format_order_text(data):
 
 @dp.message(CommandStart())
 async def start(message: Message):
+    coalescer.cancel(message.from_user.id)
     user_orders.pop(message.from_user.id, None)
     await message.answer(
         "👋 **Привет! Я бот-сметчик v3.0.**\n\n"
@@ -231,14 +324,31 @@ async def start(message: Message):
 
 
 @dp.message(F.text)
+@tracing.traced("text")
 async def handle_text(message: Message):
     uid = message.from_user.id
     user_text = message.text
 
     msg = await message.answer("🧠 Думаю...")
+    # Пока модель пишет ответ - показываем уже распознанные поля
+    preview = LivePreview(msg)
 
-    current_data = user_orders.get(uid)
-    new_data = analyze_request_ai(user_text, current_data)
+    async def job(text):
+        # Состояние берем в момент запроса (после всех предыдущих правок), сохраняем сразу после ответа
+        new_data = await analyze_request_ai(text, await user_orders.aget(uid), on_progress=preview)
+        if new_data:
+            user_orders[uid] = new_data
+        return new_data
+
+    superseded = False
+    try:
+        # Несколько сообщений подряд -> один запрос к модели, ответ получает последнее
+        new_data = await coalescer.submit(uid, user_text, job)
+    except Superseded:
+        superseded = True
+        tracing.set_attrs(superseded=True)
+    finally:
+        preview.close()
 
     # Удаляем сообщение "Думаю..."
     try:
@@ -246,19 +356,24 @@ async def handle_text(message: Message):
     except:
         pass
 
-    if new_data:
-        user_orders[uid] = new_data
-        await message.answer(format_order_text(new_data), reply_markup=get_keyboard())
-    else:
-        await message.answer("⚠️ Не понял. Попробуй переформулировать.")
+    if superseded:
+        return
+    with tracing.span("send"):
+        if new_data:
+            await message.answer(format_order_text(new_data), reply_markup=get_keyboard())
+        else:
+            await message.answer("⚠️ Не понял. Попробуй переформулировать.")
 
 
 @dp.callback_query()
+@tracing.traced("button")
 async def handle_buttons(call: CallbackQuery):
     uid = call.from_user.id
-    data = user_orders.get(uid)
+    data = await user_orders.aget(uid)
+    tracing.set_attrs(action=call.data)
 
     if call.data == "cancel":
+        coalescer.cancel(uid)
         user_orders.pop(uid, None)
         await call.message.edit_text("❌ Заказ сброшен.")
 
@@ -270,24 +385,12 @@ async def handle_buttons(call: CallbackQuery):
         await call.message.edit_text("⏳ Генерирую документы (Смета + Инструкции)...")
 
         try:
-            # 1. КП (Красивое)
-            kp_name = f"КП_{data.get('client_name')}.pdf"
-            generate_kp(data, kp_name)
-
-            # 2. Смета (Строгая + Инструкции)
-            smeta_name = f"Смета_{data.get('client_name')}.pdf"
-            generate_strict_estimate(data, smeta_name)
-
-            # 3. Отправка
-            media = [
-                InputMediaDocument(media=FSInputFile(kp_name), caption="✅ Коммерческое предложение"),
-                InputMediaDocument(media=FSInputFile(smeta_name), caption="✅ Смета + Инструкции")
-            ]
-            await call.message.answer_media_group(media)
-
-            # Чистка
-            if os.path.exists(kp_name): os.remove(kp_name)
-            if os.path.exists(smeta_name): os.remove(smeta_name)
+            # 1. КП (Красивое) и 2. Смета (Строгая + Инструкции): из кэша или параллельно в пуле
+            # 3. Отправка прямо из буфера (файлы на диск не пишем) или по file_id прошлой отправки
+            await send_order_documents(call.message, data, {
+                "kp": "✅ Коммерческое предложение",
+                "smeta": "✅ Смета + Инструкции",
+            })
 
             user_orders.pop(uid, None)
             await call.message.answer("Готово! Жду следующий заказ.")
@@ -297,9 +400,67 @@ async def handle_buttons(call: CallbackQuery):
 
 
 # ================= ЗАПУСК =================
+# Порт, на который Caddy проксирует вебхук этого бота (webapp.py занимает 8000)
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8001"))
+
+
+async def serve_webhook():
+    """Режим вебхука: маленький FastAPI с эндпоинтом для Telegram и /metrics"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    app = FastAPI()
+    update_queue = webhook.UpdateQueue(dp, bot)
+    webhook.add_webhook_route(app, update_queue)
+    metrics.add_metrics_route(app)
+    update_queue.start()
+    await webhook.set_webhook(bot, dp)
+    startup.ready("main (webhook)", WARMUP_STEPS)
+    try:
+        await uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=WEBHOOK_PORT)).serve()
+    finally:
+        await update_queue.stop()
+
+
+# Прогрев: воркеры рендера (шрифты, картинки, appendix.pdf) и соединение с моделью.
+# По умолчанию - в фоне, когда бот уже отвечает (STARTUP_WARMUP, см. startup.py)
+WARMUP_STEPS = [
+    ("renderer", renderer.start),
+    ("llm", llm_client.warm_up),
+]
+
+
+@dp.startup()
+async def on_polling_started():
+    startup.ready("main", WARMUP_STEPS)
+
+
 async def main():
     print("Бот v3.0 запущен!")
-    await dp.start_polling(bot)
+    await startup.warm_up_blocking(WARMUP_STEPS)
+    user_orders.start()
+    catalog.start_watcher()
+    tracing.start_profiler()
+    metrics_server = None
+    try:
+        if webhook.BOT_MODE == "webhook":
+            await serve_webhook()
+        else:
+            # HTTP-сервера при поллинге нет - метрики бота (LLM, разбор, рендер) отдает свой listener
+            metrics_server = await metrics.start_server()
+            # Вебхук мог остаться с прошлого запуска - поллинг с ним не работает
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await startup.stop()
+        await catalog.stop_watcher()
+        tracing.stop_profiler()
+        tracing.shutdown()
+        renderer.shutdown()
+        await user_orders.close()
+        await llm_client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,333 @@
+# metrics.py
+# Метрики в формате Prometheus (text exposition 0.0.4) без внешних библиотек:
+# Counter / Gauge / Histogram с метками и маршрут /metrics для FastAPI.
+#
+# Рендер идет в пуле процессов (renderer), а счетчики воркера живут в его памяти.
+# Поэтому воркер копит наблюдения в outbox (forward_to_outbox()), отдает их вместе
+# с готовым PDF (drain()), а процесс бота проигрывает их у себя (replay()).
+# Точки замера пишутся одинаково, где бы код ни выполнялся.
+#
+# Процесс бота в режиме поллинга HTTP-сервера не держит - для него start_server() (METRICS_PORT):
+# маленький listener на asyncio только с GET /metrics. В режиме вебхука /metrics висит на его FastAPI.
+#
+# Доля Плана Б (regex вместо модели):
+#   sum(rate(septic_parse_total{path="fallback"}[5m])) / sum(rate(septic_parse_total[5m]))
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+
+# Границы корзин по умолчанию: от 5 мс до минуты (ответ модели, рендер, загрузка)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+# Размер PDF: 16 КБ ... 16 МБ
+SIZE_BUCKETS = tuple(16 * 1024 * 2 ** n for n in range(11))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Порт /metrics процесса бота в режиме поллинга (0 - не слушать)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+_registry = {}  # имя -> метрика (в порядке регистрации)
+_outbox = None  # список наблюдений воркера или None (пишем прямо в метрики)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}  # значения меток -> дочерняя метрика
+        if name in _registry:
+            raise ValueError(f"Метрика {name} уже зарегистрирована")
+        _registry[name] = self
+
+    def labels(self, **labels):
+        values = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child(values)
+        return child
+
+    def _default(self):
+        # Метрика без меток - одна дочерняя с пустыми значениями
+        if self.labelnames:
+            raise ValueError(f"{self.name}: нужны метки {self.labelnames}")
+        return self.labels()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines += child.samples(self.name, self.labelnames, values)
+        return lines
+
+
+# ================= COUNTER =================
+
+class _CounterChild:
+    def __init__(self, metric, values):
+        self.metric = metric
+        self.values = values
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        if _outbox is not None:
+            _outbox.append((self.metric.name, self.values, amount))
+            return
+        self.value += amount
+
+    def samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """Имя - сразу с суффиксом _total (в формате 0.0.4 TYPE и строка значения совпадают)"""
+    kind = "counter"
+
+    def _new_child(self, values):
+        return _CounterChild(self, values)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _apply(self, values, amount):
+        self.labels(**dict(zip(self.labelnames, values))).inc(amount)
+
+
+# ================= GAUGE =================
+
+class _GaugeChild:
+    def __init__(self, metric, values):
+        self.metric = metric
+        self.values = values
+        self.value = 0.0
+        self.function = None  # значение считается в момент выдачи /metrics
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        self.function = function
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def samples(self, name, labelnames, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = math.nan
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self, values):
+        return _GaugeChild(self, values)
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+
+# ================= HISTOGRAM =================
+
+class _HistogramChild:
+    def __init__(self, metric, values):
+        self.metric = metric
+        self.values = values
+        self.counts = [0] * len(metric.buckets)  # не накопительные: счетчик своей корзины
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        if _outbox is not None:
+            _outbox.append((self.metric.name, self.values, value))
+            return
+        for n, bound in enumerate(self.metric.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self, name, labelnames, values):
+        lines = []
+        total = 0
+        for bound, count in zip(self.metric.buckets, self.counts):
+            total += count
+            le = _format_labels(labelnames, values, (("le", _format_value(float(bound))),))
+            lines.append(f"{name}_bucket{le} {total}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self, values):
+        return _HistogramChild(self, values)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _apply(self, values, value):
+        self.labels(**dict(zip(self.labelnames, values))).observe(value)
+
+
+# ================= МЕЖДУ ПРОЦЕССАМИ =================
+
+def forward_to_outbox():
+    """В воркере пула: наблюдения копятся и уходят в процесс бота вместе с результатом"""
+    global _outbox
+    _outbox = []
+
+
+def drain():
+    """Наблюдения воркера с прошлого вызова: [(имя, значения меток, число), ...]"""
+    global _outbox
+    if _outbox is None:
+        return []
+    observations, _outbox = _outbox, []
+    return observations
+
+
+def replay(observations):
+    """В процессе бота: применить наблюдения, пришедшие из воркера"""
+    for name, values, value in observations:
+        metric = _registry.get(name)
+        if metric is not None:
+            metric._apply(values, value)
+
+
+# ================= ВЫДАЧА =================
+
+def expose():
+    lines = []
+    for metric in _registry.values():
+        lines += metric.expose()
+    return "\n".join(lines) + "\n"
+
+
+def add_metrics_route(app, path="/metrics"):
+    """GET /metrics в FastAPI-приложении (для Prometheus)"""
+    from fastapi.responses import Response
+
+    @app.get(path, include_in_schema=False)
+    async def metrics_endpoint():
+        return Response(expose(), media_type=CONTENT_TYPE)
+
+    return metrics_endpoint
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Заголовки запроса не нужны - дочитываем до пустой строки
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, expose().encode("utf-8")
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """GET /metrics без FastAPI (процесс бота в режиме поллинга). -> asyncio.Server или None"""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_handle, host, port)
+    except OSError as e:
+        logging.warning(f"Metrics: не удалось занять {host}:{port}: {e}")
+        return None
+    logging.info(f"Metrics: http://{host}:{port}/metrics")
+    return server
+
+
+# ================= МЕТРИКИ КОНВЕЙЕРА =================
+
+LLM_SECONDS = Histogram("septic_llm_request_seconds",
+                        "Разбор сообщения в analyze_request_ai (с походом в модель)", ("mode", "outcome"))
+PARSE_TOTAL = Counter("septic_parse_total",
+                      "Откуда взят результат разбора: cache / local / llm / fallback (regex) / failed", ("path",))
+RENDER_SECONDS = Histogram("septic_render_seconds",
+                           "Время рендера документа в воркере (smeta - вместе со склейкой)", ("doc",))
+MERGE_SECONDS = Histogram("septic_appendix_merge_seconds", "Склейка сметы с инструкциями (appendix.pdf)")
+PDF_BYTES = Histogram("septic_pdf_bytes", "Размер готового PDF", ("doc",), buckets=SIZE_BUCKETS)
+UPLOAD_SECONDS = Histogram("septic_upload_seconds",
+                           "Отправка группы документов в Telegram (files - с загрузкой, file_id - без)", ("via",))
+UPLOAD_BYTES = Counter("septic_upload_bytes_total", "Сколько байт PDF загружено в Telegram")
+IN_FLIGHT = Gauge("septic_in_flight", "Запросы, которые выполняются прямо сейчас", ("stage",))
+USER_ORDERS = Gauge("septic_user_orders", "Черновиков заказов в памяти (user_orders)")
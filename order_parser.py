@@ -0,0 +1,394 @@
+# order_parser.py
+# Быстрый локальный разбор заказа (без нейросети).
+# Прекомпилированные регулярки + оценка уверенности по каждому полю.
+# Если все поля распознаны уверенно и в тексте не осталось непонятных слов -
+# заказ готов за доли миллисекунды, DeepSeek не нужен.
+# Иначе наружу отдаются только нерешенные поля и нераспознанный остаток текста.
+import re
+from typing import NamedTuple
+
+import catalog
+
+# Ниже этого порога поле считается нерешенным и уходит в LLM
+CONFIDENCE_THRESHOLD = 0.5
+
+# Товар и грунт по умолчанию - из каталога (defaults())
+DEFAULTS = {
+    "client_name": "Заказчик",
+    "address": "Не указан",
+    "product_id": None,
+    "soil": None,
+    "pipe_length": 5,
+    "diamond_drilling": False,
+}
+
+
+def defaults(cat=None):
+    """Заказ по умолчанию для снимка каталога cat (по умолчанию действующего)"""
+    cat = cat or catalog.current()
+    return dict(DEFAULTS, product_id=cat.default_product, soil=cat.default_soil)
+
+
+class LocalParse(NamedTuple):
+    data: dict  # Полный заказ (нерешенные поля - значениями по умолчанию)
+    confidence: dict  # поле -> уверенность 0..1
+    unresolved: tuple  # поля с уверенностью ниже порога
+    leftover: str  # часть текста, которую не удалось разобрать
+
+
+# ================= ПАТТЕРНЫ =================
+
+_NUM = r'(\d+(?:[.,]\d+)?)'
+
+_CLIENT = re.compile(r'(?:клиент|заказчик|зовут)\s*:?\s+([А-ЯЁа-яёA-Za-z]+)', re.IGNORECASE)
+_CLIENT_LEADING = re.compile(r'^\s*([А-ЯЁ][а-яё]+)\s*,')
+
+_ADDRESS = re.compile(
+    r'(?:адрес\s*:?\s*)?'
+    r'((?:снт|днт|ул\.|улица|пос\.|поселок|посёлок|пгт|д\.|деревня|село|г\.|город)'
+    r'\s*[А-ЯЁа-яё0-9\-"«» ]{2,40}?)(?=\s*[,.;\n]|\s*$)',
+    re.IGNORECASE,
+)
+_ADDRESS_LABEL = re.compile(r'адрес\s*:?\s*([^,;\n]{3,60})', re.IGNORECASE)
+
+# Наши модели узнаем по aliases из каталога (catalog.product_patterns), здесь - чужие
+_PRODUCT_OTHER = re.compile(r'евролос|топас|астра|юнилос|танк')
+
+_SOIL_CLAY = re.compile(r'глин\w*|суглин\w*|тяжел\w* грунт|тверд\w* грунт')
+_SOIL_SAND = re.compile(r'\bпес(?:ок|ка|ке|чан\w*)\b|супес\w*')
+
+_DRILL_NO = re.compile(r'(?:без|не нужно|не надо|не)\s+(?:алмазного\s+)?(?:бурени\w*|бурить|сверлить)')
+# Отрицание после глагола: "бурение не нужно", "бурить не надо", "сверлить не требуется"
+_DRILL_NO_AFTER = re.compile(
+    r'(?:алмазн\w*\s+)?(?:бурени\w*|бурить|сверл\w*)(?:\s+[а-яё]+){0,2}?\s+'
+    r'(?:не\s+(?:нужн\w*|надо|требуется|нужен|будем|будет)|не\s+[а-яё]+|нет|ненужн\w*)'
+)
+# Только формы слов про бурение: "Бурмистров", "Дырков", "Бурцево", "Алмазов" - не бурение
+_DRILL_YES = re.compile(
+    r'\b(?:алмазн\w*\s+)?(?:(?:про)?бур(?:ени\w*|ить|им|ите|ят|ов(?:ая|ой|ую|ые))?|сверл(?:ени\w*|ить|им|ите|ят)'
+    r'|дырк[аиу]?)\b(?:\s+(?:в\s+|через\s+)?фундамент\w*)?'
+    r'|\bалмазн\w*|\bчерез\s+фундамент\w*'
+)
+
+_PIPE_CONTEXT = re.compile(r'труб\w*|трасс\w*|канализац\w*')
+_METERS = re.compile(_NUM + r'\s*(?:м\b|м\.|метр\w*|мп\b|м\.п\.)')
+_METERS_BEFORE = re.compile(r'метр\w*\s+' + _NUM)
+_CUBES = re.compile(_NUM + r'\s*(?:куб\w*|м3|м³)')
+_ANY_NUM = re.compile(_NUM)
+# Количество словами ("две розетки") регулярки не считают - это решает LLM
+_NUMBER_WORDS = re.compile(
+    r'\b(?:одн[аиуо]й?|дв[аеу]|двух|тр[иеё]х?|три|четыр\w*|пят[ьи]|шест[ьи]|сем[ьи]|восем\w*|девят[ьи]|десят[ьи]'
+    r'|пар[ауы]|несколько|пару)\b'
+)
+
+# Доп. услуги из прайса: ключ -> паттерн (проверяются по предложениям/фразам)
+_SERVICES = [
+    ("heating_cable", re.compile(r'грею\w*\s+кабел\w*|греющ\w*|обогрев\w*')),
+    ("cable_laying", re.compile(r'кабел\w*')),
+    ("socket_install", re.compile(r'розетк\w*')),
+    ("manual_sand_transport", re.compile(
+        r'(?:таска\w*|носит\w*|подвоз\w*|перенос\w*)\s+(?:\w+\s+){0,2}?пес\w*|пес\w*\s+(?:\w+\s+){0,2}?вручную')),
+    ("manual_soil_transport", re.compile(r'вывоз\w*|грунт\w*\s+(?:\w+\s+){0,2}?(?:вручную|тачк\w*)')),
+    ("soil_loading", re.compile(r'самосвал\w*')),
+    ("opalubka_t4", re.compile(r'плывун\w*|опалубк\w*|осыпа\w*')),
+    ("hole_in_ring", re.compile(r'прокол\w*\s+(?:ж/?б\s+|жби\s+)?кольц\w*|кольц\w*\s+жби')),
+    ("shakhtersky_podkop", re.compile(r'шахт[её]рск\w*|подкоп\w*')),
+]
+# Для этих услуг количество - в метрах/кубах, и его надо найти в тексте
+_SERVICE_UNITS = {
+    "heating_cable": _METERS,
+    "cable_laying": _METERS,
+    "manual_sand_transport": _CUBES,
+    "manual_soil_transport": _CUBES,
+    "soil_loading": _CUBES,
+    "shakhtersky_podkop": _METERS,
+}
+# Остальные услуги - в штуках: "2 розетки", "розетки 3 шт"; без числа во фразе - 1 шт.
+
+# Запятая между цифрами ("12,5 м") - десятичная, фразу не делит
+_CLAUSE_SPLIT = re.compile(r'(?:[;\n]|,(?!\d)|(?<!\d),)+|\.(?!\d)')
+# "не глина, а песок", "труба 10 м, но не 12": регулярки смысл не поймут - такие фразы решает LLM
+_NEGATION = re.compile(r'(?<![а-яё])(?:не|нет|без|а|но|однако|вместо)(?![а-яё])')
+_WORD = re.compile(r'[а-яёa-z]{3,}')
+
+# Слова, которые не несут данных заказа (остаток из них не требует LLM)
+_STOPWORDS = frozenset("""
+для нужно надо нужен нужна нужны будет есть там так это где что как или при под над около примерно
+метров метра метр грунт грунта грунте трасса трассы труба трубы трубу труб длина длиной глубина
+септик септика станция станции заказ клиент клиента заказчик адрес тверь классик classic
+привет здравствуйте пожалуйста спасибо копать копка прокладка проложить монтаж установка установить
+поставить доставка сделать считай посчитай смета смету тоже еще ещё вот все всё только обычный обычная
+стандарт стандартный стандартная дом дома дому участок участке
+""".split())
+
+
+# ================= РАЗБОР =================
+
+def _looks_like_data(word):
+    """Первое слово "Тверь," или "Глина," - это не имя клиента"""
+    return (word in _STOPWORDS or _SOIL_CLAY.match(word) or _SOIL_SAND.match(word)
+            or any(p.match(word) for _, p in _SERVICES))
+
+
+def _to_number(raw):
+    value = float(raw.replace(',', '.'))
+    return int(value) if value.is_integer() else value
+
+
+def parse_local(text, cat=None):
+    """Текст прораба -> LocalParse. Чистый CPU, без сети. cat - снимок каталога (по умолчанию действующий)"""
+    cat = cat or catalog.current()
+    low = text.lower().replace('ё', 'е')
+    base = defaults(cat)
+    data = dict(base)
+    conf = {field: 0.7 for field in DEFAULTS}  # Поле не упомянуто -> берем умолчание
+    consumed = []  # Уверенно разобранные куски текста (span'ы в low)
+    spans = {}  # поле -> его куски текста (для отрицаний рядом с ними)
+
+    def take(field, span):
+        consumed.append(span)
+        spans.setdefault(field, []).append(span)
+
+    # 1. Имя
+    m = _CLIENT.search(text)
+    if m:
+        data['client_name'] = m.group(1).capitalize()
+        conf['client_name'] = 0.9
+        take('client_name', m.span())
+    else:
+        m = _CLIENT_LEADING.match(text)
+        if m and not _looks_like_data(m.group(1).lower()):
+            data['client_name'] = m.group(1)
+            conf['client_name'] = 0.75
+            take('client_name', m.span(1))
+
+    # 2. Адрес
+    m = _ADDRESS_LABEL.search(text) or _ADDRESS.search(text)
+    if m:
+        data['address'] = m.group(1).strip(' -')
+        conf['address'] = 0.85
+        take('address', m.span())
+
+    # 3. Доп. услуги (по фразам): фраза с услугой целиком принадлежит услуге,
+    #    ее числа - количество/расстояние, а не длина трубы
+    custom_items = []
+    service_clauses = []
+    custom_conf = 0.9
+    pos = 0
+    for clause in _CLAUSE_SPLIT.split(low):
+        start = low.find(clause, pos)
+        pos = start + len(clause)
+        for key, pattern in _SERVICES:
+            if not pattern.search(clause):
+                continue
+            service_clauses.append(clause)
+            unit_re = _SERVICE_UNITS.get(key)
+            if unit_re is not None:
+                q = unit_re.search(clause)
+                if not q:
+                    # Количество непонятно ("таскать песок далеко") - фразу оставляем для LLM
+                    custom_conf = min(custom_conf, 0.4)
+                    break
+                qty = _to_number(q.group(1))
+            else:
+                numbers = _ANY_NUM.findall(clause)
+                if _NUMBER_WORDS.search(clause) or len(numbers) > 1 or (numbers and not numbers[0].isdigit()):
+                    # "две розетки", "розетки 2 и 3", "2,5 розетки" - количество решает LLM
+                    custom_conf = min(custom_conf, 0.4)
+                    break
+                qty = int(numbers[0]) if numbers else 1
+            custom_items.append({"service_key": key, "qty": qty})
+            take('custom_items', (start, start + len(clause)))
+            break
+    data['custom_items'] = custom_items
+    conf['custom_items'] = custom_conf
+
+    # 4. Грунт (песок в фразе "таскать песок" - это услуга, а не грунт)
+    soil_text = low
+    for clause in service_clauses:
+        soil_text = soil_text.replace(clause, ' ' * len(clause))
+    clay, sand = _SOIL_CLAY.search(soil_text), _SOIL_SAND.search(soil_text)
+    if clay:
+        data['soil'] = 'clay'
+        conf['soil'] = 0.6 if sand else 0.9
+        for m in _SOIL_CLAY.finditer(low):
+            take('soil', m.span())
+    elif sand:
+        data['soil'] = 'sand'
+        conf['soil'] = 0.85
+    for m in _SOIL_SAND.finditer(soil_text):
+        take('soil', m.span())
+
+    # 5. Труба: числа с метрами вне фраз услуг; рядом "труба/трасса" - надежнее
+    candidates = []
+    pos = 0
+    for clause in _CLAUSE_SPLIT.split(low):
+        start = low.find(clause, pos)
+        pos = start + len(clause)
+        if clause in service_clauses:
+            continue
+        for m in list(_METERS.finditer(clause)) + list(_METERS_BEFORE.finditer(clause)):
+            candidates.append((bool(_PIPE_CONTEXT.search(clause)), m.group(1), start, clause, m.span()))
+    with_context = [c for c in candidates if c[0]]
+    chosen = with_context if with_context else candidates
+    values = {c[1] for c in chosen}
+    if len(values) == 1 and not with_context and custom_conf < CONFIDENCE_THRESHOLD:
+        # "таскать песок далеко, метров 15" - метры могут относиться к нерешенной услуге
+        data['pipe_length'] = _to_number(chosen[0][1])
+        conf['pipe_length'] = 0.45
+    elif len(values) == 1:
+        data['pipe_length'] = _to_number(chosen[0][1])
+        conf['pipe_length'] = 0.95 if with_context else 0.85
+        # Забираем только "12 м" и слово "труба" - остальное во фразе (город, улица) остается для разбора
+        for _, _, start, clause, (a, b) in chosen:
+            take('pipe_length', (start + a, start + b))
+            context = _PIPE_CONTEXT.search(clause)
+            if context:
+                take('pipe_length', (start + context.start(), start + context.end()))
+    elif len(values) > 1:
+        data['pipe_length'] = _to_number(chosen[0][1])
+        conf['pipe_length'] = 0.3
+
+    # 6. Товар (после трубы: "труба 1.1 м" - это длина, а не модель 1.1)
+    #    Название модели ищем вне кусков адреса, услуг и длины трубы
+    claimed = [span for field in ('address', 'custom_items', 'pipe_length') for span in spans.get(field, ())]
+    claimed += [(start + a, start + b) for _, _, start, _, (a, b) in candidates]
+    found, shadowed = [], False
+    for key, pattern in cat.product_patterns.items():
+        clean = [m for m in pattern.finditer(low) if not any(a < m.end() and m.start() < b for a, b in claimed)]
+        if clean:
+            found.append((key, clean[0]))
+        elif pattern.search(low):
+            shadowed = True
+    if _PRODUCT_OTHER.search(low):
+        conf['product_id'] = 0.2  # Модели нет в нашем каталоге
+    elif len(found) > 1:
+        # Названо несколько моделей - берем последнюю по каталогу, решать все равно модели
+        data['product_id'] = found[-1][0]
+        conf['product_id'] = 0.3
+    elif found:
+        data['product_id'] = found[0][0]
+        conf['product_id'] = 0.9
+        take('product_id', found[0][1].span())
+    elif shadowed:
+        # Число модели занято другим полем ("труба 1.1 м") - пусть решит LLM
+        conf['product_id'] = 0.4
+
+    # 7. Бурение - только в еще не разобранном тексте ("Бурмистров", "снт Алмазное" - имя и адрес)
+    free = list(low)
+    for a, b in consumed:
+        free[a:b] = ' ' * (b - a)
+    free = ''.join(free)
+    m = _DRILL_NO.search(free) or _DRILL_NO_AFTER.search(free)
+    if m:
+        data['diamond_drilling'] = False
+        conf['diamond_drilling'] = 0.9
+        take('diamond_drilling', m.span())
+    else:
+        m = _DRILL_YES.search(free)
+        if m:
+            data['diamond_drilling'] = True
+            conf['diamond_drilling'] = 0.9
+            take('diamond_drilling', m.span())
+        elif _DRILL_YES.search(low):
+            # Слово про бурение нашлось только внутри имени / адреса - решает LLM
+            conf['diamond_drilling'] = 0.45
+
+    # === Что осталось непонятым ===
+    # (span'ы считались по low; если lower() изменил длину строки - остаток берем из low)
+    chars = list(text if len(text) == len(low) else low)
+    for a, b in consumed:
+        chars[a:b] = ' ' * (b - a)
+    leftover = ''.join(chars)
+    leftover_words = [w for w in _WORD.findall(leftover.lower()) if w not in _STOPWORDS]
+    if leftover_words:
+        # В тексте есть что-то кроме известных полей - возможно, нестандартная работа,
+        # имя или адрес, которые регулярки не узнали
+        conf['custom_items'] = min(conf['custom_items'], 0.4)
+        for field in ('client_name', 'address'):
+            if data[field] == base[field]:
+                conf[field] = 0.45
+
+    # Отрицание / противопоставление, которое не съели правила выше ("не глина, а песок"):
+    # поля из этой фразы считаем нерешенными
+    pos = 0
+    for clause in _CLAUSE_SPLIT.split(low):
+        start = low.find(clause, pos)
+        pos = start + len(clause)
+        end = start + len(clause)
+        negations = [m for m in _NEGATION.finditer(clause)
+                     if not any(a <= start + m.start() < b for a, b in consumed)]
+        if not negations:
+            continue
+        touched = [f for f, field_spans in spans.items() if any(a < end and start < b for a, b in field_spans)]
+        for field in touched or ('custom_items',):
+            conf[field] = min(conf[field], 0.4)
+
+    # Ни одного распознанного поля ("привет", пустое сообщение) - локальному заказу из умолчаний не верим
+    if not spans:
+        for field in conf:
+            conf[field] = min(conf[field], 0.4)
+
+    unresolved = tuple(f for f, c in conf.items() if c < CONFIDENCE_THRESHOLD)
+    leftover = ', '.join(' '.join(part.split()) for part in _CLAUSE_SPLIT.split(leftover) if part.strip())
+    return LocalParse(data, conf, unresolved, leftover)
+
+
+# ================= САМОПРОВЕРКА =================
+# python order_parser.py - прогон случаев, на которых локальный разбор ошибался.
+# Локальный заказ идет мимо LLM, поэтому уверенно-неверный разбор хуже, чем "нерешено".
+
+# (текст, ожидаемые значения полей, поля, которые обязаны уйти в LLM; () - всё решено локально)
+CHECKS = [
+    # Десятичная запятая - часть числа, а не граница фразы
+    ("клиент Петр, песок, труба 12,5 м", {"pipe_length": 12.5, "soil": "sand"}, ()),
+    ("клиент Петр, глина, трасса 7,5 метров, без бурения",
+     {"pipe_length": 7.5, "soil": "clay", "diamond_drilling": False}, ()),
+    ("клиент Петр, тверь 0,8, песок, труба 5 м", {"product_id": "tver_08", "pipe_length": 5}, ()),
+    # Бурение - не в имени и не в адресе
+    ("клиент Бурмистров, песок, труба 5 м", {"client_name": "Бурмистров", "diamond_drilling": False}, ()),
+    ("клиент Дырков, песок, труба 5 м", {"diamond_drilling": False}, ()),
+    ("клиент Петр, адрес Бурцево, песок, труба 5 м", {"diamond_drilling": False}, ()),
+    ("клиент Алмазов, песок, труба 5 м, бурение", {"diamond_drilling": True}, ()),
+    ("клиент Петр, песок, труба 5 м, бурить не надо", {"diamond_drilling": False}, ()),
+    # Число модели, занятое длиной трубы
+    ("клиент Петр, труба 1.1 м, песок", {"pipe_length": 1.1}, ("product_id",)),
+    ("клиент Петр, песок, труба 10.8 м", {"pipe_length": 10.8}, ()),
+    ("клиент Петр, тверь 11, песок, труба 1.1 м", {"product_id": "tver_11", "pipe_length": 1.1}, ()),
+    # Количество штучных услуг
+    ("клиент Петр, 2 розетки, песок, труба 5 м",
+     {"custom_items": [{"service_key": "socket_install", "qty": 2}]}, ()),
+    ("клиент Петр, розетки 3 шт, песок, труба 5 м",
+     {"custom_items": [{"service_key": "socket_install", "qty": 3}]}, ()),
+    ("клиент Петр, розетка, песок, труба 5 м",
+     {"custom_items": [{"service_key": "socket_install", "qty": 1}]}, ()),
+    ("клиент Петр, две розетки, песок, труба 5 м", {}, ("custom_items",)),
+    ("клиент Петр, розетки 2 и 3, песок, труба 5 м", {}, ("custom_items",)),
+    # Отрицания и пустые сообщения
+    ("клиент Петр, не глина а песок, труба 5 м", {}, ("soil",)),
+    ("клиент Петр, песок, труба не 10 м а 12", {}, ("pipe_length",)),
+    ("привет", {}, ("client_name", "product_id", "soil", "pipe_length")),
+    ("", {}, ("pipe_length",)),
+]
+
+
+def check(cases=CHECKS):
+    """Прогон CHECKS -> число провалов (подробности - в stdout)"""
+    failed = 0
+    for text, expected, unresolved in cases:
+        r = parse_local(text)
+        problems = [f"{field}={r.data.get(field)!r}, ждали {value!r}"
+                    for field, value in expected.items() if r.data.get(field) != value]
+        if unresolved:
+            problems += [f"{field} решено локально" for field in unresolved if field not in r.unresolved]
+        elif r.unresolved:
+            problems.append(f"нерешено {r.unresolved}")
+        if problems:
+            failed += 1
+            print(f"❌ {text!r}: {'; '.join(problems)}")
+    print(f"order_parser: {len(cases) - failed} из {len(cases)} случаев OK")
+    return failed
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check() else 0)
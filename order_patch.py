@@ -0,0 +1,158 @@
+# order_patch.py
+# Правка заказа патчем: модель возвращает не весь JSON, а только операции над ним.
+# - Состояние уходит в модель в компактном виде (короткие ключи, позиции услуг по номерам).
+# - Ответ: {"ops": [...]} - set / add / upd / del. Применяем у себя и проверяем.
+# Цена правки не зависит от размера заказа: 30 услуг в черновике -> ответ всё равно в пару строк.
+import json
+
+import catalog
+
+# Поле заказа -> короткий ключ (и обратно)
+FIELD_KEYS = {
+    "client_name": "n",
+    "address": "a",
+    "product_id": "p",
+    "soil": "s",
+    "pipe_length": "l",
+    "pipe_depth": "h",
+    "diamond_drilling": "d",
+}
+FIELDS_BY_KEY = {v: k for k, v in FIELD_KEYS.items()}
+
+# Поле доп. услуги -> короткий ключ
+ITEM_KEYS = {
+    "service_key": "k",
+    "name": "nm",
+    "price": "pr",
+    "qty": "q",
+}
+ITEM_FIELDS_BY_KEY = {v: k for k, v in ITEM_KEYS.items()}
+
+# Шпаргалка для промпта (формат состояния и операций)
+PATCH_HINT = """
+ФОРМАТ ТЕКУЩЕГО ЗАКАЗА (короткие ключи):
+    n - имя клиента, a - адрес, p - товар (ключ из списка товаров), s - грунт (sand / clay),
+    l - длина трубы (м), h - глубина трубы (м), d - алмазное бурение (true / false),
+    i - доп. услуги: [номер, {k: service_key, q: кол-во}] или [номер, {nm: название, pr: цена, q: кол-во}]
+
+ВЕРНИ ТОЛЬКО ИЗМЕНЕНИЯ в виде JSON {"ops": [...]}. Операции:
+    {"op": "set", "f": "l", "v": 12}                    - изменить поле (n, a, p, s, l, h, d)
+    {"op": "add", "v": {"k": "cable_laying", "q": 5}}   - добавить услугу
+    {"op": "upd", "i": 2, "v": {"q": 3}}                - изменить услугу номер 2
+    {"op": "del", "i": 2}                               - удалить услугу номер 2
+Номера услуг - из ТЕКУЩЕГО заказа. Ничего не меняется -> {"ops": []}.
+"""
+
+
+class PatchError(ValueError):
+    """Патч от модели не проходит проверку - заказ не трогаем"""
+
+
+# ================= КОДИРОВАНИЕ СОСТОЯНИЯ =================
+
+def valid_items(data):
+    """custom_items заказа без мусора: только объекты (нумерация в промпте и в патче - по этому списку)"""
+    items = data.get('custom_items') if isinstance(data, dict) else None
+    if not isinstance(items, (list, tuple)):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def encode_item(item):
+    if not isinstance(item, dict):
+        return {}
+    return {ITEM_KEYS[k]: v for k, v in item.items() if k in ITEM_KEYS}
+
+
+def encode_order(data):
+    """Заказ -> компактная JSON-строка для промпта"""
+    state = {FIELD_KEYS[k]: v for k, v in data.items() if k in FIELD_KEYS}
+    items = valid_items(data)
+    if items:
+        state['i'] = [[n, encode_item(item)] for n, item in enumerate(items)]
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+
+
+# ================= ПРОВЕРКА И ПРИМЕНЕНИЕ =================
+
+def _check_field(field, value):
+    if field == 'product_id':
+        if value not in catalog.current().products:
+            raise PatchError(f"Неизвестный товар: {value!r}")
+    elif field == 'soil':
+        if value not in catalog.current().pipe_tariffs:
+            raise PatchError(f"Неизвестный грунт: {value!r}")
+    elif field in ('pipe_length', 'pipe_depth'):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise PatchError(f"{field}: ожидается число >= 0, пришло {value!r}")
+    elif field == 'diamond_drilling':
+        if not isinstance(value, bool):
+            raise PatchError(f"diamond_drilling: ожидается true/false, пришло {value!r}")
+    elif not isinstance(value, str) or not value.strip():
+        raise PatchError(f"{field}: ожидается непустая строка, пришло {value!r}")
+    return value
+
+
+def _decode_item(raw, base=None):
+    if not isinstance(raw, dict):
+        raise PatchError(f"Услуга должна быть объектом, пришло {raw!r}")
+    item = dict(base or {})
+    for key, value in raw.items():
+        field = ITEM_FIELDS_BY_KEY.get(key, key if key in ITEM_KEYS else None)
+        if field is None:
+            raise PatchError(f"Неизвестное поле услуги: {key!r}")
+        item[field] = value
+
+    qty = item.get('qty', 1)
+    if isinstance(qty, bool) or not isinstance(qty, (int, float)) or qty <= 0:
+        raise PatchError(f"Количество должно быть > 0, пришло {qty!r}")
+    if 'service_key' in item:
+        if item['service_key'] not in catalog.current().price_list:
+            raise PatchError(f"Нет такой услуги в прайсе: {item['service_key']!r}")
+    elif not item.get('name'):
+        raise PatchError("У услуги нет ни service_key, ни названия")
+    elif 'price' in item and (isinstance(item['price'], bool) or not isinstance(item['price'], (int, float))):
+        raise PatchError(f"Цена должна быть числом, пришло {item['price']!r}")
+    return item
+
+
+def _item_index(op, items):
+    index = op.get('i')
+    if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(items):
+        raise PatchError(f"Нет услуги с номером {index!r}")
+    return index
+
+
+def apply_patch(data, patch):
+    """
+    Текущий заказ + патч модели -> новый заказ (исходный dict не меняется).
+    Патч применяется целиком или никак: любая ошибка -> PatchError.
+    Номера в upd/del относятся к исходному заказу, поэтому удаления делаем в конце.
+    """
+    ops = patch.get('ops') if isinstance(patch, dict) else None
+    if not isinstance(ops, list):
+        raise PatchError(f"Ожидается {{\"ops\": [...]}}, пришло {patch!r}")
+
+    new_data = dict(data)
+    items = [dict(item) for item in valid_items(data)]
+    added, removed = [], set()
+
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind == 'set':
+            field = FIELDS_BY_KEY.get(op.get('f'), op.get('f') if op.get('f') in FIELD_KEYS else None)
+            if field is None:
+                raise PatchError(f"Неизвестное поле: {op.get('f')!r}")
+            new_data[field] = _check_field(field, op.get('v'))
+        elif kind == 'add':
+            added.append(_decode_item(op.get('v')))
+        elif kind == 'upd':
+            index = _item_index(op, items)
+            items[index] = _decode_item(op.get('v'), base=items[index])
+        elif kind == 'del':
+            removed.add(_item_index(op, items))
+        else:
+            raise PatchError(f"Неизвестная операция: {op!r}")
+
+    new_data['custom_items'] = [item for n, item in enumerate(items) if n not in removed] + added
+    return new_data
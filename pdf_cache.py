@@ -0,0 +1,255 @@
+# pdf_cache.py
+# Кэш готовых PDF по содержимому заказа.
+# Ключ = канонический JSON заказа + версия каталога (прайса) + версия шаблона (+ дата для сметы, она печатается в документе).
+# Повторная печать того же заказа (перепечатка, то же КП второму контакту):
+# - есть file_id от прошлой отправки -> Telegram пересылает файл у себя, без рендера и без загрузки;
+# - есть bytes (память / диск) -> без рендера.
+# Уровни: LRU в памяти (лимит по байтам) -> файлы на диске (лимит по размеру папки).
+# Диск (чтение / запись PDF, file_ids.json) - в отдельном потоке, event loop его не ждет.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import catalog
+
+PDF_CACHE_DIR = os.path.join(os.getenv("SEPTIC_CACHE_DIR", ".cache"), "pdf")
+PDF_CACHE_MEM_BYTES = int(os.getenv("PDF_CACHE_MEM_BYTES", str(64 * 1024 * 1024)))
+PDF_CACHE_DISK_BYTES = int(os.getenv("PDF_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+# Раз в N записей подрезаем папку до PDF_CACHE_DISK_BYTES
+_TRIM_EVERY = 20
+# Сколько последних file_id помним (file_id живет у Telegram, PDF на диске для него не нужен)
+FILE_IDS_MAX = 5000
+
+# Поменял верстку так, что старые PDF не годятся, а файлы ниже не трогал -> подними версию
+TEMPLATE_VERSION = "1"
+
+# От чего зависит внешний вид документа: код генератора + ассеты.
+# Правка любого из файлов (размер/mtime) сама сбрасывает кэш этого документа
+TEMPLATE_FILES = {
+    "kp": ("pdf_generator.py", "kp_templates.py", "image_assets.py", "pricing.py", "assets/font.ttf",
+           "assets/logo.png"),
+    "smeta": ("estimate_generator.py", "pricing.py", "assets/font.ttf", "assets/appendix.pdf"),
+}
+# Документы, в которых печатается сегодняшняя дата
+DATED = ("smeta",)
+# Отпечаток файлов шаблона запоминаем на версию каталога и перепроверяем не чаще раза в N сек
+# (заменили картинку / ассет без правки каталога -> новый ключ не позже чем через N сек)
+TEMPLATE_STAMP_TTL = 30.0
+
+_stamps = {}  # (файлы, версия каталога) -> (отпечаток, когда снят)
+
+
+def _files_stamp(paths):
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:-")
+    return "|".join(parts)
+
+
+def _template_stamp(files, version):
+    """_files_stamp с памятью: os.stat на файлы шаблона - раз в TEMPLATE_STAMP_TTL, а не на каждый ключ"""
+    now = time.monotonic()
+    cached = _stamps.get((files, version))
+    if cached is not None and now - cached[1] < TEMPLATE_STAMP_TTL:
+        return cached[0]
+    if len(_stamps) > 256:  # Старые версии каталога больше не спросят
+        _stamps.clear()
+    stamp = _files_stamp(files)
+    _stamps[(files, version)] = (stamp, now)
+    return stamp
+
+
+def document_key(kind, data, variant="", cat=None):
+    """
+    Ключ документа kind ("kp" / "smeta") для заказа data. variant - вариант верстки (например, "separate").
+    cat - снимок каталога, по которому считается заказ (по умолчанию действующий): его версия - часть ключа
+    """
+    cat = cat or catalog.current()
+    order = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    files = TEMPLATE_FILES[kind]
+    if kind == "kp":
+        # Фото станции печатается в КП: заменили картинку (тот же путь) -> новый ключ
+        files += (cat.product(data.get('product_id')).get('image', ''),)
+    parts = [kind, variant, TEMPLATE_VERSION, cat.version, _template_stamp(files, cat.version), order]
+    if kind in DATED:
+        parts.append(datetime.now().strftime("%d.%m.%Y"))
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class PDFCache:
+    def __init__(self, path=PDF_CACHE_DIR, mem_bytes=PDF_CACHE_MEM_BYTES, disk_bytes=PDF_CACHE_DISK_BYTES):
+        self.path = path
+        self.mem_bytes = mem_bytes
+        self.disk_bytes = disk_bytes
+        self._mem = OrderedDict()  # key -> bytes PDF
+        self._mem_size = 0
+        self._disk_puts = 0
+        self._file_ids = None  # key -> Telegram file_id (подгружается с диска при первом обращении)
+        self._ids_lock = asyncio.Lock()  # file_ids.json пишет один поток за раз
+
+        self.hits = 0
+        self.file_id_hits = 0
+        self.misses = 0
+
+    # ================= BYTES =================
+
+    async def get(self, key):
+        pdf = self._mem.get(key)
+        if pdf is not None:
+            self._mem.move_to_end(key)
+            self.hits += 1
+            return pdf
+        pdf = await asyncio.to_thread(self._disk_get, key)
+        if pdf is not None:
+            self._mem_put(key, pdf)
+            self.hits += 1
+            return pdf
+        self.misses += 1
+        return None
+
+    async def put(self, key, pdf):
+        self._mem_put(key, pdf)
+        self._disk_puts += 1
+        await asyncio.to_thread(self._disk_put, key, pdf, self._disk_puts % _TRIM_EVERY == 0)
+
+    def _mem_put(self, key, pdf):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_size -= len(old)
+        self._mem[key] = pdf
+        self._mem_size += len(pdf)
+        while self._mem and self._mem_size > self.mem_bytes:
+            _, dropped = self._mem.popitem(last=False)
+            self._mem_size -= len(dropped)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".pdf")
+
+    def _disk_get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                pdf = f.read()
+            # mtime = время последнего использования (для вытеснения)
+            os.utime(path)
+            return pdf
+        except OSError:
+            return None
+
+    def _disk_put(self, key, pdf, trim=False):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self._file(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp, self._file(key))
+        except OSError as e:
+            logging.warning(f"PDF cache: ошибка записи на диск: {e}")
+            return
+        if trim:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Папка больше лимита -> удаляем самые давно использованные PDF"""
+        try:
+            entries = [e for e in os.scandir(self.path) if e.name.endswith(".pdf")]
+            stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+        except OSError as e:
+            logging.warning(f"PDF cache: не удалось прочитать папку: {e}")
+            return
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # ================= FILE_ID TELEGRAM =================
+
+    def _ids_path(self):
+        return os.path.join(self.path, "file_ids.json")
+
+    async def _load_file_ids(self):
+        if self._file_ids is None:
+            ids = await asyncio.to_thread(self._read_file_ids)
+            if self._file_ids is None:
+                self._file_ids = ids
+        return self._file_ids
+
+    def _read_file_ids(self):
+        try:
+            with open(self._ids_path(), encoding="utf-8") as f:
+                return OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    async def get_file_id(self, key):
+        ids = await self._load_file_ids()
+        file_id = ids.get(key)
+        if file_id is not None:
+            ids.move_to_end(key)
+            self.file_id_hits += 1
+        return file_id
+
+    async def set_file_ids(self, pairs):
+        """pairs: [(key, file_id), ...] после успешной отправки"""
+        ids = await self._load_file_ids()
+        changed = False
+        for key, file_id in pairs:
+            if file_id and ids.get(key) != file_id:
+                ids.pop(key, None)
+                ids[key] = file_id
+                changed = True
+        if changed:
+            await self._save_file_ids()
+
+    async def forget_file_ids(self, keys):
+        """Telegram не принял file_id (например, бот сменил токен) -> шлем файлы заново"""
+        ids = await self._load_file_ids()
+        removed = [ids.pop(key, None) for key in keys]
+        if any(file_id is not None for file_id in removed):
+            await self._save_file_ids()
+
+    async def _save_file_ids(self):
+        ids = await self._load_file_ids()
+        # Порядок = порядок использования (get_file_id переставляет ключ в конец): лишние - самые старые
+        while len(ids) > FILE_IDS_MAX:
+            ids.popitem(last=False)
+        text = json.dumps(ids)
+        async with self._ids_lock:
+            await asyncio.to_thread(self._write_file_ids, text)
+
+    def _write_file_ids(self, text):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = self._ids_path() + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self._ids_path())
+        except OSError as e:
+            logging.warning(f"PDF cache: ошибка записи file_id: {e}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "file_id_hits": self.file_id_hits,
+            "misses": self.misses,
+            "mem_entries": len(self._mem),
+            "mem_bytes": self._mem_size,
+        }
+
+
+# Общий кэш документов на процесс
+pdf_cache = PDFCache()
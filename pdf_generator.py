@@ -1,37 +1,19 @@
 # pdf_generator.py
 import os
 from fpdf import FPDF
-from config import PRODUCTS, SERVICES
+import catalog
+from pricing import quote_order, format_amount
+from font_cache import add_fonts
+import kp_templates  # Шапка и блок товара: раскладка один раз на модель
 
 
 class SepticPDF(FPDF):
-    def header(self):
-        # 1. Логотип (слева)
-        if os.path.exists("assets/logo.png"):
-            # x=10, y=8, w=40 (чуть больше, чем раньше)
-            self.image("assets/logo.png", 10, 8, 40)
-
-        # 2. Контакты компании (справа вверху)
-        # Пробуем установить шрифт, если он уже добавлен
-        try:
-            self.set_font('MyFont', '', 9)
-        except:
-            pass
-
-        self.set_text_color(100, 100, 100)  # Серый цвет
-        self.set_xy(120, 10)
-        # Многострочный блок контактов
-        self.multi_cell(80, 4, "Тел: +7(960)879-13-62\nEmail: vlg-septik@yandex.ru\nСайт: www.vlg-septik.ru", align='R')
+    # Заголовок в шапке каждой страницы
+    doc_title = 'Коммерческое предложение'
 
-        # 3. Заголовок документа
-        self.set_y(30)
-        try:
-            self.set_font('MyFont', 'B', 16)
-        except:
-            pass
-        self.set_text_color(0, 0, 0)
-        self.cell(0, 10, 'Коммерческое предложение', 0, 1, 'C')
-        self.ln(2)
+    def header(self):
+        # Логотип, контакты и заголовок - готовый шаблон (kp_templates), раскладка считается один раз
+        kp_templates.draw_header(self, self.doc_title)
 
     def footer(self):
         # Номер страницы внизу
@@ -44,7 +26,21 @@ class SepticPDF(FPDF):
         self.cell(0, 10, 'Страница ' + str(self.page_no()), 0, 0, 'C')
 
 
-def generate_pdf(data, filename="smeta.pdf"):
+def draw_product_block(pdf, product, with_media=True):
+    """
+    Презентация септика: название, подзаголовок и две колонки (картинка | характеристики).
+    with_media=False - только название (картинка и характеристики отправляются отдельной брошюрой).
+    Раскладка блока компилируется один раз на модель (kp_templates), здесь - только отрисовка.
+    """
+    kp_templates.draw_product_block(pdf, product, with_media)
+
+
+def generate_pdf(data, filename="smeta.pdf", quote=None, product_block=True):
+    """
+    Рисует КП. filename=None -> ничего не пишем на диск, возвращаем bytes PDF.
+    quote - готовый расчет pricing.quote_order(data) (если уже посчитан для этого заказа).
+    product_block=False - без картинки и характеристик (они уходят отдельной брошюрой).
+    """
     pdf = SepticPDF()
 
     # === 1. ПОДКЛЮЧЕНИЕ ШРИФТА (КРИТИЧНО) ===
@@ -54,9 +50,8 @@ def generate_pdf(data, filename="smeta.pdf"):
         print(f"ОШИБКА: Нет шрифта {font_path}")
         return None
 
-    pdf.add_font('MyFont', '', font_path, uni=True)
-    pdf.add_font('MyFont', 'B', font_path, uni=True)
-    pdf.add_font('MyFont', 'I', font_path, uni=True)
+    # Метрики шрифта берем из кэша процесса (font_cache), а не парсим TTF заново
+    add_fonts(pdf, ('', 'B', 'I'), path=font_path)
 
     pdf.add_page()
 
@@ -87,60 +82,8 @@ def generate_pdf(data, filename="smeta.pdf"):
 
     pdf.ln(10)  # Отступ после блока клиента
 
-    # === 3. ПРЕЗЕНТАЦИЯ СЕПТИКА (ДВЕ КОЛОНКИ) ===
-    # Получаем данные товара
-    p_key = data.get('product_id', 'tver_08')
-    product = PRODUCTS.get(p_key, PRODUCTS['tver_08'])
-
-    # Заголовок товара (Синий)
-    pdf.set_font("MyFont", 'B', 14)
-    pdf.set_text_color(0, 102, 204)
-    pdf.cell(0, 8, product['name'], 0, 1)
-
-    # Подзаголовок (Маркетинговый)
-    pdf.set_font("MyFont", 'I', 10)
-    pdf.set_text_color(50, 50, 50)
-    pdf.cell(0, 6, product.get('marketing_title', 'Надежное решение'), 0, 1)
-    pdf.ln(4)
-
-    # Запоминаем Y позицию начала колонок
-    y_start = pdf.get_y()
-
-    # --- КОЛОНКА 1 (ЛЕВАЯ): КАРТИНКА ---
-    if os.path.exists(product['image']):
-        # Рисуем картинку шириной 80 мм
-        pdf.image(product['image'], x=10, y=y_start, w=80)
-
-    # --- КОЛОНКА 2 (ПРАВАЯ): ХАРАКТЕРИСТИКИ ---
-    # Сдвигаем курсор вправо (x=95)
-    pdf.set_xy(95, y_start)
-
-    # Блок "Характеристики"
-    pdf.set_font("MyFont", 'B', 10)
-    pdf.set_text_color(0, 0, 0)
-    pdf.cell(0, 6, "Технические характеристики:", 0, 1)
-
-    pdf.set_font("MyFont", '', 9)
-    # Берем список из config.py
-    for spec in product.get('specs_list', []):
-        pdf.set_x(95)  # Каждый раз возвращаем курсор в правую колонку
-        pdf.cell(0, 5, f"- {spec}", 0, 1)
-
-    pdf.ln(3)
-
-    # Блок "Преимущества" (Маркетинг)
-    pdf.set_xy(95, pdf.get_y())
-    pdf.set_font("MyFont", 'B', 10)
-    pdf.cell(0, 6, "Почему выбирают эту модель:", 0, 1)
-
-    pdf.set_font("MyFont", '', 9)
-    for feat in product.get('features', []):
-        pdf.set_x(95)
-        # Используем multi_cell для длинных строк
-        pdf.multi_cell(100, 5, feat)
-
-    # Возвращаем курсор ниже самой длинной колонки (картинки или текста) + запас
-    pdf.set_y(y_start + 65)
+    # === 3. ПРЕЗЕНТАЦИЯ СЕПТИКА ===
+    draw_product_block(pdf, catalog.current().product(data.get('product_id')), with_media=product_block)
 
     # === 4. ДЕТАЛЬНАЯ СМЕТА (ТАБЛИЦА) ===
     pdf.set_font("MyFont", 'B', 12)
@@ -163,67 +106,12 @@ def generate_pdf(data, filename="smeta.pdf"):
     pdf.set_text_color(0, 0, 0)
     pdf.set_font("MyFont", '', 10)
 
-    # --- СБОРКА СТРОК СМЕТЫ ---
-    items = []
-
-    # 1. Товар
-    items.append({
-        "name": f"Станция очистки {product['name']}",
-        "desc": "Полная комплектация (корпус, крышки, ершовая загрузка).",
-        "price": product['price'],
-        "qty": 1,
-        "total": product['price']
-    })
-
-    # 2. Доставка
-    items.append({
-        "name": "Транспортные расходы",
-        "desc": "Доставка оборудования и монтажной бригады до объекта.",
-        "price": SERVICES['delivery_fix'],
-        "qty": 1,
-        "total": SERVICES['delivery_fix']
-    })
-
-    # 3. Монтаж (с красивым описанием)
-    items.append({
-        "name": "Монтаж станции (Стандарт)",
-        "desc": SERVICES.get('montage_description', 'Стандартный монтаж'),
-        "price": product['montage_price'],
-        "qty": 1,
-        "total": product['montage_price']
-    })
-
-    # 4. Труба (Умный расчет)
-    pipe_len = int(data.get('pipe_length', 5))
-    if data.get('soil') == 'clay':
-        soil_price = SERVICES['clay_price_per_meter']
-        soil_desc = "Грунт: Глина/Суглинок (до 1.6м). Копка, укладка, засыпка."
-    else:
-        soil_price = SERVICES['sand_price_per_meter']
-        soil_desc = "Грунт: Песок (до 1м). Копка, укладка, засыпка."
-
-    items.append({
-        "name": "Прокладка трубопровода ПВХ 110мм",
-        "desc": soil_desc,
-        "price": soil_price,
-        "qty": f"{pipe_len} м",
-        "total": pipe_len * soil_price
-    })
-
-    # 5. Бурение (Опционально)
-    if data.get('diamond_drilling'):
-        items.append({
-            "name": "Алмазное бурение фундамента",
-            "desc": "Прокол отверстия под 110 трубу (бетон до 40 см).",
-            "price": SERVICES['diamond_drilling'],
-            "qty": 1,
-            "total": SERVICES['diamond_drilling']
-        })
+    # --- СТРОКИ СМЕТЫ (общий расчет с pricing.py, как и в строгой смете) ---
+    if quote is None:
+        quote = quote_order(data)
 
     # --- ОТРИСОВКА СТРОК ТАБЛИЦЫ ---
-    total_sum = 0
-
-    for item in items:
+    for item in quote.lines:
         # Хитрость: Чтобы нарисовать "Имя" жирным, а "Описание" обычным в одной ячейке,
         # мы рисуем их по очереди, управляя курсором.
 
@@ -234,13 +122,13 @@ def generate_pdf(data, filename="smeta.pdf"):
         # 2. Рисуем Название (Жирным)
         pdf.set_font("MyFont", 'B', 10)
         # border="L R" (только бока), ln=2 (курсор вниз)
-        pdf.cell(110, 6, item['name'], "L R", 2)
+        pdf.cell(110, 6, item.name, "L R", 2)
 
         # 3. Рисуем Описание (Обычным, серым)
         pdf.set_font("MyFont", '', 8)
         pdf.set_text_color(100, 100, 100)
         # MultiCell сам перенесет строки если длинно
-        pdf.multi_cell(110, 4, item['desc'], "L R", 'L')
+        pdf.multi_cell(110, 4, item.desc, "L R", 'L')
 
         # 4. Рисуем нижнюю границу ячейки описания
         pdf.set_text_color(0, 0, 0)  # Черный обратно
@@ -255,9 +143,9 @@ def generate_pdf(data, filename="smeta.pdf"):
 
         # 7. Рисуем Цену, Кол-во, Сумму одной высокой ячейкой
         pdf.set_font("MyFont", '', 10)
-        pdf.cell(30, row_height, str(item['price']), 1, 0, 'R')
-        pdf.cell(20, row_height, str(item['qty']), 1, 0, 'C')
-        pdf.cell(30, row_height, str(item['total']), 1, 1, 'R')
+        pdf.cell(30, row_height, format_amount(item.price), 1, 0, 'R')
+        pdf.cell(20, row_height, f"{format_amount(item.qty)} {item.unit}", 1, 0, 'C')
+        pdf.cell(30, row_height, format_amount(item.total), 1, 1, 'R')
 
         # 8. Рисуем общую нижнюю линию для всей строки
         pdf.set_xy(x_start, y_end)
@@ -266,8 +154,6 @@ def generate_pdf(data, filename="smeta.pdf"):
         # 9. Сброс курсора на новую строку
         pdf.set_xy(x_start, y_end)
 
-        total_sum += float(item['total'])
-
     # === 5. ИТОГО И ВАЖНОЕ ===
     pdf.ln(5)
 
@@ -280,7 +166,7 @@ def generate_pdf(data, filename="smeta.pdf"):
 
     # Сумма (Красным)
     pdf.set_text_color(200, 0, 0)
-    pdf.cell(50, 12, f"{int(total_sum)} руб.", 0, 1, 'R', True)
+    pdf.cell(50, 12, f"{format_amount(quote.total)} руб.", 0, 1, 'R', True)
 
     pdf.ln(10)
 
@@ -299,6 +185,29 @@ def generate_pdf(data, filename="smeta.pdf"):
     # Рисуем рамку вокруг условий
     pdf.multi_cell(0, 5, notes, 1, 'L')
 
-    # Сохраняем файл
+    # Сохраняем файл (или отдаем байты, если имя не задано)
+    if filename is None:
+        return bytes(pdf.output())
+    pdf.output(filename)
+    return filename
+
+
+def generate_brochure(p_key, filename=None):
+    """Брошюра модели (картинка + характеристики + преимущества). Одна на модель, не зависит от заказа"""
+    product = catalog.current().product(p_key)
+    pdf = SepticPDF()
+    pdf.doc_title = 'Описание станции'
+
+    font_path = "assets/font.ttf"
+    if not os.path.exists(font_path):
+        print(f"ОШИБКА: Нет шрифта {font_path}")
+        return None
+    add_fonts(pdf, ('', 'B', 'I'), path=font_path)
+
+    pdf.add_page()
+    draw_product_block(pdf, product)
+
+    if filename is None:
+        return bytes(pdf.output())
     pdf.output(filename)
-    return filename
\ No newline at end of file
+    return filename
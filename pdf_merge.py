@@ -0,0 +1,68 @@
+# pdf_merge.py
+# Склейка сметы с инструкциями (assets/appendix.pdf) прямо в памяти.
+# appendix.pdf разбирается один раз на процесс и перечитывается,
+# только если файл на диске изменился (по mtime/размеру).
+import logging
+import os
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+
+from metrics import MERGE_SECONDS
+
+APPENDIX_PATH = "assets/appendix.pdf"
+
+# Кэш процесса: отпечаток файла (путь, mtime_ns, размер) и разобранный PdfReader
+_appendix = {"stamp": None, "reader": None}
+
+
+def get_appendix(path=APPENDIX_PATH):
+    """Разобранный appendix.pdf из кэша процесса (None, если файла нет)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    stamp = (path, st.st_mtime_ns, st.st_size)
+    if _appendix["stamp"] != stamp:
+        with open(path, "rb") as f:
+            reader = PdfReader(BytesIO(f.read()))
+        # Заранее разбираем дерево страниц, чтобы первая склейка не платила за это
+        len(reader.pages)
+        _appendix["reader"] = reader
+        _appendix["stamp"] = stamp
+        logging.info(f"Appendix: загружен {path} ({len(reader.pages)} стр.)")
+    return _appendix["reader"]
+
+
+def merge_with_appendix(pdf_bytes, path=APPENDIX_PATH):
+    """Свежая смета (bytes) + страницы инструкций -> bytes итогового PDF"""
+    appendix = get_appendix(path)
+    if appendix is None:
+        return pdf_bytes
+    with MERGE_SECONDS.time():
+        return _merge(pdf_bytes, appendix)
+
+
+def _merge(pdf_bytes, appendix):
+    merger = PdfWriter()
+    # Добавляем нашу свежую смету
+    for page in PdfReader(BytesIO(pdf_bytes)).pages:
+        merger.add_page(page)
+    # Добавляем инструкции из кэша
+    for page in appendix.pages:
+        merger.add_page(page)
+
+    out = BytesIO()
+    merger.write(out)
+    return out.getvalue()
+
+
+def warm_up(path=APPENDIX_PATH):
+    """Вызывается при старте воркера рендера: разбор + пробная склейка (прогрев объектов)"""
+    appendix = get_appendix(path)
+    if appendix is not None:
+        merger = PdfWriter()
+        for page in appendix.pages:
+            merger.add_page(page)
+        merger.write(BytesIO())
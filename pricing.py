@@ -0,0 +1,125 @@
+# pricing.py
+# Единый расчет стоимости заказа.
+# Заказ (dict от AI / WebApp) -> неизменяемый список позиций с точными суммами (Decimal).
+# И КП, и строгая смета только рисуют этот список, поэтому цены в двух документах всегда совпадают.
+import logging
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import NamedTuple
+
+import catalog
+
+
+class PricedLine(NamedTuple):
+    key: str  # Код позиции: ключ из прайса (catalog.json), "product:<id>" или "custom"
+    name: str  # Наименование (для таблиц обоих документов)
+    desc: str  # Пояснение мелким шрифтом (для КП)
+    unit: str
+    qty: Decimal
+    price: Decimal
+    total: Decimal
+
+
+class Quote(NamedTuple):
+    lines: tuple  # tuple[PricedLine, ...]
+    total: Decimal
+
+
+ONE = Decimal(1)
+
+
+# --- ХЕЛПЕРЫ ---
+
+def to_decimal(value, default=ONE):
+    """Число от AI/WebApp (int, float, "5", "5,5") -> Decimal. Мусор -> default"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, bool) or value is None:
+        return default
+    try:
+        result = Decimal(str(value).replace(',', '.').strip())
+    except (InvalidOperation, ValueError):
+        return default
+    return result if result.is_finite() else default
+
+
+def format_amount(value):
+    """Decimal для печати: 15250 -> '15250', 2.5 -> '2.5'"""
+    if value == value.to_integral_value():
+        return str(int(value))
+    return format(value.normalize(), 'f')
+
+
+def _line(key, name, unit, qty, price, desc=""):
+    return PricedLine(key, name, desc, unit, qty, price, qty * price)
+
+
+# Снимков каталога в памяти - единицы (горячая замена прайса), моделей - тоже
+@lru_cache(maxsize=64)
+def _product_lines(cat, p_key):
+    """Станция + монтаж зависят только от модели (в пределах версии каталога) - собираем один раз"""
+    product = cat.product(p_key)
+    montage = cat.services['montage_base']
+    montage_price = Decimal(str(product['montage_price'])) if 'montage_price' in product else montage.price
+    return (
+        _line(f"product:{p_key}", f"Станция очистки {product['name']}", "шт.", ONE,
+              cat.product_prices[p_key], cat.product_description),
+        _line("montage_base", montage.name, montage.unit, ONE, montage_price, montage.desc),
+    )
+
+
+def _service_line(cat, key, qty=ONE):
+    service = cat.services[key]
+    return _line(key, service.name, service.unit, qty, service.price, service.desc)
+
+
+# ================= ДВИЖОК =================
+
+def quote_order(data, cat=None):
+    """
+    Заказ -> Quote (позиции + итог). Единственное место, где считаются деньги.
+    cat - снимок каталога (по умолчанию действующий): весь расчет идет по одной версии прайса.
+    """
+    cat = cat or catalog.current()
+    p_key = data.get('product_id', cat.default_product)
+    if p_key not in cat.products:
+        p_key = cat.default_product
+    lines = list(_product_lines(cat, p_key))
+
+    # Трубопровод: тариф из прайса по грунту и глубине
+    pipe_len = to_decimal(data.get('pipe_length', 5), Decimal(5))
+    depth = float(to_decimal(data.get('pipe_depth', 1.0)))
+    lines.append(_service_line(cat, cat.pipe_key(data.get('soil', cat.default_soil), depth), pipe_len))
+
+    # Доставка
+    lines.append(_service_line(cat, 'delivery_fix'))
+
+    # Бурение фундамента (флаг от AI/WebApp)
+    if data.get('diamond_drilling'):
+        lines.append(_service_line(cat, 'diamond_drilling_40'))
+
+    # Доп. услуги: либо ключ из прайса (service_key), либо произвольная позиция (name + price)
+    items = data.get('custom_items') or []
+    if not isinstance(items, (list, tuple)):
+        logging.warning(f"Pricing: custom_items должен быть списком, пропускаю {items!r}")
+        items = []
+    for custom in items:
+        if not isinstance(custom, dict):
+            # Мусор от модели ("custom_items": ["кабель"]) - позицию пропускаем, заказ считаем
+            logging.warning(f"Pricing: доп. услуга должна быть объектом, пропускаю {custom!r}")
+            continue
+        qty = to_decimal(custom.get('qty', 1))
+        service_key = custom.get('service_key')
+        if isinstance(service_key, str) and service_key in cat.services:
+            lines.append(_service_line(cat, service_key, qty))
+        else:
+            lines.append(_line("custom", custom.get('name', 'Доп. услуга'), "шт.", qty,
+                               to_decimal(custom.get('price', 0), Decimal(0))))
+
+    return Quote(tuple(lines), sum((line.total for line in lines), Decimal(0)))
+
+
+def quote_many(orders):
+    """Пакетный расчет (выгрузки, массовые КП): список заказов -> список Quote (по одной версии прайса)"""
+    cat = catalog.current()
+    return [quote_order(data, cat) for data in orders]
@@ -0,0 +1,113 @@
+# prompts.py
+# Промпты для DeepSeek. Собираются ОДИН раз на версию каталога и дальше не меняются ни на байт:
+# провайдер кэширует совпадающее начало запроса (context caching), и повторные
+# запросы читают эту часть из кэша - быстрее первый токен и дешевле.
+# Порядок сообщений: общий системный промпт -> промпт режима -> переменная часть (всегда последней).
+# Список товаров и услуг для модели - из каталога (catalog.prompt_fragment), а не копия руками.
+import hashlib
+import json
+import textwrap
+from functools import lru_cache
+from typing import NamedTuple
+
+import catalog
+from order_patch import PATCH_HINT, encode_order
+
+# Версия промптов: меняешь смысл промпта -> подними версию
+PROMPT_VERSION = "v4"
+
+ORDER_FIELDS = """
+ПОЛЯ ЗАКАЗА:
+    "client_name": "Имя (или Заказчик)",
+    "address": "Адрес (или Не указан)",
+    "product_id": ключ из списка товаров (по умолч - отмеченный),
+    "soil": "sand" (по умолч) или "clay",
+    "pipe_length": int (метров, по умолч 5),
+    "diamond_drilling": bool (обычное бурение),
+
+    "custom_items": [
+        // Если фраза совпадает с услугой из списка выше -> пиши service_key и qty (кол-во)
+        { "service_key": "manual_sand_transport", "qty": 5 },
+        // Если услуги нет в списке -> пиши просто name и price (цену придумай адекватную или возьми из текста)
+        { "name": "Демонтаж старого туалета", "price": 3000, "qty": 1 }
+    ]
+"""
+
+# Общий для обоих режимов префикс (кэшируется провайдером для всех запросов)
+_BASE = """
+Ты - калькулятор смет септиков. Отвечай ТОЛЬКО JSON, без пояснений.
+{services}
+{fields}
+"""
+
+_NEW_ORDER = """
+РЕЖИМ: НОВЫЙ ЗАКАЗ.
+Часть заказа уже разобрана, тебе дают только то, что не удалось понять.
+Верни JSON ТОЛЬКО с перечисленными полями.
+"""
+
+_EDIT = """
+РЕЖИМ: ПРАВКА ЗАКАЗА.
+ПРАВИЛА ОБНОВЛЕНИЯ:
+1. ОТРИЦАНИЯ: Если написано "не нужно бурить" -> меняй d на false.
+2. ИЗМЕНЕНИЯ: Если меняют имя/адрес/метры -> set нужного поля.
+3. ДОБАВЛЕНИЯ: Добавляй услуги через add (используй ключи service_key, если подходит).
+   НЕ удаляй старые услуги, если не просили!
+{patch}
+"""
+
+
+def _clean(text):
+    return textwrap.dedent(text).strip()
+
+
+# ================= СБОРКА (один раз на версию каталога) =================
+
+class PromptSet(NamedTuple):
+    prompt_id: str  # Отпечаток текста промптов: ключ кэша ответов модели (llm_cache)
+    new_order: tuple  # Системные сообщения режима "новый заказ"
+    edit: tuple  # Системные сообщения режима "правка"
+
+
+@lru_cache(maxsize=8)
+def _build(cat):
+    system = _clean(_BASE.format(services=cat.prompt_fragment, fields=_clean(ORDER_FIELDS)))
+    new_order = _clean(_NEW_ORDER)
+    edit = _clean(_EDIT.format(patch=_clean(PATCH_HINT)))
+    # Правка текста без подъема версии (или новые цены/услуги в каталоге) тоже сбросит кэш ответов
+    prompt_id = PROMPT_VERSION + "-" + hashlib.sha256(
+        "\x00".join((system, new_order, edit)).encode("utf-8")
+    ).hexdigest()[:12]
+    return PromptSet(
+        prompt_id,
+        ({"role": "system", "content": system}, {"role": "system", "content": new_order}),
+        ({"role": "system", "content": system}, {"role": "system", "content": edit}),
+    )
+
+
+def current():
+    """Промпты для действующей версии каталога"""
+    return _build(catalog.current())
+
+
+def prompt_id():
+    return current().prompt_id
+
+
+# ================= СООБЩЕНИЯ =================
+
+def new_order_messages(local, text):
+    """Новый заказ: только нерешенные поля и непонятый кусок текста (order_parser.LocalParse)"""
+    known = {k: v for k, v in local.data.items() if k not in local.unresolved}
+    user_content = (
+        f"НУЖНЫ ПОЛЯ: {', '.join(local.unresolved)}\n"
+        f"УЖЕ ИЗВЕСТНО: {json.dumps(known, ensure_ascii=False)}\n"
+        f"НЕРАЗОБРАННАЯ ЧАСТЬ: {local.leftover or text}"
+    )
+    return [*current().new_order, {"role": "user", "content": user_content}]
+
+
+def edit_messages(current_data, text):
+    """Правка: текущий заказ в компактном виде + просьба пользователя"""
+    user_content = f"ТЕКУЩИЙ ЗАКАЗ:\n{encode_order(current_data)}\n\nПРАВКА ПОЛЬЗОВАТЕЛЯ:\n{text}"
+    return [*current().edit, {"role": "user", "content": user_content}]
@@ -0,0 +1,215 @@
+# renderer.py
+# Пул процессов для печати PDF (КП + Смета).
+# Каждый воркер один раз при старте подгружает библиотеки и ассеты,
+# а документы одного заказа рисуются параллельно на разных ядрах.
+# Бот получает awaitable-футуры и не блокирует event loop на время верстки.
+# По умолчанию документы не касаются диска: воркер возвращает готовые bytes PDF.
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import catalog
+import metrics
+import tracing
+from pricing import quote_order
+
+# Сколько процессов держим (по умолчанию - по числу ядер)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 2)))
+
+# Ассеты, которые воркер читает при старте (чтобы первая печать не ждала диск) + фото товаров из каталога
+WARM_ASSETS = [
+    "assets/font.ttf",
+    "assets/logo.png",
+    "assets/appendix.pdf",
+]
+
+_pool = None
+
+
+# ================= ВНУТРИ ВОРКЕРА =================
+
+def _init_worker():
+    """Выполняется один раз в каждом процессе пула"""
+    # Тяжелые импорты (fpdf, pypdf) - здесь, а не на каждую печать
+    import pdf_generator  # noqa: F401
+    import estimate_generator  # noqa: F401
+    import font_cache
+    import image_assets
+    import pdf_merge
+
+    # Замеры воркера (рендер, склейка, размер PDF) уходят в процесс бота вместе с результатом
+    metrics.forward_to_outbox()
+
+    # Каталог товаров (для блока товара в КП и брошюры)
+    cat = catalog.current()
+    # Метрики шрифта: из .cache/ (или один полный разбор TTF)
+    font_cache.warm_up()
+    # appendix.pdf разбираем один раз и держим в памяти
+    pdf_merge.warm_up()
+    # Логотип и фото станций: уменьшаем и сжимаем один раз
+    image_assets.warm_up()
+
+    for path in WARM_ASSETS + [p['image'] for p in cat.products.values()]:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.read()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _measured(doc, fn, *args):
+    """Рендер в воркере -> (результат, наблюдения метрик для процесса бота)"""
+    with metrics.RENDER_SECONDS.labels(doc=doc).time():
+        result = fn(*args)
+    if isinstance(result, (bytes, bytearray)):
+        metrics.PDF_BYTES.labels(doc=doc).observe(len(result))
+    return result, metrics.drain()
+
+
+# version - версия каталога в процессе бота: прайс поменяли на лету -> воркер перечитывает его до рендера
+
+def _render_kp(data, filename, quote, product_block=True, version=None, raw=None):
+    from pdf_generator import generate_pdf
+    if version:
+        catalog.ensure(version, raw)
+    return _measured("kp", generate_pdf, data, filename, quote, product_block)
+
+
+def _render_estimate(data, filename, quote, appendix=True, version=None, raw=None):
+    from estimate_generator import generate_strict_estimate
+    if version:
+        catalog.ensure(version, raw)
+    return _measured("smeta", generate_strict_estimate, data, filename, quote, appendix)
+
+
+def _render_brochure(p_key, version=None, raw=None):
+    from pdf_generator import generate_brochure
+    if version:
+        catalog.ensure(version, raw)
+    return _measured("brochure", generate_brochure, p_key)
+
+
+# ================= В ПРОЦЕССЕ БОТА =================
+
+def _mp_context():
+    # forkserver безопасен при запущенных потоках/event loop (в отличие от fork)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["pdf_generator", "estimate_generator"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=_mp_context(),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+async def start():
+    """Поднимаем все воркеры заранее, чтобы первая печать не платила за старт процессов"""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    pids = await asyncio.gather(*[loop.run_in_executor(pool, _ping) for _ in range(RENDER_WORKERS)])
+    logging.info(f"Renderer: прогрето {len(set(pids))} воркеров")
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _drop_pool(pool):
+    """Сломанный пул -> следующий get_pool() создаст новый (если его еще не пересоздал соседний рендер)"""
+    global _pool
+    if _pool is pool:
+        logging.warning("Renderer: пул сломан, пересоздаю")
+        _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn, *args):
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # Воркер упал (например, OOM) - при отправке задачи или прямо во время рендера:
+        # пересоздаем пул и пробуем еще раз (один раз - если задача сама роняет воркер, дальше ошибка)
+        _drop_pool(pool)
+        return await loop.run_in_executor(get_pool(), fn, *args)
+
+
+def _worker_seconds(observations, metric):
+    return sum(value for name, _, value in observations if name == metric.name)
+
+
+async def _run(doc, fn, *args):
+    with metrics.IN_FLIGHT.labels(stage="render").track_inprogress(), tracing.span("render", doc=doc) as sp:
+        started = time.perf_counter()
+        result, observations = await _submit(fn, *args)
+        # Что было внутри воркера (по его замерам): рендер, в конце - склейка. Остальное - очередь пула и IPC
+        done = time.perf_counter()
+        work = _worker_seconds(observations, metrics.RENDER_SECONDS)
+        merge = _worker_seconds(observations, metrics.MERGE_SECONDS)
+        parent = tracing.current_span_id()
+        tracing.add_span("worker", done - work, work, parent)
+        if merge:
+            tracing.add_span("merge", done - merge, merge, parent)
+        sp.set(queue_ms=round((done - started - work) * 1000, 1))
+    metrics.replay(observations)
+    return result
+
+
+async def _run_pinned(doc, fn, *args):
+    """Последний аргумент - версия каталога. В файле ее уже нет (прайс поправили еще раз) -> повтор со снимком"""
+    try:
+        return await _run(doc, fn, *args)
+    except catalog.CatalogVersionError as e:
+        cat = catalog.snapshot(args[-1])
+        if cat is None:
+            raise
+        logging.info(f"Renderer: {e}, передаю снимок {cat.version} в воркер")
+        return await _run(doc, fn, *args, cat.raw)
+
+
+def _start(doc, fn, *args):
+    # Задача стартует сразу (как и футура пула): документы заказа рисуются параллельно
+    return asyncio.ensure_future(_run_pinned(doc, fn, *args))
+
+
+def render_kp(data, filename=None, quote=None, product_block=True, version=None):
+    """Футура с КП (Коммерческое предложение): bytes PDF или имя файла, если оно задано"""
+    return _start("kp", _render_kp, data, filename, quote, product_block, version or catalog.current().version)
+
+
+def render_estimate(data, filename=None, quote=None, appendix=True, version=None):
+    """Футура со Сметой + Инструкциями: bytes PDF или имя файла, если оно задано"""
+    return _start("smeta", _render_estimate, data, filename, quote, appendix, version or catalog.current().version)
+
+
+def render_brochure(p_key):
+    """Футура с брошюрой модели (bytes PDF)"""
+    return _start("brochure", _render_brochure, p_key, catalog.current().version)
+
+
+def render_order(data):
+    """Оба документа заказа сразу, на разных ядрах. Возвращает (футура КП, футура Сметы) с bytes PDF"""
+    # Цены считаем один раз на заказ - оба документа рисуют один и тот же расчет
+    cat = catalog.current()
+    quote = quote_order(data, cat)
+    return (render_kp(data, quote=quote, version=cat.version),
+            render_estimate(data, quote=quote, version=cat.version))
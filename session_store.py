@@ -0,0 +1,245 @@
+# session_store.py
+# Хранилище черновиков заказов (вместо голого dict user_orders).
+# - Горячие сессии живут в памяти (OrderedDict): чтение в хендлере - обычный dict lookup.
+# - Вытеснение: LRU + TTL (черновик без правок дольше SESSION_TTL) + жесткий лимит памяти.
+# - Персистентность: SQLite-файл, запись пачками в фоне (write-behind), поэтому
+#   черновики переживают рестарт, а хендлеры не ждут диск.
+# - Чтение с диска: хендлеры зовут aget() - промах по памяти читает SQLite в отдельном потоке.
+#   Список uid на диске читается один раз при старте (тоже в потоке), поэтому новые
+#   пользователи (их нет ни в памяти, ни на диске) вообще не трогают SQLite.
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SESSIONS_DB = os.getenv("SESSIONS_DB", "sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))  # неделя без правок -> черновик забыт
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "5000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_FLUSH_INTERVAL = 2.0  # сек между фоновыми записями на диск
+
+_DELETED = object()
+
+
+class SessionStore:
+    def __init__(self, path=SESSIONS_DB, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES,
+                 max_bytes=SESSION_MAX_BYTES, flush_interval=SESSION_FLUSH_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+
+        # uid -> (data, json-строка, истекает_в)
+        self._hot = OrderedDict()
+        self._bytes = 0
+        # Грязные записи для фоновой записи: uid -> (json, истекает_в) или _DELETED
+        self._pending = {}
+        # Пачка, которая прямо сейчас пишется на диск
+        self._flushing = {}
+        # uid, у которых есть строка в SQLite (None - список еще не прочитан, диск спрашиваем всегда)
+        self._on_disk = None
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._flush_task = None
+
+    # ================= ПАМЯТЬ =================
+
+    def get(self, uid, default=None):
+        """Синхронное чтение (без await). Промах по памяти читает SQLite прямо в loop - в хендлерах aget()"""
+        entry = self._hot.get(uid)
+        if entry is None:
+            entry = self._from_memory(uid)
+            if entry is None and self._maybe_on_disk(uid):
+                entry = self._absorb(uid, self._select(uid))
+            if entry is None or entry is _DELETED:
+                return default
+        return self._touch(uid, entry, default)
+
+    async def aget(self, uid, default=None):
+        """Чтение для хендлеров: промах по памяти читает SQLite в отдельном потоке"""
+        entry = self._hot.get(uid)
+        if entry is None:
+            entry = self._from_memory(uid)
+            if entry is None and self._maybe_on_disk(uid):
+                row = await asyncio.to_thread(self._select, uid)
+                # Пока читали, черновик могли записать / удалить - память свежее диска
+                entry = self._hot.get(uid) or self._from_memory(uid) or self._absorb(uid, row)
+            if entry is None or entry is _DELETED:
+                return default
+        return self._touch(uid, entry, default)
+
+    def _touch(self, uid, entry, default):
+        if entry[2] < time.time():
+            self._delete(uid)
+            return default
+        self._hot.move_to_end(uid)
+        return entry[0]
+
+    def __getitem__(self, uid):
+        data = self.get(uid, _DELETED)
+        if data is _DELETED:
+            raise KeyError(uid)
+        return data
+
+    def __setitem__(self, uid, data):
+        raw = json.dumps(data, ensure_ascii=False)
+        expires = time.time() + self.ttl
+        self._drop_hot(uid)
+        self._put_hot(uid, (data, raw, expires))
+        self._pending[uid] = (raw, expires)
+        self._evict()
+
+    def __contains__(self, uid):
+        return self.get(uid, _DELETED) is not _DELETED
+
+    def __len__(self):
+        """Сколько черновиков в памяти (горячих). На диске их может быть больше"""
+        return len(self._hot)
+
+    def pop(self, uid, default=None):
+        """Удалить черновик. Возвращает его, только если он в памяти (ради возврата диск не читаем)"""
+        entry = self._hot.get(uid) or self._from_memory(uid)
+        self._delete(uid)
+        if entry is None or entry is _DELETED or entry[2] < time.time():
+            return default
+        return entry[0]
+
+    def _delete(self, uid):
+        self._drop_hot(uid)
+        self._pending[uid] = _DELETED
+
+    def _put_hot(self, uid, entry):
+        self._hot[uid] = entry
+        self._bytes += len(entry[1])
+
+    def _drop_hot(self, uid):
+        entry = self._hot.pop(uid, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+        return entry
+
+    def _evict(self):
+        """LRU: выкидываем самые давние сессии из памяти (на диске они остаются)"""
+        while self._hot and (len(self._hot) > self.max_entries or self._bytes > self.max_bytes):
+            uid, entry = self._hot.popitem(last=False)
+            self._bytes -= len(entry[1])
+
+    # ================= ДИСК =================
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (uid INTEGER PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _from_memory(self, uid):
+        """Вытесненная из памяти, но еще не записанная на диск правка - самая свежая"""
+        value = self._pending.get(uid, self._flushing.get(uid))
+        if value is None or value is _DELETED:
+            return value
+        entry = (json.loads(value[0]), value[0], value[1])
+        self._put_hot(uid, entry)
+        self._evict()
+        return entry
+
+    def _maybe_on_disk(self, uid):
+        return self._on_disk is None or uid in self._on_disk
+
+    def _select(self, uid):
+        """Промах по памяти (например, после рестарта) - строка из SQLite или None"""
+        try:
+            with self._db_lock:
+                return self._connect().execute(
+                    "SELECT data, expires_at FROM sessions WHERE uid = ?", (uid,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Sessions: ошибка чтения {uid}: {e}")
+            return None
+
+    def _absorb(self, uid, row):
+        """Строку с диска -> в память; нет строки -> запоминаем, что на диске uid нет"""
+        if row is None:
+            if self._on_disk is not None:
+                self._on_disk.discard(uid)
+            return None
+        entry = (json.loads(row[0]), row[0], row[1])
+        self._put_hot(uid, entry)
+        self._evict()
+        return entry
+
+    def _read_uids(self):
+        with self._db_lock:
+            rows = self._connect().execute(
+                "SELECT uid FROM sessions WHERE expires_at >= ?", (time.time(),)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def _write(self, batch):
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                for uid, value in batch.items():
+                    if value is _DELETED:
+                        db.execute("DELETE FROM sessions WHERE uid = ?", (uid,))
+                    else:
+                        db.execute("INSERT OR REPLACE INTO sessions (uid, data, expires_at) VALUES (?, ?, ?)",
+                                   (uid, value[0], value[1]))
+                db.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+
+    async def flush(self):
+        """Пишем накопившиеся изменения одной транзакцией (в отдельном потоке)"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._flushing = batch
+        try:
+            await asyncio.to_thread(self._write, batch)
+            if self._on_disk is not None:
+                for uid, value in batch.items():
+                    if value is _DELETED:
+                        self._on_disk.discard(uid)
+                    else:
+                        self._on_disk.add(uid)
+        except Exception as e:
+            logging.warning(f"Sessions: ошибка записи ({len(batch)} шт.): {e}")
+            # Не теряем изменения: вернем их в очередь, если их не перезаписали новее
+            for uid, value in batch.items():
+                self._pending.setdefault(uid, value)
+        finally:
+            self._flushing = {}
+
+    async def _flush_loop(self):
+        # Список uid на диске - до первой записи, чтобы фоновые flush() его не обгоняли
+        try:
+            self._on_disk = await asyncio.to_thread(self._read_uids)
+            logging.info(f"Sessions: на диске {len(self._on_disk)} черновиков")
+        except sqlite3.Error as e:
+            logging.warning(f"Sessions: не прочитали список черновиков, диск спрашиваем на каждый промах: {e}")
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Запуск фоновой записи (вызывать внутри работающего event loop)"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,144 @@
+# startup.py
+# Холодный старт бота: замеры этапов запуска и прогрев в фоне.
+#
+# Тяжелое (пул рендеров со шрифтами, картинками и appendix.pdf, клиент OpenAI с TLS-соединением)
+# не нужно, чтобы ответить на первое сообщение. STARTUP_WARMUP решает, когда это готовить:
+#   background (по умолчанию) - бот сразу принимает апдейты, прогрев идет фоновой задачей;
+#   blocking - как раньше: сначала прогрев, потом апдейты (первая печать без ожидания);
+#   off - ничего не греем, всё поднимается при первом использовании.
+#
+# Разбивка времени импорта по пакетам (отдельным процессом, через python -X importtime):
+#   python startup.py main --top 15
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import metrics
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+
+STARTUP_SECONDS = metrics.Gauge("septic_startup_seconds",
+                                "Этапы запуска: импорт, готовность к апдейтам, фоновый прогрев", ("stage",))
+
+_started = time.perf_counter()  # startup импортируется первым - это и есть начало загрузки
+_last = _started
+_stages = []  # [(этап, сек)]
+_warmup_task = None
+
+
+# ================= ЭТАПЫ ЗАПУСКА =================
+
+def mark(stage):
+    """Конец этапа запуска (время - от предыдущей отметки)"""
+    global _last
+    now = time.perf_counter()
+    _stages.append((stage, now - _last))
+    STARTUP_SECONDS.labels(stage=stage).set(round(now - _last, 3))
+    _last = now
+
+
+def since_start():
+    return time.perf_counter() - _started
+
+
+def ready(name, steps=()):
+    """
+    Бот принимает апдейты: пишем разбивку старта и запускаем прогрев (в режиме background).
+    steps - [(название, async-функция)], в режиме blocking их нужно было выполнить до ready().
+    """
+    global _warmup_task
+    mark("ready")
+    total = since_start()
+    STARTUP_SECONDS.labels(stage="total").set(round(total, 3))
+    breakdown = ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in _stages)
+    logging.info(f"Startup: {name} готов к апдейтам через {total:.2f} с ({breakdown})")
+    if STARTUP_WARMUP == "background" and steps and _warmup_task is None:
+        _warmup_task = asyncio.create_task(warm_up(steps))
+    return total
+
+
+async def warm_up(steps):
+    """Прогрев по шагам; ошибка шага не мешает остальным (всё догрузится при первом использовании)"""
+    started = time.perf_counter()
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            await step()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Startup: прогрев {name} не удался: {e}")
+            continue
+        seconds = time.perf_counter() - step_started
+        STARTUP_SECONDS.labels(stage=f"warmup_{name}").set(round(seconds, 3))
+        logging.info(f"Startup: прогрев {name} - {seconds:.2f} с")
+    seconds = time.perf_counter() - started
+    STARTUP_SECONDS.labels(stage="warmup").set(round(seconds, 3))
+    logging.info(f"Startup: прогрев завершен за {seconds:.2f} с")
+
+
+async def warm_up_blocking(steps):
+    """Режим blocking: прогрев до приема апдейтов"""
+    if STARTUP_WARMUP == "blocking":
+        await warm_up(steps)
+        mark("warmup")
+
+
+async def stop():
+    """Прогрев еще идет, а бот останавливается - отменяем"""
+    global _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        await asyncio.gather(_warmup_task, return_exceptions=True)
+        _warmup_task = None
+
+
+# ================= РАЗБИВКА ИМПОРТА =================
+
+def import_times(module):
+    """python -X importtime в отдельном процессе -> [(модуль, свое время мкс, с вложенными мкс)]"""
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_TOKEN", "0:import-report")  # aiogram проверяет формат токена при создании Bot
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def print_import_report(module, top=20):
+    rows = import_times(module)
+    by_package = Counter()
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    total = sum(by_package.values())
+    print(f"Импорт {module}: {total / 1e6:.2f} с, модулей: {len(rows)}")
+    print(f"{'пакет':<28}{'мс':>10}{'доля':>8}")
+    for package, us in by_package.most_common(top):
+        print(f"{package:<28}{us / 1000:>10.1f}{us / total:>8.1%}")
+    rest = total - sum(us for _, us in by_package.most_common(top))
+    if rest:
+        print(f"{'(остальные)':<28}{rest / 1000:>10.1f}{rest / total:>8.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разбивка времени импорта модуля бота по пакетам")
+    parser.add_argument("module", nargs="?", default="main", help="main / webapp / batch ...")
+    parser.add_argument("--top", type=int, default=20, help="Сколько пакетов показать")
+    args = parser.parse_args(argv)
+    print_import_report(args.module, args.top)
+
+
+if __name__ == "__main__":
+    main()
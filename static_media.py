@@ -0,0 +1,147 @@
+# static_media.py
+# Статичные вложения: инструкции (assets/appendix.pdf) и брошюра модели (картинка + характеристики).
+# В режиме SEPARATE_STATIC=1 они не вклеиваются в каждый документ, а уходят отдельными файлами:
+# загружаются в Telegram один раз, дальше отправляются по сохраненному file_id.
+# Каждый заказ тогда грузит только маленькие КП и смету.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import NamedTuple
+
+import catalog
+import pdf_cache
+import renderer
+
+# Отправлять инструкции и брошюру отдельными файлами (0 - по-старому, всё внутри документов)
+SEPARATE_STATIC = os.getenv("SEPARATE_STATIC", "0") == "1"
+
+APPENDIX_PATH = "assets/appendix.pdf"
+STATIC_MEDIA_STORE = os.path.join(os.getenv("SEPTIC_CACHE_DIR", ".cache"), "static_media.json")
+
+# Поменял верстку брошюры -> подними версию (файлы пересоберутся и загрузятся заново)
+BROCHURE_VERSION = "1"
+
+
+class StaticItem(NamedTuple):
+    key: str  # Отпечаток содержимого: поменялся файл/товар -> новый ключ, новая загрузка
+    kind: str  # "appendix" / "brochure"
+    filename: str
+    caption: str
+    source: str  # путь к файлу (appendix) или id товара (brochure)
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:24]
+
+
+def appendix_item():
+    stamp = _file_stamp(APPENDIX_PATH)
+    if stamp is None:
+        return None
+    return StaticItem("appendix:" + _digest(stamp), "appendix", "Инструкции.pdf",
+                      "📎 Инструкции по эксплуатации", APPENDIX_PATH)
+
+
+def brochure_item(p_key):
+    product = catalog.current().products.get(p_key)
+    if product is None:
+        return None
+    raw = json.dumps(product, ensure_ascii=False, sort_keys=True)
+    # Брошюру рисует тот же код, что и КП (шрифт, шаблоны блоков, картинки) + фото станции
+    files = pdf_cache.TEMPLATE_FILES["kp"] + (product.get('image', ''),)
+    key = _digest(BROCHURE_VERSION, raw, pdf_cache._template_stamp(files, catalog.current().version))
+    return StaticItem(f"brochure:{p_key}:{key}", "brochure", f"{product['name']}.pdf",
+                      f"📘 {product['name']}: характеристики", p_key)
+
+
+def items_for(data):
+    """Статичные вложения к заказу: брошюра выбранной модели + инструкции"""
+    items = [brochure_item(data.get('product_id', catalog.current().default_product)), appendix_item()]
+    return [item for item in items if item is not None]
+
+
+async def load_bytes(item):
+    """Содержимое для первой загрузки (потом - только file_id)"""
+    if item.kind == "appendix":
+        return await asyncio.to_thread(_read, item.source)
+    return await renderer.render_brochure(item.source)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ================= FILE_ID =================
+
+class FileIdStore:
+    """
+    key -> file_id Telegram, JSON-файл на диске (записей единицы - хватает простого файла).
+    Чтение и запись файла - в отдельном потоке, как file_ids.json в pdf_cache
+    """
+
+    def __init__(self, path=STATIC_MEDIA_STORE):
+        self.path = path
+        self._ids = None
+        self._lock = asyncio.Lock()  # файл пишет один поток за раз
+
+    async def _load(self):
+        if self._ids is None:
+            ids = await asyncio.to_thread(self._read)
+            if self._ids is None:
+                self._ids = ids
+        return self._ids
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    async def get(self, key):
+        return (await self._load()).get(key)
+
+    async def set_many(self, pairs):
+        ids = await self._load()
+        changed = False
+        for key, file_id in pairs:
+            if file_id and ids.get(key) != file_id:
+                ids[key] = file_id
+                changed = True
+        if changed:
+            await self._save()
+
+    async def forget(self, keys):
+        ids = await self._load()
+        removed = [ids.pop(key, None) for key in keys]
+        if any(file_id is not None for file_id in removed):
+            await self._save()
+
+    async def _save(self):
+        text = json.dumps(self._ids, ensure_ascii=False, indent=1)
+        async with self._lock:
+            await asyncio.to_thread(self._write, text)
+
+    def _write(self, text):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Static media: ошибка записи file_id: {e}")
+
+
+file_ids = FileIdStore()
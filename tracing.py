@@ -0,0 +1,409 @@
+# tracing.py
+# Трассировка апдейтов: у каждого апдейта (handle_text, handle_buttons, handle_web_app_data)
+# свой trace_id и список замеренных этапов (span): parse, llm, pricing, render, merge, send.
+# Текущая трасса живет в contextvars, поэтому видна во всех await и задачах, созданных из хендлера
+# (coalescer, рендер). Готовая трасса - одна строка JSON в TRACE_FILE.
+# Диск - в отдельном потоке (_writer): event loop только кладет готовую строку в очередь,
+# поток пишет накопившееся пачкой. При остановке - shutdown(), чтобы дописать хвост.
+#
+# PROFILE_SLOW=10 - профилировщик: фоновый поток раз в PROFILE_INTERVAL снимает стек event loop
+# и относит его к трассе текущей задачи. Апдейт дольше PROFILE_SLOW сек -> отчет в PROFILE_DIR
+# (folded stacks: flamegraph.pl / speedscope). По умолчанию выключен - поток даже не запускается.
+#
+#   cat .cache/traces.jsonl | jq 'select(.duration_ms > 30000)'
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+_CACHE_DIR = os.getenv("SEPTIC_CACHE_DIR", ".cache")
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(_CACHE_DIR, "traces.jsonl"))
+# Файл больше лимита -> переименовываем в .1 (храним один старый)
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Порог (сек) для отчета профилировщика; 0 - профилировщик выключен
+PROFILE_SLOW = float(os.getenv("PROFILE_SLOW", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(_CACHE_DIR, "profiles"))
+PROFILE_MAX_DEPTH = 64
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("span_parent", default=None)
+# Задача -> трасса (для профилировщика: он видит задачу event loop, а не contextvars)
+_task_traces = weakref.WeakKeyDictionary()
+_profiler = None
+_writer = None
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "parent", "attrs", "error")
+
+    def __init__(self, name, start, parent, attrs):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.parent = parent
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    """Вне трассы (фоновые задачи, batch.py, бенчмарки) span ничего не стоит"""
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.status = "ok"
+
+    def to_dict(self, duration):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "duration_ms": round(duration * 1000, 1),
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": [
+                {"id": n, "name": s.name, "parent": s.parent,
+                 "start_ms": round((s.start - self.started) * 1000, 1),
+                 "duration_ms": round(s.duration * 1000, 1) if s.duration is not None else None,
+                 **({"attrs": s.attrs} if s.attrs else {}),
+                 **({"error": s.error} if s.error else {})}
+                for n, s in enumerate(self.spans)
+            ],
+        }
+
+
+# ================= API =================
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def set_attrs(**attrs):
+    """Атрибуты всей трассы (пользователь, путь разбора, superseded ...)"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def _register_task(trace):
+    """Задача -> трасса для профилировщика (дочерние задачи спанов: только если задача еще ничья)"""
+    task = asyncio.current_task() if _in_loop() else None
+    if task is not None and task not in _task_traces:
+        _task_traces[task] = trace
+
+
+def _bind_task(trace):
+    """
+    Задача хендлера -> его трасса, всегда перезаписываем: воркеры очереди вебхука (webhook.UpdateQueue)
+    обрабатывают одной задачей много апдейтов подряд. -> (задача, прежняя трасса) для _unbind_task
+    """
+    task = asyncio.current_task() if _in_loop() else None
+    if task is None:
+        return None, None
+    previous = _task_traces.get(task)
+    _task_traces[task] = trace
+    return task, previous
+
+
+def _unbind_task(task, previous):
+    if task is None:
+        return
+    if previous is None:
+        _task_traces.pop(task, None)
+    else:
+        _task_traces[task] = previous
+
+
+def _in_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@contextmanager
+def span(name, **attrs):
+    """with span("llm", mode="new") as s: ... ; s.set(tokens=...)"""
+    trace = _trace.get()
+    if trace is None:
+        yield _NOOP
+        return
+    s = Span(name, time.perf_counter(), _parent.get(), attrs)
+    trace.spans.append(s)
+    _register_task(trace)
+    token = _parent.set(len(trace.spans) - 1)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - s.start
+        _parent.reset(token)
+
+
+def add_span(name, start, duration, parent=None, **attrs):
+    """Готовый замер (например, время внутри воркера пула): start - time.perf_counter() процесса бота"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    s = Span(name, start, parent, attrs)
+    s.duration = duration
+    trace.spans.append(s)
+
+
+def current_span_id():
+    return _parent.get()
+
+
+def traced(name):
+    """
+    Декоратор хендлера aiogram: апдейт -> трасса.
+    aiogram передает хендлеру только те аргументы, что есть в его сигнатуре - фильтруем так же.
+    """
+    def decorator(handler):
+        if not TRACE_ENABLED:
+            return handler
+        spec = inspect.getfullargspec(handler)
+        accepted = None if spec.varkw else set(spec.args[1:]) | set(spec.kwonlyargs)
+
+        @functools.wraps(handler)
+        async def wrapper(event, *args, **kwargs):
+            if accepted is not None:
+                kwargs = {k: v for k, v in kwargs.items() if k in accepted}
+            user = getattr(getattr(event, "from_user", None), "id", None)
+            trace = Trace(name, {"user": user})
+            token = _trace.set(trace)
+            task, previous = _bind_task(trace)
+            if _profiler is not None:
+                _profiler.begin(trace)
+            try:
+                return await handler(event, *args, **kwargs)
+            except asyncio.CancelledError:
+                trace.status = "cancelled"
+                raise
+            except BaseException:
+                trace.status = "error"
+                raise
+            finally:
+                _trace.reset(token)
+                _unbind_task(task, previous)
+                _finish(trace)
+
+        return wrapper
+
+    return decorator
+
+
+# ================= ЗАПИСЬ =================
+
+def _finish(trace):
+    duration = time.perf_counter() - trace.started
+    record = trace.to_dict(duration)
+    if _profiler is not None:
+        report = _profiler.end(trace, duration)
+        if report is not None:
+            record["profile"] = report
+    _write(record)
+
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    _get_writer().put((TRACE_FILE, line))
+
+
+class TraceWriter:
+    """Фоновый поток записи: строки трасс (и отчеты профилировщика) из очереди -> в файлы пачками"""
+
+    def __init__(self, path=TRACE_FILE, max_bytes=TRACE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        """item: (путь, текст) - дописать в конец файла"""
+        self._queue.put(item)
+
+    def close(self, timeout=5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        except OSError as e:
+            logging.warning(f"Tracing: нет папки для трасс: {e}")
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            by_file = {}
+            for item in batch:
+                if item is not None:
+                    by_file.setdefault(item[0], []).append(item[1])
+            for path, chunks in by_file.items():
+                self._append(path, chunks)
+            if stop:
+                return
+
+    def _append(self, path, chunks):
+        try:
+            if path == self.path:
+                try:
+                    if os.path.getsize(path) > self.max_bytes:
+                        os.replace(path, path + ".1")
+                except OSError:
+                    pass
+            else:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(chunks))
+        except OSError as e:
+            logging.warning(f"Tracing: не удалось записать {path}: {e}")
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = TraceWriter()
+    return _writer
+
+
+def shutdown():
+    """Дописать очередь трасс на диск (при остановке бота / webapp)"""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+# ================= ПРОФИЛИРОВЩИК =================
+
+class SlowRequestProfiler:
+    """Сэмплирующий профилировщик event loop с раскладкой стеков по трассам"""
+
+    def __init__(self, threshold=PROFILE_SLOW, interval=PROFILE_INTERVAL, out_dir=PROFILE_DIR):
+        self.threshold = threshold
+        self.interval = interval
+        self.out_dir = out_dir
+        self._samples = {}  # trace_id -> Counter("файл:функция;...": число сэмплов)
+        self._loop = None
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Вызывать из потока event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+        logging.info(f"Tracing: профилировщик включен (порог {self.threshold} с, шаг {self.interval * 1000:.0f} мс)")
+
+    def stop(self):
+        self._stop.set()
+
+    def begin(self, trace):
+        self._samples[trace.trace_id] = Counter()
+
+    def end(self, trace, duration):
+        samples = self._samples.pop(trace.trace_id, None)
+        if not samples or duration < self.threshold:
+            return None
+        return self._report(trace, samples)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self._samples:
+                continue
+            # Чья задача сейчас выполняется в event loop - тому и сэмпл
+            task = asyncio.current_task(self._loop)
+            trace = _task_traces.get(task) if task is not None else None
+            if trace is None:
+                continue
+            counter = self._samples.get(trace.trace_id)
+            frame = sys._current_frames().get(self._thread_id)
+            if counter is None or frame is None:
+                continue
+            counter[_fold(frame)] += 1
+
+    def _report(self, trace, samples):
+        total = sum(samples.values())
+        path = os.path.join(self.out_dir, f"{datetime.now():%Y%m%d-%H%M%S}_{trace.name}_{trace.trace_id}.folded")
+        # Файл пишет поток трасс (имя уникально по trace_id, дописывание = запись с нуля)
+        _get_writer().put((path, "".join(f"{stack} {count}\n" for stack, count in samples.most_common())))
+        # Самые тяжелые функции (по последнему кадру стека) - сразу в трассу
+        leaf = Counter()
+        for stack, count in samples.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "file": path,
+            "samples": total,
+            "cpu_ms": round(total * self.interval * 1000, 1),
+            "top": [{"frame": frame, "share": round(count / total, 3)} for frame, count in leaf.most_common(10)],
+        }
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def start_profiler():
+    """При старте бота / webapp (внутри event loop). PROFILE_SLOW=0 -> ничего не делаем"""
+    global _profiler
+    if PROFILE_SLOW <= 0 or not TRACE_ENABLED or _profiler is not None:
+        return None
+    _profiler = SlowRequestProfiler()
+    _profiler.start()
+    return _profiler
+
+
+def stop_profiler():
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
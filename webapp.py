@@ -1,20 +1,27 @@
 # webapp.py
+# Замеры холодного старта (импортируется первым, чтобы видеть всю загрузку)
+import startup
+
 import asyncio
-import uvicorn
 import json
-import os
 import logging
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import CommandStart
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, FSInputFile, InputMediaDocument
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
 
 # Импортируем наши настройки и генераторы
 from config import TELEGRAM_TOKEN
-from pdf_generator import generate_pdf as generate_kp
-from estimate_generator import generate_strict_estimate
+import renderer  # Пул процессов для печати PDF
+import catalog  # Товары и прайс (assets/catalog.json, горячая замена)
+import webhook  # Прием апдейтов вебхуком (BOT_MODE=webhook)
+from documents import send_order_documents  # Печать + отправка (с кэшем PDF и file_id)
+import metrics  # Prometheus: /metrics
+import tracing  # Трассы апдейтов + профилировщик медленных запросов
+
+startup.mark("modules")
 
 # Настройка логов
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +39,15 @@ templates = Jinja2Templates(directory="templates")
 bot = Bot(token=TELEGRAM_TOKEN)
 dp = Dispatcher()
 
+# 3. Вебхук: Telegram шлет апдейты прямо в FastAPI (вместо поллинга)
+update_queue = webhook.UpdateQueue(dp, bot)
+if webhook.BOT_MODE == "webhook":
+    webhook.add_webhook_route(app, update_queue)
+
+# 4. Метрики для Prometheus: только этого процесса (печать из WebApp, рендер, загрузка).
+#    LLM и разбор сообщений живут в main.py - у него свой /metrics (METRICS_PORT или порт вебхука)
+metrics.add_metrics_route(app)
+
 
 # ================= ЧАСТЬ 1: ВЕБ-САЙТ (Для браузера Телеграма) =================
 @app.get("/", response_class=HTMLResponse)
@@ -40,7 +56,8 @@ async def read_root(request: Request):
     Когда Телеграм открывает приложение, он стучится сюда.
     Мы отдаем ему файл templates/index.html
     """
-    return templates.TemplateResponse("index.html", {"request": request})
+    # Список моделей - из каталога: новая модель в catalog.json сразу появляется в форме
+    return templates.TemplateResponse(request, "index.html", {"products": catalog.current().products})
 
 
 # ================= ЧАСТЬ 2: БОТ (Для чата) =================
@@ -63,6 +80,7 @@ async def start(message: types.Message):
 
 
 @dp.message(F.web_app_data)
+@tracing.traced("web_app_data")
 async def handle_web_app_data(message: types.Message):
     """
     Сюда прилетают данные, когда папа нажимает "СФОРМИРОВАТЬ СМЕТУ" на сайте.
@@ -75,24 +93,12 @@ async def handle_web_app_data(message: types.Message):
 
     # 2. Генерируем файлы (используем твои готовые скрипты!)
     try:
-        # КП
-        kp_name = f"КП_{data.get('client_name')}.pdf"
-        generate_kp(data, kp_name)
-
-        # Смета
-        smeta_name = f"Смета_{data.get('client_name')}.pdf"
-        generate_strict_estimate(data, smeta_name)
-
-        # 3. Отправляем
-        media = [
-            InputMediaDocument(media=FSInputFile(kp_name), caption="✅ Коммерческое предложение"),
-            InputMediaDocument(media=FSInputFile(smeta_name), caption="✅ Смета + Договор")
-        ]
-        await message.answer_media_group(media)
-
-        # 4. Чистим мусор
-        if os.path.exists(kp_name): os.remove(kp_name)
-        if os.path.exists(smeta_name): os.remove(smeta_name)
+        # КП и Смета - из кэша или параллельно в пуле процессов, сразу в память
+        # 3. Отправляем прямо из буфера (на диск ничего не пишем) или по file_id прошлой отправки
+        await send_order_documents(message, data, {
+            "kp": "✅ Коммерческое предложение",
+            "smeta": "✅ Смета + Договор",
+        })
 
     except Exception as e:
         await message.answer(f"❌ Ошибка генерации: {e}")
@@ -107,13 +113,39 @@ async def start_bot():
     await dp.start_polling(bot)
 
 
+# Прогрев пула рендеров: шрифты, картинки, appendix.pdf (по умолчанию - в фоне, см. startup.py)
+WARMUP_STEPS = [
+    ("renderer", renderer.start),
+]
+
+
 @app.on_event("startup")
 async def on_startup():
     # Запускаем бота в фоновом режиме, когда стартует сервер
-    asyncio.create_task(start_bot())
+    await startup.warm_up_blocking(WARMUP_STEPS)
+    catalog.start_watcher()
+    tracing.start_profiler()
+    if webhook.BOT_MODE == "webhook":
+        update_queue.start()
+        await webhook.set_webhook(bot, dp)
+    else:
+        asyncio.create_task(start_bot())
+    startup.ready("webapp", WARMUP_STEPS)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await startup.stop()
+    await catalog.stop_watcher()
+    await update_queue.stop()
+    tracing.stop_profiler()
+    tracing.shutdown()
+    renderer.shutdown()
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     # Запускаем сервер на порту 8000
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
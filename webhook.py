@@ -0,0 +1,111 @@
+# webhook.py
+# Прием апдейтов Telegram вебхуком (вместо long polling).
+# Telegram сам присылает апдейт POST-запросом (через Caddy) - без задержки опроса и без висящего соединения.
+# - Проверка секрета: заголовок X-Telegram-Bot-Api-Secret-Token должен совпасть с WEBHOOK_SECRET.
+# - Ограниченная очередь + пул воркеров: HTTP-ответ Telegram'у уходит сразу, хендлеры (LLM, PDF)
+#   работают в фоне. Очередь переполнена -> 503, Telegram повторит доставку позже.
+import asyncio
+import hmac
+import logging
+import os
+import secrets
+
+from aiogram.types import Update
+
+# Режим приема апдейтов: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Публичный адрес, на который Telegram шлет апдейты (Caddy проксирует на наш FastAPI)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "https://septic-russia.ru")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg/webhook")
+# Если не задан - генерируем при старте (set_webhook всё равно вызывается на каждом запуске).
+# Для нескольких процессов uvicorn секрет надо задать явно, иначе у каждого будет свой
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """Ограниченная очередь апдейтов + воркеры, которые скармливают их диспетчеру"""
+
+    def __init__(self, dp, bot, maxsize=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+
+    def put(self, update):
+        """False - очередь полна (апдейт не принят)"""
+        try:
+            self._queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self):
+        """Запуск воркеров (внутри работающего event loop)"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10.0):
+        """Дорабатываем уже принятые апдейты (не дольше timeout) и гасим воркеров"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Webhook: при остановке не обработано {self._queue.qsize()} апдейтов")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logging.exception(f"Webhook: ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def add_webhook_route(app, queue, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    """Эндпоинт для Telegram в FastAPI-приложении"""
+    # FastAPI нужен только в режиме вебхука - поллингу незачем его грузить
+    from fastapi import Request, Response
+
+    @app.post(path, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return Response(status_code=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": queue.bot})
+        except ValueError as e:
+            logging.warning(f"Webhook: кривой апдейт: {e}")
+            return Response(status_code=400)
+        if not queue.put(update):
+            logging.warning("Webhook: очередь переполнена, Telegram повторит доставку")
+            return Response(status_code=503)
+        return Response(status_code=200)
+
+    return telegram_webhook
+
+
+async def set_webhook(bot, dp, base_url=WEBHOOK_BASE_URL, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    """Регистрируем вебхук в Telegram (накопившиеся апдейты не выкидываем)"""
+    await bot.set_webhook(
+        url=base_url.rstrip("/") + path,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=100,
+    )
+    logging.info(f"Webhook: {base_url.rstrip('/') + path}")